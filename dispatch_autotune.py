@@ -0,0 +1,17 @@
+import argparse
+import json
+
+from src.dispatch import autotune, calibration_file
+
+# Times the NumPy, serial numba and parallel numba kernels of the panel methods on this machine and writes the
+# calibration table used to choose between them (see src/dispatch.py). Run it once, and again after changing
+# NUMBA_NUM_THREADS or the hardware.
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=None, help=f"The calibration file (default {calibration_file()})")
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    calibration = autotune(args.output, repeats=args.repeats)
+    print(f"Wrote {args.output or calibration_file()}")
+    print(json.dumps(calibration['kernels'], indent=2))
@@ -0,0 +1,43 @@
+import argparse
+import functools
+
+import numba as nb
+import numpy as np
+
+from src.dispatch import best_time, circle
+from src.geometric_integrals import assemble_panel_geometric_integrals
+
+# Times the assembly of the source vortex panel influence matrices I, J, K and L on a circle for a range of panel
+# counts and thread counts, and checks that every thread count reproduces the serial matrices bit for bit.
+# Set NUMBA_NUM_THREADS to the number of cores to benchmark before running, e.g.
+#   NUMBA_NUM_THREADS=64 python panel_assembly_benchmark.py --threads 1 8 64
+
+
+def time_assembly(panel_geometry, threads: int, repeats: int):
+    return best_time(functools.partial(assemble_panel_geometric_integrals, panel_geometry, threads=threads), repeats)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--panels', type=int, nargs='+', default=[100, 300, 1000, 3000, 10000])
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, 2, 4, nb.config.NUMBA_NUM_THREADS}))
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    threads = [count for count in args.threads if count <= nb.config.NUMBA_NUM_THREADS]
+
+    # Compile both kernels before timing
+    for count in sorted(set(threads) | {1}):
+        assemble_panel_geometric_integrals(circle(8), threads=count)
+
+    print(f"{'panels':>8}" + ''.join(f"{f'{count} thr [s]':>14}" for count in threads) + f"{'speedup':>10}")
+    for num_panels in args.panels:
+        panel_geometry = circle(num_panels)
+        serial_time, serial = time_assembly(panel_geometry, 1, args.repeats)
+        row = []
+        for count in threads:
+            elapsed, result = (serial_time, serial) if count == 1 else time_assembly(panel_geometry, count,
+                                                                                     args.repeats)
+            assert all(np.array_equal(a, b) for a, b in zip(serial, result)), f"{count} threads differ from serial"
+            row.append(elapsed)
+        print(f"{num_panels:>8}" + ''.join(f"{elapsed:>14.4f}" for elapsed in row)
+              + f"{serial_time / min(row):>10.2f}")
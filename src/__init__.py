@@ -1,13 +1,29 @@
 from .circulation import *
 from .elementary_flows import *
 from .flow_field import *
+from .backends import *
+from .flow_batch import *
+from .multipole import *
+from .incremental import *
+from .basis import *
+from .vortex_dynamics import *
+from .streamlines import *
+from .stagnation import *
+from .adaptive import *
+from .blasius import *
 from .plotting import *
 from .data_collections import *
 from .airfoil_generator import *
 from .panel_generator import *
 from .geometric_integrals import *
+from .panel_treecode import *
+from .grid_operator import *
+from .grid_velocity import *
+from .dispatch import *
 from .source_panel_methods_funcs import *
 from .vortex_panel_methods_funcs import *
 
-__all__ = ['circulation', 'elementary_flows', 'flow_field', 'plotting', 'data_collections', 'airfoil_generator',
-           'panel_generator', 'geometric_integrals', 'source_panel_methods_funcs', 'vortex_panel_methods_funcs']
+__all__ = ['circulation', 'elementary_flows', 'flow_field', 'backends', 'flow_batch', 'multipole', 'incremental',
+           'basis', 'vortex_dynamics', 'streamlines', 'stagnation', 'adaptive', 'blasius', 'plotting',
+           'data_collections', 'airfoil_generator', 'panel_generator', 'geometric_integrals', 'panel_treecode',
+           'grid_operator', 'grid_velocity', 'dispatch', 'source_panel_methods_funcs', 'vortex_panel_methods_funcs']
@@ -0,0 +1,185 @@
+import typing as tp
+
+import numpy as np
+
+from . import elementary_flows as ef
+from . import flow_field as ff
+
+# Corners of a cell in lattice steps, in the order (x0, y0), (x1, y0), (x0, y1), (x1, y1).
+CORNER_OFFSETS = np.array([[0, 0], [1, 0], [0, 1], [1, 1]])
+
+# Midpoints of the edges and the centre of a cell in half lattice steps, and the corners whose mean is the bilinear
+# interpolation at each of them. These are the corners of the children of the cell.
+MIDPOINT_OFFSETS = np.array([[1, 0], [0, 1], [2, 1], [1, 2], [1, 1]])
+MIDPOINT_CORNERS = [[0, 1], [0, 2], [1, 3], [2, 3], [0, 1, 2, 3]]
+
+
+class QuadtreeField:
+    '''
+    A quantity of a flow field evaluated on an adaptive quadtree over the area spanned by x and y.
+
+    The area is split into a coarse base grid of cells and each cell is evaluated at its corners, edge midpoints and
+    centre, which are the corners of its children. A cell is split into four while any of these points differs from
+    the bilinear interpolation of the corners by more than the tolerance times the largest value on the base grid,
+    while any of them is inside the mask tolerance of a singularity, or while a singularity lies within one cell
+    diagonal of its centre, down to max_level. The smooth far field stays coarse and the points are spent where the
+    field varies. The points are evaluated with FlowField.evaluate_points and every point shared by several cells is
+    evaluated once.
+
+    Attributes
+    ----------
+
+    bounds : tuple
+    The area covered by the tree, (x_min, x_max, y_min, y_max).
+
+    quantity : str
+    The quantity evaluated ("velocity", "stream_function", "velocity_potential" or "flow_state").
+
+    points : np.ndarray
+    The (N, 2) points at which the quantity was evaluated.
+
+    values : np.ndarray
+    The quantity at the points, of shape (number of outputs, N). Points inside the mask tolerance of a singularity
+    are NaN.
+
+    levels, i, j : np.ndarray
+    The level and the column and row index at that level of every leaf cell.
+
+    corners : np.ndarray
+    The (number of leaves, 4) indices of the points at the corners of every leaf cell.
+
+    Methods
+    -------
+
+    cells()
+    Returns the (x_min, y_min, width, height) of every leaf cell.
+
+    resample(x, y)
+    Interpolates the quantity onto the uniform grid spanned by x and y.
+
+    '''
+
+    def __init__(self, flow_field: ff.FlowField, x: np.ndarray, y: np.ndarray, quantity: str = 'velocity',
+                 tolerance: float = 1e-3, base_resolution: int = 16, max_level: int = 6):
+        ff.check_quantity(quantity)
+        self.quantity = quantity
+        self.bounds = (float(np.min(x)), float(np.max(x)), float(np.min(y)), float(np.max(y)))
+        self.base_resolution = base_resolution
+        self.max_level = max_level
+        self.number_of_outputs = ff.QUANTITY_OUTPUTS[quantity]
+        self.flow_field = flow_field
+
+        # Points live on a lattice twice as fine as the finest cells, so that their centres are lattice points too
+        self.lattice_size = base_resolution * 2 ** (max_level + 1)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.values = np.empty((self.number_of_outputs, 0), dtype=flow_field.dtype)
+        singularities = np.array([[flow.x_pos, flow.y_pos] for flow in flow_field.flows
+                                  if isinstance(flow, ef.NonUniformFlow)]).reshape(-1, 2)
+
+        i, j = (index.ravel() for index in np.meshgrid(np.arange(base_resolution), np.arange(base_resolution)))
+        leaves, scale = [], None
+        for level in range(max_level + 1):
+            steps = 2 ** (max_level + 1 - level)
+            corner_keys = self.key(i[:, None] * steps + CORNER_OFFSETS[:, 0] * steps,
+                                   j[:, None] * steps + CORNER_OFFSETS[:, 1] * steps)
+            midpoint_keys = self.key(i[:, None] * steps + MIDPOINT_OFFSETS[:, 0] * steps // 2,
+                                     j[:, None] * steps + MIDPOINT_OFFSETS[:, 1] * steps // 2)
+            self.evaluate_keys(np.concatenate((corner_keys.ravel(), midpoint_keys.ravel())))
+            if scale is None:
+                finite = self.values[np.isfinite(self.values)]
+                scale = np.max(np.abs(finite)) if finite.size and np.max(np.abs(finite)) > 0 else 1.
+
+            if level == max_level:
+                leaves.append((level, i, j, corner_keys))
+                break
+            corner_values = self.values[:, np.searchsorted(self.keys, corner_keys)]
+            midpoint_values = self.values[:, np.searchsorted(self.keys, midpoint_keys)]
+            interpolated = np.stack([corner_values[:, :, c].mean(axis=2) for c in MIDPOINT_CORNERS], axis=2)
+            error = np.abs(midpoint_values - interpolated).max(axis=(0, 2))
+            refine = ~(error <= tolerance * scale)  # NaN near a singularity also refines
+            if singularities.size:
+                width, height = self.cell_size(level)
+                centre_x = self.bounds[0] + (i + 0.5) * width
+                centre_y = self.bounds[2] + (j + 0.5) * height
+                distance = np.hypot(centre_x[:, None] - singularities[:, 0], centre_y[:, None] - singularities[:, 1])
+                refine |= np.any(distance < np.hypot(width, height), axis=1)
+
+            leaves.append((level, i[~refine], j[~refine], corner_keys[~refine]))
+            i = (2 * i[refine, None] + CORNER_OFFSETS[:, 0]).ravel()
+            j = (2 * j[refine, None] + CORNER_OFFSETS[:, 1]).ravel()
+            if i.size == 0:
+                break
+
+        self.levels = np.concatenate([np.full(leaf[1].size, leaf[0]) for leaf in leaves])
+        self.i = np.concatenate([leaf[1] for leaf in leaves])
+        self.j = np.concatenate([leaf[2] for leaf in leaves])
+        self.corners = np.searchsorted(self.keys, np.concatenate([leaf[3] for leaf in leaves]))
+
+    @property
+    def points(self) -> np.ndarray:
+        return self.lattice_points(self.keys)
+
+    def key(self, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        return j.astype(np.int64) * (self.lattice_size + 1) + i
+
+    def lattice_points(self, keys: np.ndarray) -> np.ndarray:
+        j, i = np.divmod(keys, self.lattice_size + 1)
+        x_min, x_max, y_min, y_max = self.bounds
+        return np.column_stack((x_min + i * (x_max - x_min) / self.lattice_size,
+                                y_min + j * (y_max - y_min) / self.lattice_size))
+
+    def cell_size(self, level: tp.Union[int, np.ndarray]) -> tp.Tuple[float, float]:
+        number = self.base_resolution * 2.0 ** level
+        return (self.bounds[1] - self.bounds[0]) / number, (self.bounds[3] - self.bounds[2]) / number
+
+    def evaluate_keys(self, keys: np.ndarray) -> None:
+        '''
+        Evaluates the lattice points with the given keys that have not been evaluated yet. The keys stay sorted, so the
+        values of a key are found with np.searchsorted(self.keys, key).
+        '''
+        new = np.setdiff1d(keys, self.keys)
+        if new.size:
+            values = self.flow_field.evaluate_points(self.lattice_points(new), self.quantity)
+            keys_and_new = np.concatenate((self.keys, new))
+            order = np.argsort(keys_and_new, kind='stable')
+            self.keys = keys_and_new[order]
+            self.values = np.concatenate((self.values, values), axis=1)[:, order]
+
+    def cells(self) -> np.ndarray:
+        width, height = self.cell_size(self.levels)
+        return np.column_stack((self.bounds[0] + self.i * width, self.bounds[2] + self.j * height,
+                                np.broadcast_to(width, self.i.shape), np.broadcast_to(height, self.j.shape)))
+
+    def resample(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        '''
+        Interpolates the quantity bilinearly within the leaf cells onto the uniform grid spanned by the 1-D arrays x
+        and y and returns an array of shape (number of outputs, y.size, x.size), like FlowField.evaluate_tiled.
+        Points outside the tree are NaN.
+        '''
+        X, Y = (grid.ravel() for grid in np.meshgrid(np.ravel(x), np.ravel(y)))
+        x_min, x_max, y_min, y_max = self.bounds
+        leaf = np.full(X.size, -1)
+        inside = np.flatnonzero((X >= x_min) & (X <= x_max) & (Y >= y_min) & (Y <= y_max))
+        for level in range(self.max_level + 1):
+            on_level = np.flatnonzero(self.levels == level)
+            if on_level.size == 0 or inside.size == 0:
+                continue
+            number = self.base_resolution * 2 ** level
+            leaf_keys = self.j[on_level].astype(np.int64) * number + self.i[on_level]
+            order = np.argsort(leaf_keys)
+            i = np.clip(((X[inside] - x_min) / (x_max - x_min) * number).astype(np.int64), 0, number - 1)
+            j = np.clip(((Y[inside] - y_min) / (y_max - y_min) * number).astype(np.int64), 0, number - 1)
+            keys = j * number + i
+            position = np.minimum(np.searchsorted(leaf_keys[order], keys), on_level.size - 1)
+            found = leaf_keys[order][position] == keys
+            leaf[inside[found]] = on_level[order][position[found]]
+            inside = inside[~found]
+
+        result = np.full((self.number_of_outputs, X.size), np.nan, dtype=self.values.dtype)
+        located = np.flatnonzero(leaf >= 0)
+        cells = self.cells()[leaf[located]]
+        tx = (X[located] - cells[:, 0]) / cells[:, 2]
+        ty = (Y[located] - cells[:, 1]) / cells[:, 3]
+        weights = np.column_stack(((1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty))
+        result[:, located] = np.einsum('okc,kc->ok', self.values[:, self.corners[leaf[located]]], weights)
+        return result.reshape(self.number_of_outputs, np.size(y), np.size(x))
@@ -0,0 +1,311 @@
+import multiprocessing as mp
+import typing as tp
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from . import flow_batch as fb
+from . import multipole as mpl
+
+# Below this much work (number of flows x number of grid points) the start-up and dispatch cost of a pool is larger
+# than the evaluation itself, so the flows are evaluated in the calling thread.
+SERIAL_WORK_LIMIT = 2 ** 20
+# Below this much work threads are used. NumPy releases the GIL inside its ufuncs so threads scale reasonably well
+# without having to pickle the grid. Above it a persistent process pool working on a shared-memory grid is used.
+PROCESS_WORK_LIMIT = 2 ** 26
+# Forking is not safe once the threads of the parallel numba kernels have started, so worker processes are started
+# from a clean server process where the platform allows it.
+PROCESS_START_METHOD = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+
+
+def cast_like(value, x: np.ndarray):
+    '''
+    Casts a contribution computed in float64 by a compiled kernel to the floating point type of the grid.
+    '''
+    dtype = np.result_type(x, np.float32)
+    if isinstance(value, tuple):
+        return tuple(component.astype(dtype, copy=False) for component in value)
+    return value.astype(dtype, copy=False)
+
+
+def evaluate_flow(flow, quantity: str, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask'):
+    return getattr(flow, quantity)(x, y, singularity_policy=singularity_policy)
+
+
+class ExecutionBackend:
+    '''
+    Base class for the strategies used by a FlowField to evaluate its elementary flows.
+
+    A backend maps a quantity ("velocity", "stream_function", ...) over a list of flows and returns one contribution
+    per unit of work. The FlowField is responsible for summing the contributions. Backends that hold on to resources
+    (threads, processes) release them in close() and can be used as context managers so that one backend can be
+    shared between several FlowFields.
+
+    Methods
+    -------
+
+    evaluate(flows, quantity, x, y, singularity_policy)
+    Returns a list of contributions of the flows to the quantity at the points (x, y).
+
+    close()
+    Releases any workers held by the backend.
+
+    '''
+
+    name = 'base'
+
+    def starmap(self, func: tp.Callable, iterable: tp.Iterable) -> list:
+        raise NotImplementedError("Not Implemented")
+
+    def evaluate(self, flows: tp.Sequence, quantity: str, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> list:
+        return self.starmap(evaluate_flow, zip(flows, repeat(quantity), repeat(x), repeat(y),
+                                               repeat(singularity_policy)))
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SerialBackend(ExecutionBackend):
+    '''
+    Evaluates every flow in the calling thread.
+    '''
+
+    name = 'serial'
+
+    def starmap(self, func: tp.Callable, iterable: tp.Iterable) -> list:
+        return [func(*args) for args in iterable]
+
+
+class ThreadBackend(ExecutionBackend):
+    '''
+    Evaluates the flows on a persistent pool of threads. The pool is created on first use.
+    '''
+
+    name = 'thread'
+
+    def __init__(self, workers: tp.Optional[int] = None):
+        self.workers = workers or mp.cpu_count()
+        self._executor: tp.Optional[ThreadPoolExecutor] = None
+
+    def starmap(self, func: tp.Callable, iterable: tp.Iterable) -> list:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return list(self._executor.map(lambda args: func(*args), iterable))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class ProcessBackend(ExecutionBackend):
+    '''
+    Evaluates the flows on a persistent pool of processes. The pool is created on first use and reused by every
+    subsequent call until close() is called.
+    '''
+
+    name = 'process'
+
+    def __init__(self, workers: tp.Optional[int] = None):
+        self.workers = workers or mp.cpu_count()
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = mp.get_context(PROCESS_START_METHOD).Pool(self.workers)
+        return self._pool
+
+    def starmap(self, func: tp.Callable, iterable: tp.Iterable) -> list:
+        return self.pool.starmap(func, iterable)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def attach_shared_array(spec: tp.Tuple[str, tuple, str]) -> tp.Tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = spec
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def accumulate_flows_shared(flows: tp.Sequence, quantity: str, x_spec: tuple, y_spec: tuple, out_spec: tuple,
+                            index: int, singularity_policy: str) -> None:
+    x_memory, x = attach_shared_array(x_spec)
+    y_memory, y = attach_shared_array(y_spec)
+    out_memory, out = attach_shared_array(out_spec)
+    try:
+        accumulator = out[index]
+        accumulator[...] = 0.
+        for flow in flows:
+            contribution = evaluate_flow(flow, quantity, x, y, singularity_policy)
+            if not isinstance(contribution, tuple):
+                contribution = (contribution,)
+            for component, value in zip(accumulator, contribution):
+                component += np.ma.filled(value, np.nan)
+        del accumulator
+    finally:
+        del x, y, out
+        x_memory.close()
+        y_memory.close()
+        out_memory.close()
+
+
+class SharedMemoryBackend(ProcessBackend):
+    '''
+    Evaluates the flows on a persistent pool of processes without pickling the grid.
+
+    The grid and one output accumulator per worker are placed in shared memory. Each worker receives a chunk of flows
+    and the names of the shared blocks, evaluates its flows directly on the shared grid and adds their contribution in
+    place to its own accumulator, so only the flow parameters cross the process boundary. The accumulators are summed
+    once in the calling process. With the 'mask' singularity policy, points where any flow is masked are returned
+    masked, as with the other backends.
+    '''
+
+    name = 'shared_memory'
+
+    def evaluate(self, flows: tp.Sequence, quantity: str, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> list:
+        if len(flows) == 0:
+            return []
+        dtype = np.result_type(x, y, np.float32)
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=dtype), np.asarray(y, dtype=dtype))
+        probe = evaluate_flow(flows[0], quantity, x.ravel()[:1], y.ravel()[:1], singularity_policy)
+        number_of_outputs = len(probe) if isinstance(probe, tuple) else 1
+        number_of_chunks = min(self.workers, len(flows))
+        chunks = [flows[i::number_of_chunks] for i in range(number_of_chunks)]
+
+        blocks = []
+        try:
+            specs = []
+            for shape in (x.shape, y.shape, (number_of_chunks, number_of_outputs) + x.shape):
+                memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+                blocks.append(memory)
+                specs.append((memory.name, shape, dtype.str))
+            np.ndarray(x.shape, dtype=dtype, buffer=blocks[0].buf)[...] = x
+            np.ndarray(y.shape, dtype=dtype, buffer=blocks[1].buf)[...] = y
+
+            self.starmap(accumulate_flows_shared, [(chunk, quantity, specs[0], specs[1], specs[2], index,
+                                                    singularity_policy) for index, chunk in enumerate(chunks)])
+
+            out = np.ndarray(specs[2][1], dtype=dtype, buffer=blocks[2].buf)
+            total = list(out.sum(axis=0))
+            if singularity_policy == 'mask':
+                total = [np.ma.masked_invalid(component) for component in total]
+            del out
+        finally:
+            for memory in blocks:
+                memory.close()
+                memory.unlink()
+
+        return [tuple(total) if isinstance(probe, tuple) else total[0]]
+
+
+class FusedBackend(SerialBackend):
+    '''
+    Compiles the flows into a FlowBatch and evaluates them with a single fused kernel that walks the points once and
+    shares the distance and angle of co-located singularities. Flows that cannot be batched are evaluated one by one
+    and added to the result. The kernel works on plain arrays, so the 'mask' singularity policy is treated as 'nan'.
+    '''
+
+    name = 'fused'
+
+    def evaluate(self, flows: tp.Sequence, quantity: str, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> list:
+        batchable = [flow for flow in flows if fb.is_batchable(flow)]
+        others = [flow for flow in flows if not fb.is_batchable(flow)]
+        if quantity not in ('velocity', 'stream_function') or not batchable:
+            return super().evaluate(flows, quantity, x, y, singularity_policy)
+        batch = fb.FlowBatch.from_flows(batchable)
+        return [cast_like(getattr(batch, quantity)(x, y, singularity_policy=singularity_policy), x)] + \
+            super().evaluate(others, quantity, x, y, singularity_policy)
+
+
+class MultipoleBackend(SerialBackend):
+    '''
+    Evaluates the velocity of the sources, vortices and doublets with a multipole treecode, which costs
+    O(points * log(flows)) instead of O(points * flows). Other quantities and flows that cannot be batched are
+    evaluated directly. As with the fused backend, the 'mask' singularity policy is treated as 'nan'.
+
+    The treecode is kept between calls and only rebuilt when the fingerprint of the batched flows (their kinds,
+    positions, strengths and mask tolerances, and the free stream) changes, so evaluating the same flows tile by tile,
+    chunk by chunk or stage by stage builds the tree once.
+    '''
+
+    name = 'multipole'
+
+    def __init__(self, tolerance: float = 1e-6, theta: float = 0.5, leaf_size: int = 32):
+        self.tolerance = tolerance
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self._treecode: tp.Optional[mpl.Treecode] = None
+        self._fingerprint: tp.Optional[tp.Tuple] = None
+
+    def treecode(self, batch: fb.FlowBatch) -> mpl.Treecode:
+        fingerprint = batch.fingerprint() + (self.tolerance, self.theta, self.leaf_size)
+        if self._treecode is None or fingerprint != self._fingerprint:
+            self._treecode = mpl.Treecode(batch, self.tolerance, self.theta, self.leaf_size)
+            self._fingerprint = fingerprint
+        return self._treecode
+
+    def close(self) -> None:
+        self._treecode = None
+        self._fingerprint = None
+
+    def evaluate(self, flows: tp.Sequence, quantity: str, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> list:
+        batchable = [flow for flow in flows if fb.is_batchable(flow)]
+        others = [flow for flow in flows if not fb.is_batchable(flow)]
+        if quantity != 'velocity' or not batchable:
+            return super().evaluate(flows, quantity, x, y, singularity_policy)
+        treecode = self.treecode(fb.FlowBatch.from_flows(batchable))
+        return [cast_like(treecode.velocity(x, y, singularity_policy), x)] + super().evaluate(others, quantity, x, y,
+                                                                                 singularity_policy)
+
+
+BACKENDS = {
+    'serial': SerialBackend,
+    'thread': ThreadBackend,
+    'process': ProcessBackend,
+    'shared_memory': SharedMemoryBackend,
+    'fused': FusedBackend,
+    'multipole': MultipoleBackend,
+}
+
+
+def choose_backend(number_of_flows: int, number_of_points: int) -> str:
+    '''
+    Returns the name of the cheapest backend for evaluating a number of flows over a number of points.
+    '''
+    work = number_of_flows * number_of_points
+    if number_of_flows <= 1 or work < SERIAL_WORK_LIMIT:
+        return 'serial'
+    if work < PROCESS_WORK_LIMIT:
+        return 'thread'
+    return 'shared_memory'
+
+
+def make_backend(backend: tp.Union[str, ExecutionBackend]) -> ExecutionBackend:
+    if isinstance(backend, ExecutionBackend):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Expected one of {sorted(BACKENDS)} or 'auto'")
+    return BACKENDS[backend]()
+
+
+def close_backends(backends: tp.Dict[str, ExecutionBackend]) -> None:
+    for backend in backends.values():
+        backend.close()
+    backends.clear()
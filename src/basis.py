@@ -0,0 +1,136 @@
+import dataclasses
+import typing as tp
+from itertools import repeat
+
+import numpy as np
+
+from . import backends as bk
+from . import elementary_flows as ef
+from . import flow_field as ff
+
+# The parameters each elementary flow is linear in.
+LINEAR_PARAMETERS = {
+    ef.UniformFlow: ('horizontal_vel', 'vertical_vel'),
+    ef.Source: ('strength',),
+    ef.Vortex: ('circulation',),
+    ef.Doublet: ('kappa',),
+}
+
+
+def unit_flows(flow: ef.ElementaryFlow) -> tp.List[ef.ElementaryFlow]:
+    '''
+    Returns one copy of the flow per linear parameter, with that parameter set to one and the others to zero.
+    '''
+    if type(flow) not in LINEAR_PARAMETERS:
+        raise TypeError(f"Cannot build a basis for flows of type {type(flow).__name__}. "
+                        f"Expected one of {[flow_type.__name__ for flow_type in LINEAR_PARAMETERS]}")
+    parameters = LINEAR_PARAMETERS[type(flow)]
+    return [dataclasses.replace(flow, **{name: float(name == parameter) for name in parameters})
+            for parameter in parameters]
+
+
+class BasisField:
+    '''
+    The unit-strength contributions of a set of flows to a quantity on a fixed grid.
+
+    Every elementary flow is linear in its strength parameters, so the quantity for any choice of strengths is a
+    linear combination of the fields of the flows at unit strength. The basis is evaluated once and stored as a matrix
+    with one row per parameter. Any number of strength vectors are then combined with a single matrix multiplication,
+    so a sweep over many cases costs one evaluation of the basis plus a GEMM. The positions of the flows are fixed by
+    the basis. The basis takes number of parameters x number of outputs x number of points x 8 bytes, or 4 bytes with
+    dtype=np.float32.
+
+    Attributes
+    ----------
+
+    flows : list
+    The flows whose positions define the basis.
+
+    parameters : list
+    The (flow index, parameter name) of every row of the basis.
+
+    quantity : str
+    The quantity evaluated on the grid ("velocity", "stream_function" or "velocity_potential").
+
+    singularity_policy : str
+    How points too close to a singularity are handled. Those points are NaN in the basis, or masked in the result
+    with the 'mask' policy, whatever the strengths.
+
+    dtype : np.dtype
+    The precision of the grid, the basis and the results (float64 or float32).
+
+    Methods
+    -------
+
+    from_flow_field(flow_field, x, y, quantity)
+    Builds the basis of the flows of a flow field with its singularity policy and backend.
+
+    strengths(flows)
+    Returns the parameter vector of a list of flows laid out like the basis.
+
+    evaluate(strengths)
+    Returns the quantity for one strength vector or for each row of a matrix of strength vectors.
+
+    '''
+
+    def __init__(self, flows: tp.Sequence[ef.ElementaryFlow], x: np.ndarray, y: np.ndarray,
+                 quantity: str = 'velocity', singularity_policy: str = 'nan',
+                 backend: tp.Union[str, bk.ExecutionBackend] = 'serial',
+                 dtype: tp.Union[str, type, np.dtype] = np.float64):
+        ff.check_quantity(quantity)
+        if quantity == 'flow_state':
+            raise ValueError("Use 'velocity', 'stream_function' or 'velocity_potential' for a basis")
+        self.flows = list(flows)
+        self.quantity = quantity
+        self.singularity_policy = singularity_policy
+        self.dtype = ff.check_dtype(dtype)
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=self.dtype), np.asarray(y, dtype=self.dtype))
+        self.shape = x.shape
+        self.number_of_outputs = ff.QUANTITY_OUTPUTS[quantity]
+
+        units = [unit_flows(flow) for flow in self.flows]
+        self.parameters = [(index, name) for index, flow in enumerate(self.flows)
+                           for name in LINEAR_PARAMETERS[type(flow)]]
+        units = [unit for flow_units in units for unit in flow_units]
+
+        executor = bk.make_backend(backend)
+        try:
+            contributions = executor.starmap(bk.evaluate_flow, zip(units, repeat(quantity), repeat(x), repeat(y),
+                                                                   repeat(singularity_policy)))
+        finally:
+            if not isinstance(backend, bk.ExecutionBackend):
+                executor.close()
+
+        self.basis = np.empty((len(units), self.number_of_outputs * x.size), dtype=self.dtype)
+        for row, contribution in zip(self.basis, contributions):
+            components = contribution if isinstance(contribution, tuple) else (contribution,)
+            for i, component in enumerate(components):
+                row[i * x.size:(i + 1) * x.size] = np.ma.filled(np.broadcast_to(component, x.shape), np.nan).ravel()
+
+    @classmethod
+    def from_flow_field(cls, flow_field: ff.FlowField, x: np.ndarray, y: np.ndarray,
+                        quantity: str = 'velocity') -> 'BasisField':
+        return cls(flow_field.flows, x, y, quantity, flow_field.get_singularity_policy(x), flow_field.get_backend(x),
+                   flow_field.dtype)
+
+    def strengths(self, flows: tp.Optional[tp.Sequence[ef.ElementaryFlow]] = None) -> np.ndarray:
+        flows = self.flows if flows is None else flows
+        return np.array([getattr(flows[index], name) for index, name in self.parameters], dtype=float)
+
+    def evaluate(self, strengths: tp.Optional[np.ndarray] = None) -> np.ndarray:
+        '''
+        Combines the basis with the strengths, a vector with one entry per parameter or a matrix with one strength
+        vector per row (see strengths() for the layout). Returns an array of shape (number of outputs,) + grid shape
+        for a vector, or (number of cases, number of outputs) + grid shape for a matrix. The output axis is dropped for
+        quantities with a single output.
+        '''
+        strengths = self.strengths() if strengths is None else np.asarray(strengths, dtype=float)
+        if strengths.shape[-1] != len(self.parameters):
+            raise ValueError(f"Expected {len(self.parameters)} strengths per case, got {strengths.shape[-1]}")
+        cases = strengths.shape[:-1]
+        values = np.atleast_2d(strengths).astype(self.dtype, copy=False) @ self.basis
+        output_shape = (self.number_of_outputs,) if self.number_of_outputs > 1 else ()
+        values = values.reshape(cases + output_shape + self.shape)
+        if self.singularity_policy == 'mask':
+            values = np.ma.masked_invalid(values)
+        return values
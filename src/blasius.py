@@ -0,0 +1,138 @@
+import typing as tp
+
+import numba as nb
+import numpy as np
+from matplotlib.path import Path
+
+from . import data_collections as dc
+from . import elementary_flows as ef
+from .flow_batch import FlowBatch, is_batchable
+
+# The coefficients (c1, c2) of the singular part c1 / (z - z0) + c2 / (z - z0) ** 2 of the complex velocity of each
+# point singularity.
+LAURENT_COEFFICIENTS = {
+    ef.Source: lambda flow: (flow.strength / (2 * np.pi), 0.),
+    ef.Vortex: lambda flow: (1j * flow.circulation / (2 * np.pi), 0.),
+    ef.Doublet: lambda flow: (0., -flow.kappa / (2 * np.pi)),
+}
+
+
+def laurent_coefficients(flow: ef.ElementaryFlow) -> tp.Tuple[complex, complex]:
+    if type(flow) not in LAURENT_COEFFICIENTS:
+        raise TypeError(f"Cannot take the residues of flows of type {type(flow).__name__}. "
+                        f"Expected one of {[flow_type.__name__ for flow_type in LAURENT_COEFFICIENTS]}")
+    return LAURENT_COEFFICIENTS[type(flow)](flow)
+
+
+def enclosed(flows: tp.Sequence[ef.ElementaryFlow], contour: tp.Optional[np.ndarray]) -> tp.List[bool]:
+    '''
+    Returns which flows are point singularities inside the closed contour, an (N, 2) array of points. Every point
+    singularity is enclosed if there is no contour.
+    '''
+    singular = [isinstance(flow, ef.NonUniformFlow) for flow in flows]
+    if contour is None:
+        return singular
+    positions = np.array([[flow.x_pos, flow.y_pos] if is_singular else [np.nan, np.nan]
+                          for flow, is_singular in zip(flows, singular)]).reshape(-1, 2)
+    inside = Path(np.asarray(contour, dtype=float)).contains_points(positions)
+    return [bool(is_inside and is_singular) for is_inside, is_singular in zip(inside, singular)]
+
+
+@nb.njit(cache=True, parallel=True)
+def regular_velocity(x, y, site_x, site_y, source_strength, circulation, kappa):
+    '''
+    Returns the complex velocity W = u - iv induced at the points (x, y) by the singularities of the sites, and its
+    derivative dW/dz, leaving out the sites placed at each point itself. A site contributes
+    W = c1 / (z - z_s) + c2 / (z - z_s) ** 2 with c1 = (source_strength + i circulation) / (2 pi) and
+    c2 = -kappa / (2 pi).
+    '''
+    w = np.zeros(x.size, dtype=np.complex128)
+    dw_dz = np.zeros(x.size, dtype=np.complex128)
+    for p in nb.prange(x.size):
+        w_p = 0j
+        dw_dz_p = 0j
+        for s in range(site_x.size):
+            if site_x[s] == x[p] and site_y[s] == y[p]:
+                continue
+            t = 1. / complex(x[p] - site_x[s], y[p] - site_y[s])
+            c1 = complex(source_strength[s], circulation[s]) / (2 * np.pi)
+            c2 = -kappa[s] / (2 * np.pi)
+            w_p += (c1 + c2 * t) * t
+            dw_dz_p -= (c1 + 2 * c2 * t) * t * t
+        w[p] = w_p
+        dw_dz[p] = dw_dz_p
+    return w, dw_dz
+
+
+def residue_forces(flows: tp.Sequence[ef.ElementaryFlow], contour: tp.Optional[np.ndarray] = None,
+                   density: float = 1.) -> dc.Forces:
+    '''
+    Returns the force and moment on a closed contour from the residues of the Blasius integrands at the enclosed
+    singularities, exactly. The regular velocity at every enclosed site is found in one compiled pass over the pairs
+    of sites (see regular_velocity), and flows that cannot be batched are evaluated at all of the sites at once.
+
+    Near a site z0 the complex velocity is W = c2 / (z - z0) ** 2 + c1 / (z - z0) + R(z), where R is the velocity of
+    the flows at other sites, so Res(W ** 2, z0) = 2 c1 R(z0) + 2 c2 R'(z0) and Res(z W ** 2, z0) = z0 Res(W ** 2, z0) +
+    c1 ** 2 + 2 c2 R(z0). The Blasius theorem then gives Fx - i Fy = i density / 2 * 2 pi i sum Res(W ** 2) and
+    M = Re(-density / 2 * 2 pi i sum Res(z W ** 2)), counterclockwise about the origin.
+    '''
+    inside = enclosed(flows, contour)
+    sites: tp.Dict[tp.Tuple[float, float], tp.List[complex]] = {}
+    for flow, is_inside in zip(flows, inside):
+        if is_inside:
+            c1, c2 = laurent_coefficients(flow)
+            coefficients = sites.setdefault((flow.x_pos, flow.y_pos), [0j, 0j])
+            coefficients[0] += c1
+            coefficients[1] += c2
+    if not sites:
+        return dc.Forces(0., 0., 0.)
+
+    x, y = np.array(list(sites.keys()), dtype=float).T.copy()
+    c1, c2 = np.array(list(sites.values()), dtype=complex).T
+    batch = FlowBatch.from_flows([flow for flow in flows if is_batchable(flow)])
+    flow_sites = batch.sites()
+    regular, derivative = regular_velocity(x, y, flow_sites.x_pos, flow_sites.y_pos, flow_sites.source_strength,
+                                           flow_sites.circulation, flow_sites.kappa)
+    regular += complex(batch.horizontal_vel, -batch.vertical_vel)
+    for flow in flows:
+        if not is_batchable(flow):
+            u, v, du_dx, du_dy, dv_dx, dv_dy = flow.velocity_and_gradient(x, y, 'nan')
+            regular += u - 1j * v
+            derivative += du_dx - 1j * dv_dx
+
+    site_residue = 2 * c1 * regular + 2 * c2 * derivative
+    residue = np.sum(site_residue)
+    moment_residue = np.sum((x + 1j * y) * site_residue + c1 ** 2 + 2 * c2 * regular)
+
+    force = 1j * density / 2 * 2j * np.pi * residue
+    moment = (-density / 2 * 2j * np.pi * moment_residue).real
+    return dc.Forces(float(force.real), float(-force.imag), float(moment))
+
+
+def signed_area(contour: np.ndarray) -> float:
+    '''
+    Returns the area enclosed by a closed contour, an (N, 2) array of points, from the shoelace formula. It is positive
+    if the contour runs counterclockwise and negative if it runs clockwise.
+    '''
+    x, y = contour[:, 0], contour[:, 1]
+    return 0.5 * float(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+
+
+def contour_forces(contour: np.ndarray, u: np.ndarray, v: np.ndarray, density: float = 1.) -> dc.Forces:
+    '''
+    Returns the force and moment on a closed contour, an (N, 2) array of points, from the Blasius integrals of the
+    velocity (u, v) sampled at its points, with the trapezoidal rule. The integrals are taken counterclockwise, so a
+    clockwise contour (see signed_area) is traversed in reverse.
+    '''
+    if signed_area(contour) < 0:
+        contour, u, v = contour[::-1], u[::-1], v[::-1]
+    z = contour[:, 0] + 1j * contour[:, 1]
+    w_squared = (u - 1j * v) ** 2
+    dz = np.roll(z, -1) - z
+
+    def integral(f):
+        return np.sum((f + np.roll(f, -1)) / 2 * dz)
+
+    force = 1j * density / 2 * integral(w_squared)
+    moment = (-density / 2 * integral(z * w_squared)).real
+    return dc.Forces(force.real, -force.imag, moment)
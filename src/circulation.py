@@ -1,6 +1,7 @@
 import numpy as np
 import scipy as sp
 from . import data_collections as dc
+from .flow_field import FlowField
 
 
 def compute_ellipse_and_circulation(flow_field: dc.FlowFieldProperties, ellipse_def: dc.Ellipse, divsions: int=100):
@@ -37,3 +38,39 @@ def compute_ellipse_and_circulation(flow_field: dc.FlowFieldProperties, ellipse_
 
     circulation = -(np.trapz(u_ellipse, x_ellipse) + np.trapz(v_ellipse, y_ellipse))
     return dc.EllipseProperties(x_ellipse, y_ellipse, u_ellipse, v_ellipse, circulation)
+
+
+def compute_circulation(flow_field: FlowField, ellipse_def: dc.Ellipse, divisions: int = 100):
+    '''
+    Computes the circulation around an ellipse placed in a flow field, evaluating the velocity of the flow field
+    directly on the ellipse instead of interpolating it from a grid.
+
+    Parameters
+    ----------
+
+    flow_field : FlowField
+    The flow field.
+
+    ellipse_def : Ellipse
+    The ellipse definition.
+
+    divisions : int
+    The number of divisions to use when discretizing the ellipse.
+
+    Returns
+    -------
+
+    EllipseProperties
+    The ellipse properties.
+
+    '''
+
+    t = np.linspace(0, 2 * np.pi, divisions)
+
+    x_ellipse = ellipse_def.a * np.cos(t) + ellipse_def.x0
+    y_ellipse = ellipse_def.b * np.sin(t) + ellipse_def.y0
+
+    u_ellipse, v_ellipse = flow_field.evaluate_points(np.column_stack((x_ellipse, y_ellipse)), 'velocity')
+
+    circulation = -(np.trapz(u_ellipse, x_ellipse) + np.trapz(v_ellipse, y_ellipse))
+    return dc.EllipseProperties(x_ellipse, y_ellipse, u_ellipse, v_ellipse, circulation)
@@ -5,15 +5,74 @@ import typing as tp
 from numba import float64, int64, boolean
 from numba.experimental import jitclass
 
-SourcePanelMethodResults = namedtuple('PanelMethodResults',
-                                      ['V_normal', 'V_tangential', 'Source_Strengths', 'V_horizontal', 'V_vertical'])
+class KernelChoice(namedtuple("KernelChoice", ['kernel', 'implementation', 'threads', 'size'])):
+    """
+    A class that represents the implementation of a kernel chosen for a problem (see dispatch.choose).
+
+    Attributes
+    ----------
+
+    kernel : str
+    The kernel ("panel_integrals" or "grid_velocity").
+
+    implementation : str
+    The implementation ("numpy", "serial" or "parallel").
+
+    threads : int
+    The number of numba threads used.
+
+    size : int
+    The size of the problem the choice was made for.
+
+    """
+    pass
+
+
+class PanelMethodMetadata(namedtuple("PanelMethodMetadata", ['panel_integrals', 'grid_velocity'])):
+    """
+    A class that represents how the kernels of a panel method run were evaluated.
+
+    Attributes
+    ----------
+
+    panel_integrals : KernelChoice
+    The implementation used for the panel influence matrices.
+
+    grid_velocity : KernelChoice
+    The implementation used for the grid velocity, or None if it came from a GridOperator.
+
+    """
+    pass
+
+
+class SourcePanelMethodResults(namedtuple('PanelMethodResults',
+                                          ['V_normal', 'V_tangential', 'Source_Strengths', 'V_horizontal',
+                                           'V_vertical'])):
+    """
+    A class that represents the results of the source panel method. The metadata attribute holds the
+    PanelMethodMetadata of the run.
+    """
+    metadata = None
+
+
+class VortexPanelMethodResults(namedtuple('PanelMethodResults',
+                                          ['V_normal', 'V_tangential', 'Vortex_Strengths', 'V_horizontal',
+                                           'V_vertical'])):
+    """
+    A class that represents the results of the vortex panel method. The metadata attribute holds the
+    PanelMethodMetadata of the run.
+    """
+    metadata = None
 
-VortexPanelMethodResults = namedtuple('PanelMethodResults',
-                                      ['V_normal', 'V_tangential', 'Vortex_Strengths', 'V_horizontal', 'V_vertical'])
 
-SourceVortexPanelMethodResults = namedtuple('SourceVortexPanelMethodResults',
-                                            ['V_normal', 'V_tangential', 'Source_Strengths', 'Circulation',
-                                             'V_horizontal', 'V_vertical'])
+class SourceVortexPanelMethodResults(namedtuple('SourceVortexPanelMethodResults',
+                                                ['V_normal', 'V_tangential', 'Source_Strengths', 'Circulation',
+                                                 'V_horizontal', 'V_vertical'])):
+    """
+    A class that represents the results of the source vortex panel method. The metadata attribute holds the
+    PanelMethodMetadata of the run.
+    """
+    metadata = None
 
 
 class FlowFieldProperties(namedtuple("FlowField", ['x', 'y', 'u', 'v'])):
@@ -90,6 +149,172 @@ class EllipseProperties(namedtuple("BodyProperties", ['x_cor', 'y_cor', 'u', 'v'
     pass
 
 
+class FieldTile(namedtuple("FieldTile", ['rows', 'values'])):
+    """
+    A class that represents a block of rows of a field evaluated on a grid.
+
+    Attributes
+    ----------
+
+    rows : slice
+    The rows of the grid covered by the tile.
+
+    values : tuple
+    The evaluated quantities on the tile, each of shape (number of rows, number of columns).
+
+    """
+    pass
+
+
+class FlowState(namedtuple("FlowState", ['phi', 'psi', 'u', 'v'])):
+    """
+    A class that represents the velocity potential, stream function and velocity of a flow evaluated at a set of
+    points. phi + i psi is the complex potential w(z) and u - i v the complex velocity dw/dz.
+
+    Attributes
+    ----------
+
+    phi : np.ndarray
+    The velocity potential.
+
+    psi : np.ndarray
+    The stream function.
+
+    u : np.ndarray
+    The x-component of the velocity.
+
+    v : np.ndarray
+    The y-component of the velocity.
+
+    """
+    pass
+
+
+class VelocityGradient(namedtuple("VelocityGradient", ['du_dx', 'du_dy', 'dv_dx', 'dv_dy'])):
+    """
+    A class that represents the velocity gradient tensor of a flow evaluated at a set of points. Potential flows are
+    irrotational and incompressible, so du_dy = dv_dx and dv_dy = -du_dx, and du_dx - i dv_dx is d2w/dz2.
+
+    Attributes
+    ----------
+
+    du_dx : np.ndarray
+    The x-derivative of the x-component of the velocity.
+
+    du_dy : np.ndarray
+    The y-derivative of the x-component of the velocity.
+
+    dv_dx : np.ndarray
+    The x-derivative of the y-component of the velocity.
+
+    dv_dy : np.ndarray
+    The y-derivative of the y-component of the velocity.
+
+    """
+    pass
+
+
+class Forces(namedtuple("Forces", ['fx', 'fy', 'moment'])):
+    """
+    A class that represents the force and moment exerted by a flow on a closed contour per unit span.
+
+    Attributes
+    ----------
+
+    fx : float
+    The x-component of the force (the drag for a free stream along x).
+
+    fy : float
+    The y-component of the force (the lift for a free stream along x).
+
+    moment : float
+    The moment about the origin, counterclockwise positive.
+
+    """
+    pass
+
+
+class GridVelocityErrorReport(namedtuple("GridVelocityErrorReport", ['max_error', 'rms_error', 'relative_error',
+                                                                     'direct_time', 'treecode_time'])):
+    """
+    A class that represents the error of a panel treecode grid velocity against the direct method.
+
+    Attributes
+    ----------
+
+    max_error : float
+    The largest magnitude of the velocity error on the grid.
+
+    rms_error : float
+    The root mean square magnitude of the velocity error on the grid.
+
+    relative_error : float
+    The largest error relative to the largest speed of the direct method.
+
+    direct_time : float
+    The time taken by the direct method in seconds.
+
+    treecode_time : float
+    The time taken by the treecode, including building the tree, in seconds.
+
+    """
+    pass
+
+
+class Trajectory(namedtuple("Trajectory", ['times', 'x', 'y'])):
+    """
+    A class that represents the positions of a set of moving singularities at a sequence of times.
+
+    Attributes
+    ----------
+
+    times : np.ndarray
+    The output times.
+
+    x : np.ndarray
+    The x-coordinates of the singularities, of shape (number of times, number of singularities).
+
+    y : np.ndarray
+    The y-coordinates of the singularities, of shape (number of times, number of singularities).
+
+    """
+    pass
+
+
+class FlowSites(namedtuple("FlowSites", ['x_pos', 'y_pos', 'mask_tol', 'kinds', 'source_strength', 'circulation',
+                                         'kappa'])):
+    """
+    A class that represents the point singularities of a flow batch grouped by position. Singularities placed at the
+    same point share a site so that their distance and angle to a grid point are only computed once.
+
+    Attributes
+    ----------
+
+    x_pos : np.ndarray
+    The x-coordinates of the sites.
+
+    y_pos : np.ndarray
+    The y-coordinates of the sites.
+
+    mask_tol : np.ndarray
+    The squared distance from a site below which its velocity is not evaluated.
+
+    kinds : np.ndarray
+    A bit mask per site of the kinds of singularities placed there (see SOURCE_BIT, VORTEX_BIT, DOUBLET_BIT).
+
+    source_strength : np.ndarray
+    The total source strength at each site.
+
+    circulation : np.ndarray
+    The total circulation at each site.
+
+    kappa : np.ndarray
+    The total doublet strength at each site.
+
+    """
+    pass
+
+
 specGeometry = [
     ('x', float64[:]),
     ('y', float64[:]),
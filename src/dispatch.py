@@ -0,0 +1,183 @@
+import functools
+import json
+import os
+import time
+import typing as tp
+
+import numba as nb
+import numpy as np
+
+from . import data_collections as dc
+from . import geometric_integrals as gi
+from . import grid_velocity as gv
+from .panel_generator import PanelGenerator
+
+IMPLEMENTATIONS = ('numpy', 'serial', 'parallel')
+
+# The kernels that can be dispatched, and how the size of a problem is measured for each of them: the number of panel
+# pairs for the influence matrices, and the number of grid point and panel pairs for the grid velocity.
+DISPATCH_KERNELS = ('panel_integrals', 'grid_velocity')
+
+# Used until a calibration table has been written by autotune(). Each row gives the implementation and thread count
+# (None for every numba thread) from a problem size up to the size of the next row.
+DEFAULT_CALIBRATION = {
+    'panel_integrals': [{'size': 0, 'implementation': 'numpy', 'threads': 1},
+                        {'size': 2500, 'implementation': 'serial', 'threads': 1},
+                        {'size': 250000, 'implementation': 'parallel', 'threads': None}],
+    'grid_velocity': [{'size': 0, 'implementation': 'numpy', 'threads': 1},
+                      {'size': 10000, 'implementation': 'serial', 'threads': 1},
+                      {'size': 1000000, 'implementation': 'parallel', 'threads': None}],
+}
+
+# The calibration table is read from this file, unless the POTENTIALFLOW_CALIBRATION environment variable names
+# another one.
+CALIBRATION_FILE = os.path.join(os.path.expanduser('~'), '.potentialflow', 'dispatch_calibration.json')
+
+
+def calibration_file() -> str:
+    return os.environ.get('POTENTIALFLOW_CALIBRATION', CALIBRATION_FILE)
+
+
+@functools.lru_cache(maxsize=None)
+def read_calibration(filename: str) -> tp.Dict[str, tp.List[tp.Dict]]:
+    if not os.path.exists(filename):
+        return DEFAULT_CALIBRATION
+    with open(filename) as file:
+        return json.load(file)['kernels']
+
+
+def load_calibration(filename: tp.Optional[str] = None) -> tp.Dict[str, tp.List[tp.Dict]]:
+    '''
+    Returns the calibration table in the file (see calibration_file()), or DEFAULT_CALIBRATION if there is none.
+    '''
+    return read_calibration(filename or calibration_file())
+
+
+def choose(kernel: str, size: int,
+           calibration: tp.Optional[tp.Dict[str, tp.List[tp.Dict]]] = None) -> dc.KernelChoice:
+    '''
+    Returns the implementation and thread count of the kernel for a problem of the given size, from the last row of
+    the calibration table whose size does not exceed it. Thread counts are limited to NUMBA_NUM_THREADS.
+    '''
+    if kernel not in DISPATCH_KERNELS:
+        raise ValueError(f"Unknown kernel '{kernel}'. Expected one of {DISPATCH_KERNELS}")
+    rows = (calibration or load_calibration())[kernel]
+    row = rows[0]
+    for candidate in rows:
+        if candidate['size'] <= size:
+            row = candidate
+    threads = min(row['threads'] or nb.config.NUMBA_NUM_THREADS, nb.config.NUMBA_NUM_THREADS)
+    return dc.KernelChoice(kernel=kernel, implementation=row['implementation'], threads=threads, size=size)
+
+
+def forced_choice(kernel: str, size: int, threads: int) -> dc.KernelChoice:
+    '''
+    Returns the choice of the numba kernel for an explicit thread count, bypassing the calibration table.
+    '''
+    return dc.KernelChoice(kernel=kernel, implementation='serial' if threads == 1 else 'parallel',
+                           threads=threads or nb.config.NUMBA_NUM_THREADS, size=size)
+
+
+def dispatch_panel_integrals(panel_geometry: dc.PanelizedGeometry, source: bool = True, vortex: bool = True,
+                             choice: tp.Optional[dc.KernelChoice] = None,
+                             calibration: tp.Optional[tp.Dict[str, tp.List[tp.Dict]]] = None) \
+        -> tp.Tuple[tp.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], dc.KernelChoice]:
+    '''
+    Computes the panel influence matrices I, J, K and L (see compute_panel_geometric_integrals) with the given choice
+    of implementation, or the one chosen from the calibration table, and returns them with the choice.
+    '''
+    choice = choice or choose('panel_integrals', panel_geometry.S.size ** 2, calibration)
+    if choice.implementation == 'numpy':
+        return gi.compute_panel_geometric_integrals_numpy(panel_geometry, source, vortex), choice
+    if choice.implementation == 'serial':
+        return gi.compute_panel_geometric_integrals(panel_geometry, source, vortex), choice
+    return gi.assemble_panel_geometric_integrals(panel_geometry, source, vortex, choice.threads), choice
+
+
+def dispatch_grid_velocity(panel_geometry: dc.PanelizedGeometry, x: np.ndarray, y: np.ndarray, lam: np.ndarray,
+                           gamma: np.ndarray, u_inf: float, v_inf: float, choice: tp.Optional[dc.KernelChoice] = None,
+                           calibration: tp.Optional[tp.Dict[str, tp.List[tp.Dict]]] = None) \
+        -> tp.Tuple[tp.Tuple[np.ndarray, np.ndarray], dc.KernelChoice]:
+    '''
+    Computes the velocity on the grid spanned by x and y (see compute_grid_velocity_panels) with the given choice of
+    implementation, or the one chosen from the calibration table, and returns it with the choice.
+    '''
+    x = np.ascontiguousarray(x, dtype=np.float64).ravel()
+    y = np.ascontiguousarray(y, dtype=np.float64).ravel()
+    lam = np.asarray(lam, dtype=np.float64)
+    gamma = np.asarray(gamma, dtype=np.float64)
+    choice = choice or choose('grid_velocity', x.size * y.size * panel_geometry.S.size, calibration)
+    if choice.implementation == 'numpy':
+        return gv.compute_grid_velocity_panels_numpy(panel_geometry, x, y, lam, gamma, u_inf, v_inf), choice
+    with gi.numba_threads(1 if choice.implementation == 'serial' else choice.threads):
+        return gv.compute_grid_velocity_panels(panel_geometry, x, y, lam, gamma, u_inf, v_inf), choice
+
+
+def circle(number_of_panels: int) -> dc.PanelizedGeometry:
+    theta = np.linspace(0, 2 * np.pi, num=number_of_panels + 1)
+    return PanelGenerator.compute_geometric_quantities(dc.Geometry(np.cos(theta), np.sin(theta), AoA=0))
+
+
+def best_time(function: tp.Callable, repeats: int) -> tp.Tuple[float, tp.Any]:
+    '''
+    Returns the shortest of repeats timings of function() and its last result.
+    '''
+    times, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def candidates(thread_counts: tp.Sequence[int]) -> tp.List[tp.Tuple[str, int]]:
+    return [('numpy', 1), ('serial', 1)] + [('parallel', threads) for threads in thread_counts if threads > 1]
+
+
+def autotune(filename: tp.Optional[str] = None, panel_counts: tp.Sequence[int] = (9, 20, 50, 100, 200, 500, 1000),
+             grid_sizes: tp.Sequence[int] = (10, 30, 100, 300), grid_panels: int = 100,
+             thread_counts: tp.Optional[tp.Sequence[int]] = None, repeats: int = 3) -> tp.Dict:
+    '''
+    Times every implementation of every kernel, after compiling it, on circles of panel_counts panels and on square
+    grids of grid_sizes points a side around grid_panels panels, for every thread count (by default 2, 4, ... up to
+    NUMBA_NUM_THREADS). Writes the fastest implementation at each size to the calibration file as a table for
+    choose(), with the measured times, and returns the file contents.
+    '''
+    if thread_counts is None:
+        thread_counts = sorted({2 ** k for k in range(1, int(np.log2(nb.config.NUMBA_NUM_THREADS)) + 1)}
+                               | {nb.config.NUMBA_NUM_THREADS})
+    thread_counts = [threads for threads in thread_counts if threads <= nb.config.NUMBA_NUM_THREADS]
+    small = circle(8)
+    for implementation, threads in candidates(thread_counts):
+        choice = dc.KernelChoice('', implementation, threads, 0)
+        dispatch_panel_integrals(small, choice=choice)
+        dispatch_grid_velocity(small, np.zeros(2), np.zeros(2), np.ones(8), np.ones(8), 1., 0., choice=choice)
+
+    problems = {
+        'panel_integrals': [(number ** 2, functools.partial(dispatch_panel_integrals, circle(number)))
+                            for number in panel_counts],
+        'grid_velocity': [(size ** 2 * grid_panels, functools.partial(
+            dispatch_grid_velocity, circle(grid_panels), np.linspace(-2, 2, size), np.linspace(-2, 2, size),
+            np.ones(grid_panels), np.ones(grid_panels), 1., 0.)) for size in grid_sizes],
+    }
+    kernels, measurements = {}, {}
+    for kernel, sized_problems in problems.items():
+        rows, measurements[kernel] = [], []
+        for size, problem in sized_problems:
+            times = {f'{implementation}:{threads}': best_time(functools.partial(
+                problem, choice=dc.KernelChoice(kernel, implementation, threads, size)), repeats)[0]
+                for implementation, threads in candidates(thread_counts)}
+            measurements[kernel].append({'size': size, 'times': times})
+            implementation, threads = min(times, key=times.get).split(':')
+            if not rows or (rows[-1]['implementation'], rows[-1]['threads']) != (implementation, int(threads)):
+                rows.append({'size': size if rows else 0, 'implementation': implementation, 'threads': int(threads)})
+        kernels[kernel] = rows
+
+    contents = {'numba_num_threads': nb.config.NUMBA_NUM_THREADS, 'kernels': kernels, 'measurements': measurements}
+    filename = filename or calibration_file()
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, 'w') as file:
+        json.dump(contents, file, indent=2)
+    read_calibration.cache_clear()
+    return contents
+
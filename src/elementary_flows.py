@@ -4,9 +4,53 @@ import typing as tp
 from dataclasses import dataclass
 from abc import abstractmethod
 
+# How the points too close to a singularity (r ** 2 < mask_tol) are handled:
+# 'mask'  - the result is a masked array with those points masked out.
+# 'nan'   - the result is a plain array with those points set to NaN.
+# 'clamp' - r ** 2 is clamped to mask_tol, so the result stays finite and keeps its direction.
+# 'core'  - mask_tol is added to r ** 2 everywhere, a smooth finite-core regularisation of the singularity.
+SINGULARITY_POLICIES = ('mask', 'nan', 'clamp', 'core')
+
 
 class ElementaryFlow:
-    pass
+
+    def flow_state(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        '''
+        Returns the velocity potential, stream function and velocity (phi, psi, u, v) at the points (x, y) from a
+        single evaluation of the complex potential w = phi + i psi and the complex velocity dw/dz = u - i v, sharing
+        the distance, angle and mask to the flow between them.
+        '''
+        raise NotImplementedError("Not Implemented")
+
+    def complex_potential(self, z: np.ndarray,
+                          singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, np.ndarray]:
+        phi, psi, u, v = self.flow_state(np.real(z), np.imag(z), singularity_policy)
+        return phi + 1j * psi, u - 1j * v
+
+    def velocity_potential(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> np.ndarray:
+        return self.flow_state(x, y, singularity_policy)[0]
+
+    def velocity_and_gradient(self, x: np.ndarray, y: np.ndarray,
+                              singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        '''
+        Returns the velocity and its gradient (u, v, du/dx, du/dy, dv/dx, dv/dy) at the points (x, y) from a single
+        evaluation of the offsets to the flow. The gradient is the closed form of d2w/dz2 = du/dx - i dv/dx, and as
+        the flow is irrotational and incompressible du/dy = dv/dx and dv/dy = -du/dx. The squared distance is
+        regularized as in the velocity.
+        '''
+        raise NotImplementedError("Not Implemented")
+
+    def velocity_gradient(self, x: np.ndarray, y: np.ndarray,
+                          singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        return self.velocity_and_gradient(x, y, singularity_policy)[2:]
+
+    def complex_velocity_derivative(self, z: np.ndarray, singularity_policy: str = 'mask') -> np.ndarray:
+        '''
+        Returns the derivative of the complex velocity d2w/dz2 = du/dx - i dv/dx at the points z = x + iy, the
+        analytic Jacobian of the velocity field.
+        '''
+        du_dx, du_dy, dv_dx, dv_dy = self.velocity_gradient(np.real(z), np.imag(z), singularity_policy)
+        return du_dx - 1j * dv_dx
 
 
 @dataclass
@@ -14,14 +58,24 @@ class UniformFlow(ElementaryFlow):
     horizontal_vel: float
     vertical_vel: float
 
-    def stream_function(self, x: np.ndarray, y: np.ndarray):
+    def stream_function(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask'):
         return self.horizontal_vel * y - self.vertical_vel * x
 
-    def velocity(self, x: np.ndarray, y: np.ndarray):
+    def velocity(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask'):
         horizontal_vel = np.full_like(x, self.horizontal_vel)
         vertical_vel = np.full_like(y, self.vertical_vel)
         return horizontal_vel, vertical_vel
 
+    def flow_state(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # w = (U - iV) z
+        phi = self.horizontal_vel * x + self.vertical_vel * y
+        return (phi, self.stream_function(x, y, singularity_policy)) + self.velocity(x, y, singularity_policy)
+
+    def velocity_and_gradient(self, x: np.ndarray, y: np.ndarray,
+                              singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        zero = np.zeros(np.shape(x), dtype=np.result_type(x, np.float32))
+        return self.velocity(x, y, singularity_policy) + (zero, zero, zero, zero)
+
 
 @dataclass
 class NonUniformFlow(ElementaryFlow):
@@ -30,11 +84,12 @@ class NonUniformFlow(ElementaryFlow):
     mask_tol: float = 1e-6
 
     @abstractmethod
-    def stream_function(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    def stream_function(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> np.ndarray:
         raise NotImplementedError("Not Implemented")
 
     @abstractmethod
-    def velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    def velocity(self, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, np.ndarray]:
         raise NotImplementedError("Not Implemented")
 
     def r_squared(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
@@ -49,70 +104,143 @@ class NonUniformFlow(ElementaryFlow):
     def r_squared_mask(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
         return self.r_squared(x, y) < self.mask_tol
 
+    def apply_mask(self, x: np.ndarray, y: np.ndarray, singularity_policy: str) -> tp.Tuple[np.ndarray, np.ndarray]:
+        if singularity_policy != 'mask':
+            return x, y
+        mask = self.r_squared_mask(x, y)
+        return np.ma.masked_where(mask, x), np.ma.masked_where(mask, y)
+
+    def regularized_r_squared(self, x: np.ndarray, y: np.ndarray, singularity_policy: str) -> np.ndarray:
+        r_squared = self.r_squared(x, y)
+        if singularity_policy == 'mask':
+            return r_squared
+        if singularity_policy == 'nan':
+            return np.where(r_squared < self.mask_tol, np.nan, r_squared)
+        if singularity_policy == 'clamp':
+            return np.maximum(r_squared, self.mask_tol)
+        if singularity_policy == 'core':
+            return r_squared + self.mask_tol
+        raise ValueError(f"Unknown singularity policy '{singularity_policy}'. Expected one of {SINGULARITY_POLICIES}")
+
+    def offset(self, x: np.ndarray, y: np.ndarray, singularity_policy: str) -> tp.Tuple[np.ndarray, ...]:
+        '''
+        Returns the offsets of the points (x, y) from the flow and their squared distance regularized according to the
+        singularity policy.
+        '''
+        x, y = self.apply_mask(x, y, singularity_policy)
+        return x - self.x_pos, y - self.y_pos, self.regularized_r_squared(x, y, singularity_policy)
+
 
 @dataclass
 class Source(NonUniformFlow):
     strength: float = 0.0
 
-    def stream_function(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    def stream_function(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> np.ndarray:
         # mask = self.theta_mask(x, y)
         # x, y = (np.ma.masked_where(mask, x), np.ma.masked_where(mask, y))
 
-        theta = self.theta(x, y)
-
         return self.strength / (2 * np.pi) * self.theta(x, y)
 
-    def velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
-        mask = self.r_squared_mask(x, y)
-        x, y = (np.ma.masked_where(mask, x), np.ma.masked_where(mask, y))
+    def velocity(self, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, np.ndarray]:
+        x, y = self.apply_mask(x, y, singularity_policy)
 
-        r_squared = self.r_squared(x, y)
+        r_squared = self.regularized_r_squared(x, y, singularity_policy)
         u = self.strength / (2 * np.pi) * (1 / r_squared) * (x - self.x_pos)
         v = self.strength / (2 * np.pi) * (1 / r_squared) * (y - self.y_pos)
 
         return u, v
 
+    def flow_state(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # w = m / (2 pi) log(z - z0)
+        dx, dy, r_squared = self.offset(x, y, singularity_policy)
+        a = self.strength / (2 * np.pi)
+        a_over_r_squared = a / r_squared
+        return a * 0.5 * np.log(r_squared), a * np.arctan2(dy, dx), a_over_r_squared * dx, a_over_r_squared * dy
+
+    def velocity_and_gradient(self, x: np.ndarray, y: np.ndarray,
+                              singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # d2w/dz2 = -m / (2 pi (z - z0) ** 2)
+        dx, dy, r_squared = self.offset(x, y, singularity_policy)
+        a_over_r_squared = self.strength / (2 * np.pi) / r_squared
+        a_over_r_fourth = a_over_r_squared / r_squared
+        du_dx = -a_over_r_fourth * (dx - dy) * (dx + dy)
+        dv_dx = -a_over_r_fourth * 2 * dx * dy
+        return a_over_r_squared * dx, a_over_r_squared * dy, du_dx, dv_dx, dv_dx, -du_dx
+
 
 @dataclass
 class Vortex(NonUniformFlow):
     circulation: float = 0.0
 
-    def stream_function(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
-        mask = self.r_squared_mask(x, y)
+    def stream_function(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> np.ndarray:
+        x, y = self.apply_mask(x, y, singularity_policy)
 
-        x, y = (np.ma.masked_where(mask, x), np.ma.masked_where(mask, y))
-
-        return self.circulation / (2 * np.pi) * np.log(np.sqrt(self.r_squared(x, y)))
-
-    def velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
-        mask = self.r_squared_mask(x, y)
+        return self.circulation / (2 * np.pi) * np.log(np.sqrt(self.regularized_r_squared(x, y, singularity_policy)))
 
-        x, y = (np.ma.masked_where(mask, x), np.ma.masked_where(mask, y))
+    def velocity(self, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, np.ndarray]:
+        x, y = self.apply_mask(x, y, singularity_policy)
 
-        r_squared = self.r_squared(x, y)
+        r_squared = self.regularized_r_squared(x, y, singularity_policy)
         u = self.circulation / (2 * np.pi) * ((y - self.y_pos) / r_squared)
         v = -self.circulation / (2 * np.pi) * ((x - self.x_pos) / r_squared)
 
         return u, v
 
+    def flow_state(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # w = i gamma / (2 pi) log(z - z0), clockwise for a positive circulation
+        dx, dy, r_squared = self.offset(x, y, singularity_policy)
+        g = self.circulation / (2 * np.pi)
+        g_over_r_squared = g / r_squared
+        return -g * np.arctan2(dy, dx), g * 0.5 * np.log(r_squared), g_over_r_squared * dy, -g_over_r_squared * dx
+
+    def velocity_and_gradient(self, x: np.ndarray, y: np.ndarray,
+                              singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # d2w/dz2 = -i gamma / (2 pi (z - z0) ** 2)
+        dx, dy, r_squared = self.offset(x, y, singularity_policy)
+        g_over_r_squared = self.circulation / (2 * np.pi) / r_squared
+        g_over_r_fourth = g_over_r_squared / r_squared
+        du_dx = -g_over_r_fourth * 2 * dx * dy
+        dv_dx = g_over_r_fourth * (dx - dy) * (dx + dy)
+        return g_over_r_squared * dy, -g_over_r_squared * dx, du_dx, dv_dx, dv_dx, -du_dx
+
 
 @dataclass
 class Doublet(NonUniformFlow):
     kappa: float = 0.0
 
-    def stream_function(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
-        mask = self.r_squared_mask(x, y)
-        x, y = (np.ma.masked_where(mask, x), np.ma.masked_where(mask, y))
+    def stream_function(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> np.ndarray:
+        x, y = self.apply_mask(x, y, singularity_policy)
 
-        r_squared = self.r_squared(x, y)
+        r_squared = self.regularized_r_squared(x, y, singularity_policy)
         return -self.kappa / (2 * np.pi) * ((y - self.y_pos) / r_squared)
 
-    def velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
-        mask = self.r_squared_mask(x, y)
-        x, y = (np.ma.masked_where(mask, x), np.ma.masked_where(mask, y))
+    def velocity(self, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, np.ndarray]:
+        x, y = self.apply_mask(x, y, singularity_policy)
 
-        r_squared_squared = self.r_squared(x, y) ** 2
+        r_squared_squared = self.regularized_r_squared(x, y, singularity_policy) ** 2
         U = -self.kappa / (2 * np.pi) * (x - self.x_pos + y - self.y_pos) * (x - self.x_pos - y + self.y_pos) / (
             r_squared_squared)
         V = -self.kappa / (2 * np.pi) * 2 * (x - self.x_pos) * (y - self.y_pos) / (r_squared_squared)
         return U, V
+
+    def flow_state(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # w = kappa / (2 pi (z - z0)), dw/dz = -kappa / (2 pi (z - z0) ** 2)
+        dx, dy, r_squared = self.offset(x, y, singularity_policy)
+        b_over_r_squared = self.kappa / (2 * np.pi) / r_squared
+        b_over_r_fourth = b_over_r_squared / r_squared
+        return (b_over_r_squared * dx, -b_over_r_squared * dy, -b_over_r_fourth * (dx - dy) * (dx + dy),
+                -b_over_r_fourth * 2 * dx * dy)
+
+    def velocity_and_gradient(self, x: np.ndarray, y: np.ndarray,
+                              singularity_policy: str = 'mask') -> tp.Tuple[np.ndarray, ...]:
+        # d2w/dz2 = kappa / (pi (z - z0) ** 3)
+        dx, dy, r_squared = self.offset(x, y, singularity_policy)
+        b_over_r_fourth = self.kappa / (2 * np.pi) / r_squared ** 2
+        two_b_over_r_sixth = 2 * b_over_r_fourth / r_squared
+        du_dx = two_b_over_r_sixth * dx * (dx ** 2 - 3 * dy ** 2)
+        dv_dx = two_b_over_r_sixth * dy * (3 * dx ** 2 - dy ** 2)
+        return (-b_over_r_fourth * (dx - dy) * (dx + dy), -b_over_r_fourth * 2 * dx * dy, du_dx, dv_dx, dv_dx,
+                -du_dx)
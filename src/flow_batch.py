@@ -0,0 +1,223 @@
+import typing as tp
+from dataclasses import dataclass
+
+import numba as nb
+import numpy as np
+
+from . import data_collections as dc
+from . import elementary_flows as ef
+
+SOURCE = 0
+VORTEX = 1
+DOUBLET = 2
+
+SOURCE_BIT = 1 << SOURCE
+VORTEX_BIT = 1 << VORTEX
+DOUBLET_BIT = 1 << DOUBLET
+
+TYPE_CODES = {
+    ef.Source: SOURCE,
+    ef.Vortex: VORTEX,
+    ef.Doublet: DOUBLET,
+}
+
+# Singularity policies understood by the fused kernel. The kernel works on plain arrays, so 'mask' is treated as 'nan'.
+POLICY_CODES = {
+    'mask': 0,
+    'nan': 0,
+    'clamp': 1,
+    'core': 2,
+}
+
+STRENGTH_FIELDS = {
+    SOURCE: 'strength',
+    VORTEX: 'circulation',
+    DOUBLET: 'kappa',
+}
+
+
+def is_batchable(flow: ef.ElementaryFlow) -> bool:
+    return type(flow) in TYPE_CODES or type(flow) is ef.UniformFlow
+
+
+@dataclass
+class FlowBatch:
+    '''
+    A struct-of-arrays representation of a list of elementary flows.
+
+    The point singularities are stored as columns, one row per flow, and all uniform flows are summed into a single
+    free stream.
+
+    Attributes
+    ----------
+
+    type_code : np.ndarray
+    The kind of each singularity (SOURCE, VORTEX or DOUBLET).
+
+    x_pos : np.ndarray
+    The x-coordinate of each singularity.
+
+    y_pos : np.ndarray
+    The y-coordinate of each singularity.
+
+    strength : np.ndarray
+    The strength, circulation or kappa of each singularity.
+
+    mask_tol : np.ndarray
+    The mask tolerance of each singularity.
+
+    horizontal_vel : float
+    The horizontal velocity of the summed uniform flows.
+
+    vertical_vel : float
+    The vertical velocity of the summed uniform flows.
+
+    Methods
+    -------
+
+    from_flows(flows)
+    Compiles a list of elementary flows into a batch.
+
+    sites()
+    Groups the singularities by position.
+
+    fingerprint()
+    Returns a key that compares equal for batches with the same singularities and free stream.
+
+    evaluate(x, y, velocity, stream_function, singularity_policy)
+    Returns the velocity components and stream function of the batch at the points (x, y) in a single pass.
+
+    velocity(x, y)
+    Returns the velocity of the batch at the points (x, y).
+
+    stream_function(x, y)
+    Returns the stream function of the batch at the points (x, y).
+
+    '''
+    type_code: np.ndarray
+    x_pos: np.ndarray
+    y_pos: np.ndarray
+    strength: np.ndarray
+    mask_tol: np.ndarray
+    horizontal_vel: float = 0.
+    vertical_vel: float = 0.
+
+    @classmethod
+    def from_flows(cls, flows: tp.Sequence[ef.ElementaryFlow]) -> 'FlowBatch':
+        singularities = [flow for flow in flows if type(flow) in TYPE_CODES]
+        uniform_flows = [flow for flow in flows if type(flow) is ef.UniformFlow]
+        if len(singularities) + len(uniform_flows) != len(flows):
+            unsupported = {type(flow).__name__ for flow in flows if not is_batchable(flow)}
+            raise TypeError(f"Cannot batch flows of type {sorted(unsupported)}")
+
+        type_code = np.array([TYPE_CODES[type(flow)] for flow in singularities], dtype=np.int64)
+        return cls(type_code=type_code,
+                   x_pos=np.array([flow.x_pos for flow in singularities], dtype=float),
+                   y_pos=np.array([flow.y_pos for flow in singularities], dtype=float),
+                   strength=np.array([getattr(flow, STRENGTH_FIELDS[code])
+                                      for flow, code in zip(singularities, type_code)], dtype=float),
+                   mask_tol=np.array([flow.mask_tol for flow in singularities], dtype=float),
+                   horizontal_vel=float(sum(flow.horizontal_vel for flow in uniform_flows)),
+                   vertical_vel=float(sum(flow.vertical_vel for flow in uniform_flows)))
+
+    def __len__(self) -> int:
+        return self.type_code.size
+
+    def fingerprint(self) -> tp.Tuple:
+        return (self.type_code.tobytes(), self.x_pos.tobytes(), self.y_pos.tobytes(), self.strength.tobytes(),
+                self.mask_tol.tobytes(), self.horizontal_vel, self.vertical_vel)
+
+    def sites(self) -> dc.FlowSites:
+        positions = np.column_stack((self.x_pos, self.y_pos))
+        positions, site = np.unique(positions, axis=0, return_inverse=True)
+        site = site.ravel()
+        number_of_sites = len(positions)
+
+        def total(code):
+            return np.bincount(site, weights=np.where(self.type_code == code, self.strength, 0.),
+                               minlength=number_of_sites).astype(float)
+
+        kinds = np.zeros(number_of_sites, dtype=np.int64)
+        np.bitwise_or.at(kinds, site, np.left_shift(1, self.type_code))
+        mask_tol = np.zeros(number_of_sites)
+        np.maximum.at(mask_tol, site, self.mask_tol)
+
+        return dc.FlowSites(positions[:, 0].copy(), positions[:, 1].copy(), mask_tol, kinds, total(SOURCE),
+                            total(VORTEX), total(DOUBLET))
+
+    def evaluate(self, x: np.ndarray, y: np.ndarray, velocity: bool = True, stream_function: bool = True,
+                 singularity_policy: str = 'nan') -> tp.Tuple[tp.Optional[np.ndarray], ...]:
+        if singularity_policy not in POLICY_CODES:
+            raise ValueError(f"Unknown singularity policy '{singularity_policy}'. "
+                             f"Expected one of {ef.SINGULARITY_POLICIES}")
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        u, v, psi = superpose_sites(np.ascontiguousarray(x).ravel(), np.ascontiguousarray(y).ravel(), *self.sites(),
+                                    self.horizontal_vel, self.vertical_vel, velocity, stream_function,
+                                    POLICY_CODES[singularity_policy])
+        u, v = (u.reshape(x.shape), v.reshape(x.shape)) if velocity else (None, None)
+        psi = psi.reshape(x.shape) if stream_function else None
+        return u, v, psi
+
+    def velocity(self, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'nan') -> tp.Tuple[np.ndarray, np.ndarray]:
+        u, v, _ = self.evaluate(x, y, velocity=True, stream_function=False, singularity_policy=singularity_policy)
+        return u, v
+
+    def stream_function(self, x: np.ndarray, y: np.ndarray, singularity_policy: str = 'nan') -> np.ndarray:
+        return self.evaluate(x, y, velocity=False, stream_function=True, singularity_policy=singularity_policy)[2]
+
+
+@nb.njit(cache=True, parallel=True)
+def superpose_sites(x, y, site_x, site_y, mask_tol, kinds, source_strength, circulation, kappa, horizontal_vel,
+                    vertical_vel, compute_velocity, compute_stream_function, policy):
+    '''
+    Walks the points once and accumulates the velocity and stream function of every site. The distance and angle to
+    a site are shared by all of the singularities placed there. Points closer to a site than its mask tolerance are
+    set to NaN, or have their squared distance clamped to or offset by the tolerance, depending on the policy code.
+    '''
+    n = x.size if compute_velocity else 0
+    m = x.size if compute_stream_function else 0
+    u = np.empty(n)
+    v = np.empty(n)
+    psi = np.empty(m)
+    q = source_strength / (2 * np.pi)
+    g = circulation / (2 * np.pi)
+    k = kappa / (2 * np.pi)
+    for p in nb.prange(x.size):
+        u_p = horizontal_vel
+        v_p = vertical_vel
+        psi_p = horizontal_vel * y[p] - vertical_vel * x[p]
+        for s in range(site_x.size):
+            dx = x[p] - site_x[s]
+            dy = y[p] - site_y[s]
+            r_squared = dx * dx + dy * dy
+            if policy == 1:
+                r_squared = max(r_squared, mask_tol[s])
+            elif policy == 2:
+                r_squared += mask_tol[s]
+            elif r_squared < mask_tol[s]:
+                u_p = np.nan
+                v_p = np.nan
+                if kinds[s] & (VORTEX_BIT | DOUBLET_BIT):
+                    psi_p = np.nan
+                elif compute_stream_function:
+                    psi_p += q[s] * np.arctan2(dy, dx)
+                continue
+
+            inv_r_squared = 1. / r_squared
+            if compute_velocity:
+                doublet = k[s] * inv_r_squared * inv_r_squared
+                u_p += (q[s] * dx + g[s] * dy) * inv_r_squared - doublet * (dx - dy) * (dx + dy)
+                v_p += (q[s] * dy - g[s] * dx) * inv_r_squared - doublet * 2 * dx * dy
+            if compute_stream_function:
+                if kinds[s] & SOURCE_BIT:
+                    psi_p += q[s] * np.arctan2(dy, dx)
+                if kinds[s] & VORTEX_BIT:
+                    psi_p += g[s] * 0.5 * np.log(r_squared)
+                psi_p -= k[s] * dy * inv_r_squared
+        if compute_velocity:
+            u[p] = u_p
+            v[p] = v_p
+        if compute_stream_function:
+            psi[p] = psi_p
+    return u, v, psi
@@ -1,10 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import typing as tp
-import multiprocessing as mp
-from itertools import repeat
+import weakref
 from . import elementary_flows
-from .plotting import plot_flow_from_stream_function, plot_flow_from_velocities
+from . import data_collections as dc
+from . import backends as bk
+from . import streamlines as sl
+from . import stagnation as st
+from . import blasius
+from .flow_batch import FlowBatch, is_batchable
+from .plotting import plot_flow_from_stream_function, plot_flow_from_velocities, plot_streamlines
 
 plotting_kwargs = {
     'X_NEG_LIMIT': -5,
@@ -20,13 +25,52 @@ plotting_kwargs = {
     "CONTOUR_LABELS": True
 }
 
+# Grids with at least this many points are evaluated on plain arrays with NaN at the singularities instead of masked
+# arrays when the singularity policy is 'auto'. Masked arrays roughly triple the memory used by each evaluation.
+MASKED_POINT_LIMIT = 2 ** 18
 
-def velocity_internal(flow, x, y):
-    return flow.velocity(x, y)
+# Default memory allowed for the temporaries of a tiled evaluation, in bytes.
+DEFAULT_MEMORY_BUDGET = 2 ** 28
+
+# The number of arrays returned by each quantity a flow field can evaluate on a grid.
+QUANTITY_OUTPUTS = {
+    'velocity': 2,
+    'stream_function': 1,
+    'velocity_potential': 1,
+    'flow_state': 4,
+    'velocity_gradient': 4,
+    'velocity_and_gradient': 6,
+}
+
+
+# Floating point types a flow field can be evaluated in. In float32 the relative error of each flow's contribution is
+# a few units of roundoff (eps = 6e-8) times the conditioning of the offset from the flow, |z| / |z - z0|, so the error
+# of a sum of flows is bounded by about 4 * eps * sum_k |contribution_k| * (1 + |z| / |z - z_k|). Away from the
+# singularities this is below 1e-6 of the largest contribution on grids of moderate extent.
+DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
 
 
-def stream_function_internal(flow, x, y):
-    return flow.stream_function(x, y)
+def check_dtype(dtype: tp.Union[str, type, np.dtype]) -> np.dtype:
+    dtype = np.dtype(dtype)
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}'. Expected one of {[str(d) for d in DTYPES]}")
+    return dtype
+
+
+def check_quantity(quantity: str) -> None:
+    if quantity not in QUANTITY_OUTPUTS:
+        raise ValueError(f"Unknown quantity '{quantity}'. Expected one of {sorted(QUANTITY_OUTPUTS)}")
+
+
+def rows_per_tile(number_of_columns: int, number_of_outputs: int, number_of_flows: int, memory_budget: int,
+                  itemsize: int = 8) -> int:
+    '''
+    Returns the number of grid rows that can be evaluated at once within a memory budget. Each row needs the grid
+    coordinates, the contribution of every flow to every output, the running sums and a handful of temporaries per
+    flow evaluation.
+    '''
+    arrays_per_row = 2 + number_of_outputs * (number_of_flows + 1) + 8
+    return max(1, int(memory_budget // (arrays_per_row * number_of_columns * itemsize)))
 
 
 class FlowField:
@@ -39,6 +83,23 @@ class FlowField:
     flows : list
     A list of elementary flows that make up the flow field.
 
+    backend : str or ExecutionBackend
+    How the flows are evaluated: 'serial', 'thread', 'process', 'shared_memory', 'fused', 'multipole', 'auto' or a
+    backend instance. With 'auto' the cheapest backend is chosen on every call from the number of flows and grid points.
+    Backends created by the flow field are persistent and owned by it; they are released by close() or when the flow
+    field is used as a context manager. A backend instance passed in is shared and left open.
+
+    singularity_policy : str
+    How points too close to a singularity are handled: 'mask', 'nan', 'clamp', 'core' or 'auto' (see
+    elementary_flows.SINGULARITY_POLICIES). With 'auto' small grids are masked and large grids use 'nan', which keeps
+    every result a contiguous float array.
+
+    dtype : np.dtype
+    The floating point type the flow field is evaluated in, float64 (the default) or float32. Grids are converted
+    to it on entry and every flow, sum, tile and plot stays in it, so float32 halves the memory and bandwidth of an
+    evaluation. The fused and multipole kernels compute in float64 and return the result in the requested type. See
+    DTYPES for the error bound of float32.
+
     Methods
     -------
 
@@ -48,41 +109,312 @@ class FlowField:
     velocity(x, y)
     Returns the velocity of the flow field at the point (x, y).
 
+    velocity_potential(x, y)
+    Returns the velocity potential of the flow field at the point (x, y).
+
+    flow_state(x, y)
+    Returns the velocity potential, stream function and velocity of the flow field at the point (x, y) in one pass.
+
+    complex_potential(z)
+    Returns the complex potential w and the complex velocity dw/dz of the flow field at the point z = x + iy.
+
+    velocity_gradient(x, y)
+    Returns the analytic velocity gradient tensor of the flow field at the point (x, y).
+
+    velocity_and_gradient(x, y)
+    Returns the velocity and its gradient at the point (x, y) in one pass.
+
     plot()
     Plots the stream function of the flow field.
 
     plot_velocity()
     Plots the velocity of the flow field as streamlines.
 
+    streamlines(x, y, density, seeds, **kwargs)
+    Traces streamlines through the flow field over the area spanned by x and y and returns them as polylines.
+
+    plot_streamlines(x, y)
+    Plots streamlines traced directly from the velocity of the flow field.
+
+    complex_velocity_derivative(z)
+    Returns the analytic derivative d2w/dz2 of the complex velocity of the flow field at the point z = x + iy.
+
+    forces(contour, density, method)
+    Returns the force and moment on a closed contour from the Blasius theorem.
+
+    stagnation_points(x, y, density, tolerance, max_iterations)
+    Finds the stagnation points over the area spanned by x and y with a batched Newton iteration.
+
+    dividing_streamlines(x, y, points, **kwargs)
+    Traces the dividing streamlines through the stagnation points over the area spanned by x and y.
+
+    iter_tiles(x, y, quantity, memory_budget, out)
+    Evaluates a quantity on the grid spanned by x and y in blocks of rows and yields each block as it finishes.
+
+    evaluate_tiled(x, y, quantity, memory_budget, out, filename)
+    Evaluates a quantity on the grid spanned by x and y in blocks of rows into an array or a memory-mapped file.
+
+    evaluate_points(points, quantity, memory_budget, out)
+    Evaluates a quantity at a scattered (N, 2) array of points in chunks, without building a grid.
+
+    to_batch()
+    Compiles the flows into a FlowBatch.
+
+    close()
+    Releases the workers of the backends owned by the flow field.
+
     '''
 
-    def __init__(self, flows: tp.Optional[tp.List[elementary_flows.ElementaryFlow]] = None, **kwargs):
+    def __init__(self, flows: tp.Optional[tp.List[elementary_flows.ElementaryFlow]] = None,
+                 backend: tp.Union[str, bk.ExecutionBackend] = 'auto', singularity_policy: str = 'auto',
+                 dtype: tp.Union[str, type, np.dtype] = np.float64, **kwargs):
         if flows is None:
             flows = []
         self.flows: tp.Optional[tp.List[elementary_flows.ElementaryFlow]] = flows
         self.plotting_kwargs: dict = plotting_kwargs
+        self.backend: tp.Union[str, bk.ExecutionBackend] = backend
+        self.singularity_policy: str = singularity_policy
+        self.dtype: np.dtype = check_dtype(dtype)
+        self._owned_backends: tp.Dict[str, bk.ExecutionBackend] = {}
+        self._finalizer = weakref.finalize(self, bk.close_backends, self._owned_backends)
 
         self.plotting_kwargs.update(**kwargs)
 
+    def get_backend(self, x: np.ndarray) -> bk.ExecutionBackend:
+        if isinstance(self.backend, bk.ExecutionBackend):
+            return self.backend
+        name = bk.choose_backend(len(self.flows), np.size(x)) if self.backend == 'auto' else self.backend
+        if name not in self._owned_backends:
+            self._owned_backends[name] = bk.make_backend(name)
+        return self._owned_backends[name]
+
+    def get_singularity_policy(self, x: np.ndarray) -> str:
+        if self.singularity_policy != 'auto':
+            return self.singularity_policy
+        return 'mask' if np.size(x) < MASKED_POINT_LIMIT else 'nan'
+
+    def as_grid(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+        return np.asanyarray(x).astype(self.dtype, copy=False), np.asanyarray(y).astype(self.dtype, copy=False)
+
+    def to_batch(self) -> FlowBatch:
+        return FlowBatch.from_flows(self.flows)
+
+    def close(self) -> None:
+        bk.close_backends(self._owned_backends)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def stream_function(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
-        pool = mp.Pool(mp.cpu_count())
-        return sum(pool.starmap(stream_function_internal, zip(self.flows, repeat(x), repeat(y))))
-        # return sum([flow.stream_function(x, y) for flow in self.flows])
+        x, y = self.as_grid(x, y)
+        return sum(self.get_backend(x).evaluate(self.flows, 'stream_function', x, y, self.get_singularity_policy(x)))
 
     def plot_flow_from_stream_function(self, x: np.ndarray, y: np.ndarray) -> plt.Figure:
-        X, Y = np.meshgrid(x, y)
-        return plot_flow_from_stream_function(self.stream_function, X, Y, **self.plotting_kwargs)
+        def stream_function(x_axis, y_axis):
+            return self.evaluate_tiled(x_axis, y_axis, 'stream_function')[0]
 
-    def velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
-        pool = mp.Pool(mp.cpu_count())
+        return plot_flow_from_stream_function(stream_function, x, y, **self.plotting_kwargs)
 
-        flow_velocities = pool.starmap(velocity_internal, zip(self.flows, repeat(x), repeat(y)))
-        # flow_velocities = [flow.velocity(x, y) for flow in self.flows]
+    def velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+        x, y = self.as_grid(x, y)
+        flow_velocities = self.get_backend(x).evaluate(self.flows, 'velocity', x, y, self.get_singularity_policy(x))
         U = sum([flow_vel[0] for flow_vel in flow_velocities])
         V = sum([flow_vel[1] for flow_vel in flow_velocities])
         return U, V
 
+    def velocity_potential(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        x, y = self.as_grid(x, y)
+        return sum(self.get_backend(x).evaluate(self.flows, 'velocity_potential', x, y,
+                                                self.get_singularity_policy(x)))
+
+    def flow_state(self, x: np.ndarray, y: np.ndarray) -> dc.FlowState:
+        '''
+        Evaluates the complex potential and complex velocity of every flow once and returns the velocity potential,
+        stream function and velocity, which is cheaper than calling stream_function and velocity separately.
+        '''
+        x, y = self.as_grid(x, y)
+        flow_states = self.get_backend(x).evaluate(self.flows, 'flow_state', x, y, self.get_singularity_policy(x))
+        return dc.FlowState(*(sum([flow_state[i] for flow_state in flow_states]) for i in range(4)))
+
+    def complex_potential(self, z: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+        phi, psi, u, v = self.flow_state(np.real(z), np.imag(z))
+        return phi + 1j * psi, u - 1j * v
+
+    def velocity_gradient(self, x: np.ndarray, y: np.ndarray) -> dc.VelocityGradient:
+        return dc.VelocityGradient(*self.velocity_and_gradient(x, y)[2:])
+
+    def velocity_and_gradient(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, ...]:
+        '''
+        Returns the velocity and its gradient (u, v, du/dx, du/dy, dv/dx, dv/dy) from the closed-form gradients of
+        the elementary flows, evaluated in the same pass as the velocity. Unlike np.gradient on a grid it needs no
+        neighbouring points, so it works on scattered points and stays exact near the singularities.
+        '''
+        x, y = self.as_grid(x, y)
+        contributions = self.get_backend(x).evaluate(self.flows, 'velocity_and_gradient', x, y,
+                                                     self.get_singularity_policy(x))
+        return tuple(sum([contribution[i] for contribution in contributions]) for i in range(6))
+
     def plot_velocity(self, x: np.ndarray, y: np.ndarray) -> plt.Figure:
-        X, Y = np.meshgrid(x, y)
-        U, V = self.velocity(X, Y)
-        return plot_flow_from_velocities(X, Y, U, V, **self.plotting_kwargs)
+        U, V = self.evaluate_tiled(x, y, 'velocity')
+        return plot_flow_from_velocities(x, y, U, V, **self.plotting_kwargs)
+
+    def streamlines(self, x: np.ndarray, y: np.ndarray, density: tp.Optional[float] = None,
+                    seeds: tp.Optional[tp.Tuple[np.ndarray, np.ndarray]] = None, **kwargs) -> tp.List[np.ndarray]:
+        '''
+        Traces streamlines over the area spanned by x and y by sampling the velocity of the flow field directly.
+        The streamlines start from the seeds, or from a uniform grid of seeds thinned to an even spacing set by the
+        density. The keyword arguments are passed to streamlines.trace_streamlines.
+
+        The tracer calls the velocity many times on a few points, so flows that can be batched are evaluated with the
+        fused kernel, which has the lowest overhead per call.
+        '''
+        bounds = (np.min(x), np.max(x), np.min(y), np.max(y))
+        density = self.plotting_kwargs.get('STREAMLINE_DENSITY', 1) if density is None else density
+        velocity = self.tracing_velocity()
+        if seeds is not None:
+            return sl.trace_streamlines(velocity, *seeds, bounds, **kwargs)
+        streamlines = sl.trace_streamlines(velocity, *sl.seed_grid(bounds, density), bounds, **kwargs)
+        return sl.thin_streamlines(streamlines, bounds, density)
+
+    def plot_streamlines(self, x: np.ndarray, y: np.ndarray) -> plt.Figure:
+        return plot_streamlines(self.streamlines(x, y), **self.plotting_kwargs)
+
+    def tracing_velocity(self) -> tp.Callable:
+        return self.to_batch().velocity if all(map(is_batchable, self.flows)) else self.velocity
+
+    def complex_velocity_derivative(self, z: np.ndarray) -> np.ndarray:
+        gradient = self.velocity_gradient(np.real(z), np.imag(z))
+        return gradient.du_dx - 1j * gradient.dv_dx
+
+    def forces(self, contour: tp.Optional[np.ndarray] = None, density: float = 1.,
+               method: str = 'residues') -> dc.Forces:
+        '''
+        Returns the force (fx, fy) and moment per unit span on a closed contour, an (N, 2) array of points traversed
+        in either direction, from the Blasius theorem Fx - i Fy = i density / 2 * integral(W ** 2 dz). With 'residues'
+        the integrals are the residues at the singularities inside the contour (all of them if there is no contour),
+        which is exact and independent of any grid. With 'contour' the velocity is evaluated on the points of the
+        contour and integrated with the trapezoidal rule.
+        '''
+        if method == 'residues':
+            return blasius.residue_forces(self.flows, contour, density)
+        if method != 'contour':
+            raise ValueError(f"Unknown method '{method}'. Expected 'residues' or 'contour'")
+        if contour is None:
+            raise ValueError("A contour is needed with the 'contour' method")
+        contour = np.asarray(contour, dtype=float)
+        u, v = self.evaluate_points(contour, 'velocity').astype(float)
+        return blasius.contour_forces(contour, u, v, density)
+
+    def stagnation_points(self, x: np.ndarray, y: np.ndarray, density: float = 2., tolerance: float = 1e-10,
+                          max_iterations: int = 50) -> np.ndarray:
+        '''
+        Finds the stagnation points over the area spanned by x and y and returns them as an (N, 2) array. Newton's
+        iteration on the complex velocity starts from a coarse grid of 10 * density seeds per side, using the
+        analytic derivative of the elementary flows, and the converged seeds are merged into distinct points. Unlike
+        a search on a dense grid the points are exact to the tolerance times the size of the area.
+        '''
+        bounds = (np.min(x), np.max(x), np.min(y), np.max(y))
+        size = max(bounds[1] - bounds[0], bounds[3] - bounds[2])
+
+        def velocity_and_derivative(z):
+            u, v, du_dx, du_dy, dv_dx, dv_dy = (np.ma.filled(value, np.nan)
+                                                for value in self.velocity_and_gradient(z.real, z.imag))
+            return u - 1j * v, du_dx - 1j * dv_dx
+
+        seed_x, seed_y = sl.seed_grid(bounds, density)
+        z = st.newton_stagnation_points(velocity_and_derivative, seed_x + 1j * seed_y, bounds, tolerance,
+                                        max_iterations)
+        z = st.unique_points(z, max(1e3 * tolerance, 1e-8) * size)
+        return np.column_stack((z.real, z.imag))
+
+    def dividing_streamlines(self, x: np.ndarray, y: np.ndarray, points: tp.Optional[np.ndarray] = None,
+                             **kwargs) -> tp.List[np.ndarray]:
+        '''
+        Traces the dividing streamlines, psi = psi(stagnation point), that leave and enter each stagnation point over
+        the area spanned by x and y, four per point, starting at the point. The points are found with
+        stagnation_points if they are not given. The keyword arguments are passed to streamlines.trace.
+        '''
+        bounds = (np.min(x), np.max(x), np.min(y), np.max(y))
+        points = self.stagnation_points(x, y) if points is None else np.asarray(points, dtype=float).reshape(-1, 2)
+        z = points[:, 0] + 1j * points[:, 1]
+        derivatives = np.ma.filled(self.complex_velocity_derivative(z), np.nan)
+        return st.trace_dividing_streamlines(self.tracing_velocity(), z, derivatives, bounds, **kwargs)
+
+    def iter_tiles(self, x: np.ndarray, y: np.ndarray, quantity: str = 'velocity',
+                   memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                   out: tp.Optional[np.ndarray] = None) -> tp.Iterator[dc.FieldTile]:
+        '''
+        Evaluates a quantity on the grid spanned by the 1-D arrays x and y, one block of rows at a time, so that the
+        temporaries of the evaluation never exceed the memory budget. If out (shape (number of outputs, y.size,
+        x.size)) is given, each tile is written into it and the yielded values are views of out. Points inside the
+        mask tolerance of a singularity are NaN.
+        '''
+        check_quantity(quantity)
+        x, y = self.as_grid(np.ravel(x), np.ravel(y))
+        number_of_outputs = QUANTITY_OUTPUTS[quantity]
+        if out is not None and out.shape != (number_of_outputs, y.size, x.size):
+            raise ValueError(f"out must have shape {(number_of_outputs, y.size, x.size)}, not {out.shape}")
+
+        step = rows_per_tile(x.size, number_of_outputs, len(self.flows), memory_budget, self.dtype.itemsize)
+        for start in range(0, y.size, step):
+            rows = slice(start, min(start + step, y.size))
+            X, Y = np.meshgrid(x, y[rows])
+            values = getattr(self, quantity)(X, Y)
+            values = tuple(values) if isinstance(values, tuple) else (values,)
+            values = tuple(np.ma.filled(np.broadcast_to(value, X.shape), np.nan) for value in values)
+            if out is not None:
+                for component, value in zip(out, values):
+                    component[rows] = value
+                values = tuple(component[rows] for component in out)
+            yield dc.FieldTile(rows, values)
+
+    def evaluate_tiled(self, x: np.ndarray, y: np.ndarray, quantity: str = 'velocity',
+                       memory_budget: int = DEFAULT_MEMORY_BUDGET, out: tp.Optional[np.ndarray] = None,
+                       filename: tp.Optional[str] = None) -> np.ndarray:
+        '''
+        Evaluates a quantity on the grid spanned by the 1-D arrays x and y in blocks of rows and returns an array of
+        shape (number of outputs, y.size, x.size). The result is written into out if it is given, or into a new
+        .npy memory-mapped file if a filename is given.
+        '''
+        check_quantity(quantity)
+        shape = (QUANTITY_OUTPUTS[quantity], np.size(y), np.size(x))
+        if out is None and filename is not None:
+            out = np.lib.format.open_memmap(filename, mode='w+', dtype=self.dtype, shape=shape)
+        elif out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        for _ in self.iter_tiles(x, y, quantity, memory_budget, out):
+            pass
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    def evaluate_points(self, points: np.ndarray, quantity: str = 'velocity',
+                        memory_budget: int = DEFAULT_MEMORY_BUDGET, out: tp.Optional[np.ndarray] = None) -> np.ndarray:
+        '''
+        Evaluates a quantity at the points of an (N, 2) array of (x, y) coordinates and returns an array of shape
+        (number of outputs, N). The points are evaluated in chunks sized like the rows of a tile, so probes, contours
+        and seeds cost O(N) whatever the extent of the points. The result is written into out if it is given. Points
+        inside the mask tolerance of a singularity are NaN.
+        '''
+        check_quantity(quantity)
+        points = np.asarray(points)
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError(f"points must have shape (N, 2), not {points.shape}")
+        x, y = self.as_grid(np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1]))
+        number_of_outputs = QUANTITY_OUTPUTS[quantity]
+        if out is None:
+            out = np.empty((number_of_outputs, x.size), dtype=self.dtype)
+        elif out.shape != (number_of_outputs, x.size):
+            raise ValueError(f"out must have shape {(number_of_outputs, x.size)}, not {out.shape}")
+
+        step = rows_per_tile(1, number_of_outputs, len(self.flows), memory_budget, self.dtype.itemsize)
+        for start in range(0, x.size, step):
+            chunk = slice(start, min(start + step, x.size))
+            values = getattr(self, quantity)(x[chunk], y[chunk])
+            values = tuple(values) if isinstance(values, tuple) else (values,)
+            for component, value in zip(out, values):
+                component[chunk] = np.ma.filled(np.broadcast_to(value, component[chunk].shape), np.nan)
+        return out
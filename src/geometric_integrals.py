@@ -1,3 +1,5 @@
+import contextlib
+import typing as tp
 import numpy as np
 from . import data_collections as dc
 import numba as nb
@@ -80,35 +82,191 @@ def vertical_geometric_integral_vortex(x_p, X_j, phi_j, S_j, A, B, E):
 
 
 @nb.njit(cache=True)
-def compute_panel_geometric_integrals_source(panel_geometry: dc.PanelizedGeometry) -> (np.ndarray, np.ndarray):
-    I = np.empty((panel_geometry.S.size, panel_geometry.S.size))
-    J = np.empty((panel_geometry.S.size, panel_geometry.S.size))
+def compute_panel_integral_row(panel_geometry: dc.PanelizedGeometry, i: int, X: np.ndarray, Y: np.ndarray,
+                               cos_phi: np.ndarray, sin_phi: np.ndarray, I: np.ndarray, J: np.ndarray,
+                               K: np.ndarray, L: np.ndarray, source: bool, vortex: bool) -> None:
+    '''
+    Fills row i of the requested panel influence matrices I, J (source) and K, L (vortex). The terms A, B and E, the
+    logarithm and the arctangents of each pair are computed once, and the vortex integrals are not computed at all:
+    the C and D coefficients of normal_geometric_integral_vortex are those of tangential_geometric_integral_source,
+    and those of tangential_geometric_integral_vortex are those of normal_geometric_integral_source negated, so
+    K = J and L = -I off the diagonal (exactly, as only signs differ). The singular cases are resolved inline: the
+    diagonal is set directly and pairs where an integral is not finite (E = 0, B = 0, or a control point on the end
+    of a panel) contribute zero, as the masking of the separate kernels does. A row only writes to itself, so rows can
+    be filled in any order or in parallel with the same result.
+    '''
+    x_i = panel_geometry.xC[i]
+    y_i = panel_geometry.yC[i]
+    phi_i = panel_geometry.phi[i]
+    cos_phi_i = cos_phi[i]
+    sin_phi_i = sin_phi[i]
+    if source:
+        I[i, i] = np.pi
+    for j in range(panel_geometry.S.size):
+        if j == i:
+            continue
+        S_j = panel_geometry.S[j]
+        A = -(x_i - X[j]) * cos_phi[j] - (y_i - Y[j]) * sin_phi[j]
+        B = (x_i - X[j]) ** 2 + (y_i - Y[j]) ** 2
+        E_squared = B - A ** 2
+        if B == 0. or not E_squared > 0.:
+            continue
+        E = np.sqrt(E_squared)
+        log_term = np.log((S_j ** 2 + 2 * A * S_j + B) / B)
+        angle_term = np.arctan2((S_j + A), E) - np.arctan2(A, E)
+        if not np.isfinite(log_term):
+            continue
+        Cn = np.sin(phi_i - panel_geometry.phi[j])
+        Dn = -(x_i - X[j]) * sin_phi_i + (y_i - Y[j]) * cos_phi_i
+        I_ij = Cn * 0.5 * log_term + (Dn - A * Cn) / E * angle_term
+        Ct = -np.cos(phi_i - panel_geometry.phi[j])
+        Dt = (x_i - X[j]) * cos_phi_i + (y_i - Y[j]) * sin_phi_i
+        J_ij = Ct * 0.5 * log_term + (Dt - A * Ct) / E * angle_term
+        if source:
+            I[i, j] = I_ij
+            J[i, j] = J_ij
+        if vortex:
+            K[i, j] = J_ij
+            L[i, j] = -I_ij
+
+
+@nb.njit(cache=True)
+def allocate_panel_integrals(panel_geometry: dc.PanelizedGeometry, source: bool, vortex: bool):
+    n = panel_geometry.S.size
+    n_source = n if source else 0
+    n_vortex = n if vortex else 0
     X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
     Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
-    for i in range(panel_geometry.S.size):
-        A, B, E = compute_repeating_terms(panel_geometry.xC[i], panel_geometry.yC[i], X,
-                                          Y, panel_geometry.phi)
-        I[i, :] = normal_geometric_integral_source(panel_geometry.xC[i], panel_geometry.yC[i], X,
-                                                   Y, panel_geometry.phi[i], panel_geometry.phi, panel_geometry.S,
-                                                   A, B, E)
-
-        J[i, :] = tangential_geometric_integral_source(panel_geometry.xC[i], panel_geometry.yC[i], X,
-                                                       Y, panel_geometry.phi[i], panel_geometry.phi,
-                                                       panel_geometry.S,
-                                                       A, B, E)
-        mask = np.where(np.isnan(E) | np.isinf(E) | np.iscomplex(E), True, False)
-        I[i, mask] = 0.
-        J[i, mask] = 0.
+    return (X, Y, np.cos(panel_geometry.phi), np.sin(panel_geometry.phi), np.zeros((n_source, n_source)),
+            np.zeros((n_source, n_source)), np.zeros((n_vortex, n_vortex)), np.zeros((n_vortex, n_vortex)))
 
-    I = np.where(np.isnan(I) | np.isinf(I) | np.iscomplex(I), 0, I)
-    J = np.where(np.isnan(J) | np.isinf(J) | np.iscomplex(J), 0, J)
 
-    np.fill_diagonal(I, np.pi)
-    np.fill_diagonal(J, 0.)
+@nb.njit(cache=True)
+def compute_panel_geometric_integrals(panel_geometry: dc.PanelizedGeometry, source: bool = True,
+                                      vortex: bool = True) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    '''
+    Computes the requested subset of the panel influence matrices I, J (source) and K, L (vortex) in a single pass over
+    the panel pairs (see compute_panel_integral_row). Matrices that are not requested are returned empty, with shape
+    (0, 0).
+    '''
+    X, Y, cos_phi, sin_phi, I, J, K, L = allocate_panel_integrals(panel_geometry, source, vortex)
+    for i in range(panel_geometry.S.size):
+        compute_panel_integral_row(panel_geometry, i, X, Y, cos_phi, sin_phi, I, J, K, L, source, vortex)
+    return I, J, K, L
+
+
+@nb.njit(cache=True, parallel=True)
+def compute_panel_geometric_integrals_parallel(panel_geometry: dc.PanelizedGeometry, source: bool = True,
+                                               vortex: bool = True) -> (np.ndarray, np.ndarray, np.ndarray,
+                                                                        np.ndarray):
+    '''
+    compute_panel_geometric_integrals with the rows spread over the numba threads. Every row runs the same
+    arithmetic as in the serial kernel, so the matrices are bit-for-bit identical for any number of threads.
+    '''
+    X, Y, cos_phi, sin_phi, I, J, K, L = allocate_panel_integrals(panel_geometry, source, vortex)
+    for i in nb.prange(panel_geometry.S.size):
+        compute_panel_integral_row(panel_geometry, i, X, Y, cos_phi, sin_phi, I, J, K, L, source, vortex)
+    return I, J, K, L
+
+
+@contextlib.contextmanager
+def numba_threads(threads: tp.Optional[int]):
+    '''
+    Runs the parallel numba kernels called inside the context on the given number of threads, or on every numba
+    thread (NUMBA_NUM_THREADS) if threads is None, and restores the previous number on exit.
+    '''
+    if threads is not None and not 1 <= threads <= nb.config.NUMBA_NUM_THREADS:
+        raise ValueError(f"threads must be between 1 and NUMBA_NUM_THREADS ({nb.config.NUMBA_NUM_THREADS}) or None, "
+                         f"got {threads}")
+    previous = nb.get_num_threads()
+    nb.set_num_threads(threads or nb.config.NUMBA_NUM_THREADS)
+    try:
+        yield
+    finally:
+        nb.set_num_threads(previous)
+
+
+def assemble_panel_geometric_integrals(panel_geometry: dc.PanelizedGeometry, source: bool = True,
+                                       vortex: bool = True, threads: tp.Optional[int] = 1) \
+        -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Computes the requested panel influence matrices I, J, K and L on the given number of threads. One thread runs the
+    serial kernel, more run the parallel kernel, and None uses every numba thread (NUMBA_NUM_THREADS). The result
+    does not depend on the number of threads.
+    '''
+    if threads == 1:
+        return compute_panel_geometric_integrals(panel_geometry, source, vortex)
+    with numba_threads(threads):
+        return compute_panel_geometric_integrals_parallel(panel_geometry, source, vortex)
+
+
+def compute_panel_geometric_integrals_numpy(panel_geometry: dc.PanelizedGeometry, source: bool = True,
+                                            vortex: bool = True) \
+        -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    compute_panel_geometric_integrals with NumPy broadcasting over all the panel pairs at once. It needs no
+    compilation, which makes it the fastest path for a handful of panels, but it holds a few (N, N) temporaries.
+    '''
+    n = panel_geometry.S.size
+    cos_phi = np.cos(panel_geometry.phi)
+    sin_phi = np.sin(panel_geometry.phi)
+    X = panel_geometry.xC - panel_geometry.S / 2 * cos_phi
+    Y = panel_geometry.yC - panel_geometry.S / 2 * sin_phi
+    dx = panel_geometry.xC[:, None] - X
+    dy = panel_geometry.yC[:, None] - Y
+    S = panel_geometry.S
+    phi_difference = panel_geometry.phi[:, None] - panel_geometry.phi
+    with np.errstate(all='ignore'):
+        A = -dx * cos_phi - dy * sin_phi
+        B = dx ** 2 + dy ** 2
+        E = np.sqrt(B - A ** 2)
+        log_term = np.log((S ** 2 + 2 * A * S + B) / B)
+        angle_term = np.arctan2((S + A), E) - np.arctan2(A, E)
+        Cn = np.sin(phi_difference)
+        Dn = -dx * sin_phi[:, None] + dy * cos_phi[:, None]
+        I = Cn * 0.5 * log_term + (Dn - A * Cn) / E * angle_term
+        Ct = -np.cos(phi_difference)
+        Dt = dx * cos_phi[:, None] + dy * sin_phi[:, None]
+        J = Ct * 0.5 * log_term + (Dt - A * Ct) / E * angle_term
+    valid = (B != 0.) & (B - A ** 2 > 0.) & np.isfinite(log_term)
+    np.fill_diagonal(valid, False)
+    I = np.where(valid & np.isfinite(I), I, 0.)
+    J = np.where(valid & np.isfinite(J), J, 0.)
+    empty = np.zeros((0, 0))
+    K, L = (J, -I) if vortex else (empty, empty)
+    if source:
+        np.fill_diagonal(I, np.pi)
+        return I, J, K.copy() if vortex else K, L
+    return empty, empty, K, L
 
+
+@nb.njit(cache=True)
+def compute_panel_geometric_integrals_source(panel_geometry: dc.PanelizedGeometry) -> (np.ndarray, np.ndarray):
+    I, J, K, L = compute_panel_geometric_integrals(panel_geometry, True, False)
     return I, J
 
 
+@nb.njit(cache=True)
+def compute_point_geometric_integrals_source(x_p: float, y_p: float, X_j: float, Y_j: float, cos_phi_j: float,
+                                             sin_phi_j: float, S_j: float) -> (float, float):
+    '''
+    Computes the grid integrals Mxpj and Mypj of a single point and panel, the scalar counterparts of
+    horizontal_geometric_integral_source and vertical_geometric_integral_source. Integrals that are not finite are
+    zero. The vortex integrals follow as Nxpj = -Mypj and Nypj = Mxpj (see compute_grid_geometric_integrals_vortex).
+    '''
+    A = -(x_p - X_j) * cos_phi_j - (y_p - Y_j) * sin_phi_j
+    B = (x_p - X_j) ** 2 + (y_p - Y_j) ** 2
+    E_squared = B - A ** 2
+    if B == 0. or not E_squared > 0.:
+        return 0., 0.
+    E = np.sqrt(E_squared)
+    log_term = 0.5 * np.log((S_j ** 2 + 2 * A * S_j + B) / B)
+    angle_term = (np.arctan2((S_j + A), E) - np.arctan2(A, E)) / E
+    M_xpj = -cos_phi_j * log_term + ((x_p - X_j) + A * cos_phi_j) * angle_term
+    M_ypj = -sin_phi_j * log_term + ((y_p - Y_j) + A * sin_phi_j) * angle_term
+    return (M_xpj if np.isfinite(M_xpj) else 0.), (M_ypj if np.isfinite(M_ypj) else 0.)
+
+
 @nb.njit(cache=True)
 def compute_grid_geometric_integrals_source(panel_geometry: dc.PanelizedGeometry, grid_x: np.ndarray, grid_y: np.ndarray):
     Ixpj = np.empty((grid_y.size, grid_x.size, panel_geometry.S.size))
@@ -136,54 +294,16 @@ def compute_grid_geometric_integrals_source(panel_geometry: dc.PanelizedGeometry
 
 @nb.njit(cache=True)
 def compute_panel_geometric_integrals_vortex(panel_geometry: dc.PanelizedGeometry) -> (np.ndarray, np.ndarray):
-    K = np.empty((panel_geometry.S.size, panel_geometry.S.size))
-    L = np.empty((panel_geometry.S.size, panel_geometry.S.size))
-    X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
-    Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
-    for i in range(panel_geometry.S.size):
-        A, B, E = compute_repeating_terms(panel_geometry.xC[i], panel_geometry.yC[i], X,
-                                          Y, panel_geometry.phi)
-        K[i, :] = normal_geometric_integral_vortex(panel_geometry.xC[i], panel_geometry.yC[i], X,
-                                                   Y, panel_geometry.phi[i], panel_geometry.phi, panel_geometry.S,
-                                                   A, B, E)
-
-        L[i, :] = tangential_geometric_integral_vortex(panel_geometry.xC[i], panel_geometry.yC[i], X,
-                                                       Y, panel_geometry.phi[i], panel_geometry.phi,
-                                                       panel_geometry.S,
-                                                       A, B, E)
-        mask = np.where(np.isnan(E) | np.isinf(E) | np.iscomplex(E), True, False)
-        K[i, mask] = 0.
-        L[i, mask] = 0.
-
-    K = np.where(np.isnan(K) | np.isinf(K) | np.iscomplex(K), 0, K)
-    L = np.where(np.isnan(L) | np.isinf(L) | np.iscomplex(L), 0, L)
-
-    np.fill_diagonal(K, 0.)
-    np.fill_diagonal(L, 0)
-
+    I, J, K, L = compute_panel_geometric_integrals(panel_geometry, False, True)
     return K, L
 
 @nb.njit(cache=True)
 def compute_grid_geometric_integrals_vortex(panel_geometry: dc.PanelizedGeometry, grid_x: np.ndarray, grid_y: np.ndarray):
-    Nxpj = np.empty((grid_y.size, grid_x.size, panel_geometry.S.size))
-    Nypj = np.empty((grid_y.size, grid_x.size, panel_geometry.S.size))
-    X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
-    Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
-    for i in range(grid_x.size):
-        for j in range(grid_y.size):
-            A, B, E = compute_repeating_terms(grid_x[i], grid_y[j], X,
-                                              Y, panel_geometry.phi)
-
-            N_xpj = horizontal_geometric_integral_vortex(grid_y[j], Y,panel_geometry.phi, panel_geometry.S,
-                                                         A, B, E)
-            N_ypj = vertical_geometric_integral_vortex(grid_x[i], X,  panel_geometry.phi, panel_geometry.S,
-                                                       A, B, E)
-            mask_N_xpj = np.where(np.isnan(N_xpj))
-            mask_N_ypj = np.where(np.isnan(N_ypj))
-            N_xpj[mask_N_xpj] = 0.
-            N_ypj[mask_N_ypj] = 0.
-            Nxpj[j, i], Nypj[j, i] = N_xpj, N_ypj
-
-    Nxpj = np.where(np.isnan(Nxpj) | np.isinf(Nxpj) | np.iscomplex(Nxpj), 0, Nxpj)
-    Nypj = np.where(np.isnan(Nypj) | np.isinf(Nypj) | np.iscomplex(Nypj), 0, Nypj)
-    return Nxpj, Nypj
\ No newline at end of file
+    '''
+    The vortex grid integrals follow from the source ones: the C and D coefficients of
+    horizontal_geometric_integral_vortex are those of vertical_geometric_integral_source negated, and those of
+    vertical_geometric_integral_vortex are those of horizontal_geometric_integral_source, so Nxpj = -Mypj and
+    Nypj = Mxpj.
+    '''
+    Mxpj, Mypj = compute_grid_geometric_integrals_source(panel_geometry, grid_x, grid_y)
+    return -Mypj, Mxpj
@@ -0,0 +1,150 @@
+import os
+import typing as tp
+
+import numba as nb
+import numpy as np
+
+from . import data_collections as dc
+from . import geometric_integrals as gi
+from .flow_field import check_dtype
+from .panel_treecode import grid_inside_polygon
+
+
+# The largest influence matrix a GridOperator assembles unless it is given a larger memory budget, in bytes.
+OPERATOR_MEMORY_BUDGET = 2 ** 31
+# The influence matrix is assembled in blocks of grid rows of about this many bytes.
+OPERATOR_BLOCK_SIZE = 2 ** 26
+
+
+@nb.njit(cache=True, parallel=True)
+def compute_grid_influence_matrix(panel_geometry: dc.PanelizedGeometry, grid_x: np.ndarray, grid_y: np.ndarray,
+                                  inside: np.ndarray, matrix: np.ndarray) -> None:
+    '''
+    Fills matrix, of shape (grid_y.size * grid_x.size, panels) and complex64 or complex128, with the complex influence
+    matrix C = Mxpj - i Mypj, with the rows in the order of the flattened (grid_y.size, grid_x.size) grid. Since the
+    vortex integrals are Nxpj = -Mypj and Nypj = Mxpj, the complex velocity u - iv induced by source strengths lam and
+    vortex strengths gamma is C @ (lam + i gamma) / (2 pi). The rows of points inside the body are zero.
+    '''
+    n = panel_geometry.S.size
+    cos_phi = np.cos(panel_geometry.phi)
+    sin_phi = np.sin(panel_geometry.phi)
+    X = panel_geometry.xC - panel_geometry.S / 2 * cos_phi
+    Y = panel_geometry.yC - panel_geometry.S / 2 * sin_phi
+    for j in nb.prange(grid_y.size):
+        for i in range(grid_x.size):
+            row = j * grid_x.size + i
+            if inside[j, i]:
+                matrix[row, :] = 0
+                continue
+            for k in range(n):
+                M_xpj, M_ypj = gi.compute_point_geometric_integrals_source(grid_x[i], grid_y[j], X[k], Y[k],
+                                                                           cos_phi[k], sin_phi[k],
+                                                                           panel_geometry.S[k])
+                matrix[row, k] = complex(M_xpj, -M_ypj)
+
+
+class GridOperator:
+    '''
+    The linear map from panel strengths to the velocity on a fixed grid around a fixed body.
+
+    The grid integrals Mxpj, Mypj, Nxpj and Nypj only depend on the geometry and the grid, so they are assembled once
+    into a single complex matrix (see compute_grid_influence_matrix) and every new solution for the source strengths
+    lam and vortex strengths gamma, at any angle of attack or free stream speed, gives u and v on the grid with one
+    matrix-vector product. The matrix can be stored in single precision (dtype=np.float32), which halves its size,
+    and saved to and loaded from disk. It is assembled directly in that precision, a block of grid rows at a time,
+    and a ValueError is raised before anything is allocated if it would take more than memory_budget bytes.
+
+    Attributes
+    ----------
+
+    x, y : np.ndarray
+    The 1-D coordinates spanning the grid.
+
+    inside : np.ndarray
+    Which points of the grid, of shape (y.size, x.size), are inside the body.
+
+    matrix : np.ndarray
+    The complex influence matrix, of shape (y.size * x.size, number of panels).
+
+    dtype : np.dtype
+    The real precision of the matrix (float64 or float32).
+
+    Methods
+    -------
+
+    velocity(lam, gamma, free_stream_velocity, AoA)
+    Returns u and v on the grid, of shape (y.size, x.size).
+
+    save(filename, compressed)
+    Saves the operator to a .npz file.
+
+    load(filename)
+    Loads an operator saved with save().
+
+    '''
+
+    def __init__(self, panel_geometry: dc.PanelizedGeometry, x: np.ndarray, y: np.ndarray,
+                 dtype: tp.Union[str, type, np.dtype] = np.float64, memory_budget: int = OPERATOR_MEMORY_BUDGET):
+        self.dtype = check_dtype(dtype)
+        self.x = np.ascontiguousarray(x, dtype=np.float64).ravel()
+        self.y = np.ascontiguousarray(y, dtype=np.float64).ravel()
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+        n = panel_geometry.S.size
+        size = self.x.size * self.y.size * n * complex_dtype.itemsize
+        if size > memory_budget:
+            raise ValueError(f"A grid operator for {self.y.size} x {self.x.size} points and {n} panels takes "
+                             f"{size / 2 ** 30:.1f} GiB, more than the memory budget of {memory_budget / 2 ** 30:.1f} "
+                             f"GiB. Use dtype=np.float32 or a larger memory_budget, or evaluate the grid velocity "
+                             f"matrix-free with evaluate_grid_velocity (method='treecode' for large grids)")
+
+        X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
+        Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
+        polygon = np.column_stack((np.append(X, X[0]), np.append(Y, Y[0])))
+        self.inside = grid_inside_polygon(self.x, self.y, polygon)
+        self.matrix = np.empty((self.y.size * self.x.size, n), dtype=complex_dtype)
+        block = max(1, OPERATOR_BLOCK_SIZE // max(1, self.x.size * n * complex_dtype.itemsize))
+        for start in range(0, self.y.size, block):
+            end = min(start + block, self.y.size)
+            compute_grid_influence_matrix(panel_geometry, self.x, self.y[start:end], self.inside[start:end],
+                                          self.matrix[start * self.x.size:end * self.x.size])
+
+    @property
+    def number_of_panels(self) -> int:
+        return self.matrix.shape[1]
+
+    def velocity(self, lam: tp.Optional[np.ndarray] = None, gamma: tp.Union[None, float, np.ndarray] = None,
+                 free_stream_velocity: float = 1., AoA: float = 0.) -> tp.Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the velocity on the grid induced by source panels of strengths lam and vortex panels of strengths
+        gamma (a single value for the source vortex panel method, or one per panel) in a free stream at the angle of
+        attack AoA in degrees. Either strength may be None. Points inside the body are zero.
+        '''
+        strength = np.zeros(self.number_of_panels, dtype=self.matrix.dtype)
+        if lam is not None:
+            strength += np.asarray(lam)
+        if gamma is not None:
+            strength += 1j * np.broadcast_to(np.asarray(gamma, dtype=float), (self.number_of_panels,))
+        w = self.matrix @ (strength / (2 * np.pi))
+        u = (w.real + free_stream_velocity * np.cos(AoA * np.pi / 180)).reshape(self.y.size, self.x.size)
+        v = (-w.imag + free_stream_velocity * np.sin(AoA * np.pi / 180)).reshape(self.y.size, self.x.size)
+        u[self.inside] = 0.
+        v[self.inside] = 0.
+        return u, v
+
+    def save(self, filename: tp.Union[str, os.PathLike], compressed: bool = False) -> None:
+        '''
+        Saves the operator to a .npz file, deflated if compressed is True.
+        '''
+        save = np.savez_compressed if compressed else np.savez
+        save(filename, x=self.x, y=self.y, inside=self.inside, matrix=self.matrix)
+
+    @classmethod
+    def load(cls, filename: tp.Union[str, os.PathLike]) -> 'GridOperator':
+        with np.load(filename) as data:
+            operator = cls.__new__(cls)
+            operator.x = data['x']
+            operator.y = data['y']
+            operator.inside = data['inside']
+            operator.matrix = data['matrix']
+        operator.dtype = np.dtype(operator.matrix.real.dtype)
+        return operator
@@ -0,0 +1,120 @@
+import typing as tp
+
+import numba as nb
+import numpy as np
+
+from . import data_collections as dc
+from . import geometric_integrals as gi
+from .panel_treecode import grid_inside_polygon
+
+
+@nb.njit(cache=True, parallel=True)
+def compute_grid_velocity_panels(panel_geometry: dc.PanelizedGeometry, grid_x: np.ndarray, grid_y: np.ndarray,
+                                 lam: np.ndarray, gamma: np.ndarray, u_inf: float,
+                                 v_inf: float) -> (np.ndarray, np.ndarray):
+    '''
+    Computes the velocity induced on the grid spanned by grid_x and grid_y by source panels of strengths lam and vortex
+    panels of strengths gamma (either may be empty) in a free stream (u_inf, v_inf), and returns u and v of shape
+    (grid_y.size, grid_x.size). Points inside the body (see grid_inside_polygon) are zero.
+
+    The geometric integrals Mxpj, Mypj (source) and Nxpj, Nypj (vortex) of each point are contracted with the
+    strengths as they are computed instead of being stored, so the memory is O(grid + panels) rather than
+    O(grid * panels), and the rows of the grid are spread over the numba threads. Integrals that are not finite
+    contribute zero, as in compute_grid_geometric_integrals_source and compute_grid_geometric_integrals_vortex.
+    '''
+    n = panel_geometry.S.size
+    source = lam.size > 0
+    vortex = gamma.size > 0
+    X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
+    Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
+    polygon = np.empty((n + 1, 2))
+    polygon[:-1, 0] = X
+    polygon[:-1, 1] = Y
+    polygon[-1, 0] = X[0]
+    polygon[-1, 1] = Y[0]
+    cos_phi = np.cos(panel_geometry.phi)
+    sin_phi = np.sin(panel_geometry.phi)
+    inside = grid_inside_polygon(grid_x, grid_y, polygon)
+    u = np.zeros((grid_y.size, grid_x.size))
+    v = np.zeros((grid_y.size, grid_x.size))
+    for j in nb.prange(grid_y.size):
+        for i in range(grid_x.size):
+            x_p = grid_x[i]
+            y_p = grid_y[j]
+            if inside[j, i]:
+                continue
+            source_u, source_v, vortex_u, vortex_v = 0., 0., 0., 0.
+            for k in range(n):
+                # The vortex integrals are Nxpj = -Mypj and Nypj = Mxpj (see compute_grid_geometric_integrals_vortex)
+                M_xpj, M_ypj = gi.compute_point_geometric_integrals_source(x_p, y_p, X[k], Y[k], cos_phi[k],
+                                                                           sin_phi[k], panel_geometry.S[k])
+                if source:
+                    source_u += lam[k] * M_xpj
+                    source_v += lam[k] * M_ypj
+                if vortex:
+                    vortex_u -= gamma[k] * M_ypj
+                    vortex_v += gamma[k] * M_xpj
+            u[j, i] = (source_u - vortex_u) / (2 * np.pi) + u_inf
+            v[j, i] = (source_v - vortex_v) / (2 * np.pi) + v_inf
+    return u, v
+
+
+def grid_inside_polygon_numpy(grid_x: np.ndarray, grid_y: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    '''
+    grid_inside_polygon with NumPy: the crossings of every row with the edges are found at once and each row is then
+    sorted and searched.
+    '''
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    y = grid_y[:, None]
+    crosses = (np.minimum(y1, y2) < y) & (y <= np.maximum(y1, y2)) & (y1 != y2)
+    with np.errstate(all='ignore'):
+        crossings = np.where(crosses, (y - y1) * (x2 - x1) / (y2 - y1) + x1, np.nan)
+    inside = np.zeros((grid_y.size, grid_x.size), dtype=bool)
+    for j in np.flatnonzero(crosses.any(axis=1)):
+        row = np.sort(crossings[j][crosses[j]])
+        inside[j] = (row.size - np.searchsorted(row, grid_x)) % 2 == 1
+    return inside
+
+
+def compute_grid_velocity_panels_numpy(panel_geometry: dc.PanelizedGeometry, grid_x: np.ndarray, grid_y: np.ndarray,
+                                       lam: np.ndarray, gamma: np.ndarray, u_inf: float, v_inf: float,
+                                       memory_budget: int = 2 ** 26) -> tp.Tuple[np.ndarray, np.ndarray]:
+    '''
+    compute_grid_velocity_panels with NumPy broadcasting over blocks of grid rows and all the panels, each block
+    holding about memory_budget bytes of temporaries. It needs no compilation, which makes it the fastest path for
+    small grids and few panels.
+    '''
+    n = panel_geometry.S.size
+    cos_phi = np.cos(panel_geometry.phi)
+    sin_phi = np.sin(panel_geometry.phi)
+    X = panel_geometry.xC - panel_geometry.S / 2 * cos_phi
+    Y = panel_geometry.yC - panel_geometry.S / 2 * sin_phi
+    S = panel_geometry.S
+    inside = grid_inside_polygon_numpy(grid_x, grid_y, np.column_stack((np.append(X, X[0]), np.append(Y, Y[0]))))
+    lam = lam if lam.size else np.zeros(n)
+    gamma = gamma if gamma.size else np.zeros(n)
+    u = np.empty((grid_y.size, grid_x.size))
+    v = np.empty((grid_y.size, grid_x.size))
+    rows = max(1, memory_budget // (16 * 8 * max(1, grid_x.size * n)))
+    for first in range(0, grid_y.size, rows):
+        dx = grid_x[None, :, None] - X
+        dy = grid_y[first:first + rows, None, None] - Y
+        with np.errstate(all='ignore'):
+            A = -dx * cos_phi - dy * sin_phi
+            B = dx ** 2 + dy ** 2
+            E_squared = B - A ** 2
+            E = np.sqrt(E_squared)
+            log_term = 0.5 * np.log((S ** 2 + 2 * A * S + B) / B)
+            angle_term = (np.arctan2((S + A), E) - np.arctan2(A, E)) / E
+            M_xpj = -cos_phi * log_term + (dx + A * cos_phi) * angle_term
+            M_ypj = -sin_phi * log_term + (dy + A * sin_phi) * angle_term
+        valid = (B != 0.) & (E_squared > 0.)
+        M_xpj = np.where(valid & np.isfinite(M_xpj), M_xpj, 0.)
+        M_ypj = np.where(valid & np.isfinite(M_ypj), M_ypj, 0.)
+        # The vortex integrals are Nxpj = -Mypj and Nypj = Mxpj (see compute_grid_geometric_integrals_vortex)
+        u[first:first + rows] = (M_xpj @ lam + M_ypj @ gamma) / (2 * np.pi) + u_inf
+        v[first:first + rows] = (M_ypj @ lam - M_xpj @ gamma) / (2 * np.pi) + v_inf
+    u[inside] = 0.
+    v[inside] = 0.
+    return u, v
@@ -0,0 +1,203 @@
+import copy
+import typing as tp
+from collections import OrderedDict
+from itertools import repeat
+
+import numpy as np
+
+from . import backends as bk
+from . import flow_field as ff
+
+# Default memory allowed for the cached contributions of the individual flows, in bytes.
+DEFAULT_CACHE_BUDGET = 2 ** 28
+# Incremental updates accumulate roundoff in the running total, so it is rebuilt from scratch after this many of them.
+DEFAULT_REFRESH_INTERVAL = 1000
+
+
+class TrackedFlow(tp.NamedTuple):
+    flow: tp.Any
+    snapshot: tp.Any
+    count: int
+
+
+class IncrementalField:
+    '''
+    Keeps a quantity of a flow field up to date on a fixed grid as its flows are added, removed or modified.
+
+    The field keeps a running total of the contributions of the flows and a snapshot of the parameters of every flow
+    it has added to the total. On every evaluation the flows of the flow field are compared with their snapshots, so
+    that changing a field of an elementary flow, or adding it to or removing it from the list of flows, is detected
+    automatically. Only the contributions of the flows that changed are subtracted and added again, which costs one or
+    two flow evaluations instead of one per flow.
+
+    The contributions of recently changed flows are kept in a least-recently-used cache bounded by cache_budget bytes.
+    The old contribution of a flow that is not cached is recomputed from its snapshot. The number of flows masked at
+    each point is counted, so points uncovered when a singularity moves away become valid again.
+
+    Attributes
+    ----------
+
+    flow_field : FlowField
+    The flow field whose flows are tracked. Its singularity policy, backend and dtype are used for the evaluations,
+    the grid and the running total.
+
+    x : np.ndarray
+    The x-coordinates of the grid.
+
+    y : np.ndarray
+    The y-coordinates of the grid.
+
+    quantity : str
+    The quantity evaluated on the grid ("velocity", "stream_function", "velocity_potential" or "flow_state").
+
+    cache_budget : int
+    The memory allowed for the cached contributions, in bytes.
+
+    refresh_interval : int
+    The number of incremental flow updates after which the total is rebuilt from scratch.
+
+    Methods
+    -------
+
+    evaluate()
+    Brings the total up to date with the flows of the flow field and returns it.
+
+    update()
+    Brings the total up to date and returns the number of flows whose contribution was recomputed.
+
+    refresh()
+    Rebuilds the total from scratch.
+
+    '''
+
+    def __init__(self, flow_field: ff.FlowField, x: np.ndarray, y: np.ndarray, quantity: str = 'velocity',
+                 cache_budget: int = DEFAULT_CACHE_BUDGET, refresh_interval: int = DEFAULT_REFRESH_INTERVAL):
+        ff.check_quantity(quantity)
+        self.flow_field = flow_field
+        self.x, self.y = np.broadcast_arrays(*flow_field.as_grid(np.asarray(x), np.asarray(y)))
+        self.quantity = quantity
+        self.cache_budget = cache_budget
+        self.refresh_interval = refresh_interval
+
+        self._tracked: tp.Dict[int, TrackedFlow] = {}
+        self._cache: tp.OrderedDict[int, tp.Tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._total: tp.Optional[np.ndarray] = None
+        self._invalid_count: tp.Optional[np.ndarray] = None
+        self._singularity_policy: tp.Optional[str] = None
+        self._updates_since_refresh = 0
+
+    @property
+    def singularity_policy(self) -> str:
+        return self.flow_field.get_singularity_policy(self.x)
+
+    def evaluate(self) -> tp.Union[np.ndarray, tp.Tuple[np.ndarray, ...]]:
+        '''
+        Brings the total up to date with the flows of the flow field and returns it in the same form as the
+        corresponding FlowField method. Points where any flow is masked are masked or NaN according to the singularity
+        policy.
+        '''
+        self.update()
+        invalid = self._invalid_count > 0
+        if self._singularity_policy == 'mask':
+            values = [np.ma.masked_array(component, invalid) for component in self._total]
+        else:
+            values = [np.where(invalid, np.nan, component) for component in self._total]
+        return tuple(values) if len(values) > 1 else values[0]
+
+    def update(self) -> int:
+        current = self.current_flows()
+        changed = self.changed(current)
+        if self._total is None or self._singularity_policy != self.singularity_policy or \
+                self._updates_since_refresh + len(changed) > self.refresh_interval:
+            self.refresh()
+            return len(self._tracked)
+
+        for key in changed:
+            if key in self._tracked:
+                tracked = self._tracked.pop(key)
+                self.accumulate(self.pop_contribution(key, tracked.snapshot), -tracked.count)
+            if key in current:
+                flow, count = current[key]
+                contribution = self.contribution(flow)
+                self.accumulate(contribution, count)
+                self.cache(key, contribution)
+                self._tracked[key] = TrackedFlow(flow, copy.deepcopy(flow), count)
+        self._updates_since_refresh += len(changed)
+        return len(changed)
+
+    def refresh(self) -> None:
+        '''
+        Rebuilds the total from scratch on the backend of the flow field, evaluating the flows in chunks small enough
+        for their contributions to fit within the cache budget.
+        '''
+        self._singularity_policy = self.singularity_policy
+        self._tracked.clear()
+        self._cache.clear()
+        self._total = np.zeros((ff.QUANTITY_OUTPUTS[self.quantity],) + self.x.shape, dtype=self.flow_field.dtype)
+        self._invalid_count = np.zeros(self.x.shape, dtype=np.int64)
+        self._updates_since_refresh = 0
+
+        current = list(self.current_flows().items())
+        backend = self.flow_field.get_backend(self.x)
+        chunk_size = max(1, self.cache_budget // max(self.bytes_per_contribution(), 1))
+        for start in range(0, len(current), chunk_size):
+            chunk = current[start:start + chunk_size]
+            contributions = backend.starmap(bk.evaluate_flow, zip([flow for _, (flow, _) in chunk],
+                                                                  repeat(self.quantity), repeat(self.x),
+                                                                  repeat(self.y), repeat(self._singularity_policy)))
+            for (key, (flow, count)), contribution in zip(chunk, contributions):
+                contribution = self.split_invalid(contribution)
+                self.accumulate(contribution, count)
+                self.cache(key, contribution)
+                self._tracked[key] = TrackedFlow(flow, copy.deepcopy(flow), count)
+
+    def current_flows(self) -> tp.Dict[int, tp.Tuple[tp.Any, int]]:
+        current = {}
+        for flow in self.flow_field.flows:
+            count = current[id(flow)][1] + 1 if id(flow) in current else 1
+            current[id(flow)] = (flow, count)
+        return current
+
+    def changed(self, current: tp.Dict[int, tp.Tuple[tp.Any, int]]) -> tp.List[int]:
+        '''
+        Returns the keys of the flows that were added, removed or modified since they were last added to the total.
+        '''
+        removed = [key for key in self._tracked if key not in current]
+        modified = [key for key, (flow, count) in current.items()
+                    if key not in self._tracked or self._tracked[key].count != count
+                    or self._tracked[key].snapshot != flow]
+        return removed + modified
+
+    def contribution(self, flow) -> tp.Tuple[np.ndarray, np.ndarray]:
+        return self.split_invalid(bk.evaluate_flow(flow, self.quantity, self.x, self.y, self._singularity_policy))
+
+    def split_invalid(self, contribution) -> tp.Tuple[np.ndarray, np.ndarray]:
+        '''
+        Splits the contribution of a flow into plain values, with zeros at the masked points, and a mask of the points
+        where any component is masked or NaN.
+        '''
+        components = contribution if isinstance(contribution, tuple) else (contribution,)
+        values = np.stack([np.broadcast_to(np.ma.filled(component, np.nan), self.x.shape)
+                           for component in components]).astype(self.x.dtype, copy=False)
+        invalid = np.isnan(values)
+        values[invalid] = 0.
+        return values, invalid.any(axis=0)
+
+    def accumulate(self, contribution: tp.Tuple[np.ndarray, np.ndarray], count: int) -> None:
+        values, invalid = contribution
+        self._total += count * values
+        self._invalid_count += count * invalid
+
+    def pop_contribution(self, key: int, snapshot) -> tp.Tuple[np.ndarray, np.ndarray]:
+        if key in self._cache:
+            return self._cache.pop(key)
+        return self.contribution(snapshot)
+
+    def cache(self, key: int, contribution: tp.Tuple[np.ndarray, np.ndarray]) -> None:
+        self._cache[key] = contribution
+        self._cache.move_to_end(key)
+        while self._cache and len(self._cache) * self.bytes_per_contribution() > self.cache_budget:
+            self._cache.popitem(last=False)
+
+    def bytes_per_contribution(self) -> int:
+        return (self.x.dtype.itemsize * ff.QUANTITY_OUTPUTS[self.quantity] + 1) * self.x.size
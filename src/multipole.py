@@ -0,0 +1,229 @@
+import typing as tp
+
+import numba as nb
+import numpy as np
+
+from . import elementary_flows as ef
+from . import flow_batch as fb
+
+# The expansions are truncated after this many terms whatever the tolerance.
+MAX_EXPANSION_ORDER = 64
+
+
+def expansion_order(tolerance: float, theta: float) -> int:
+    '''
+    Returns the number of terms needed for the truncation error of a far-field expansion to fall below the relative
+    tolerance. An expansion is only used at points whose distance from the expansion centre is at least 1 / theta
+    times the cluster radius, so the k-th term is bounded by theta ** k relative to the first.
+    '''
+    if not 0 < theta < 1:
+        raise ValueError("theta must be between 0 and 1")
+    if not 0 < tolerance < 1:
+        raise ValueError("tolerance must be between 0 and 1")
+    return int(min(MAX_EXPANSION_ORDER, max(2, np.ceil(np.log(tolerance) / np.log(theta)) + 2)))
+
+
+def build_quadtree(x: np.ndarray, y: np.ndarray, leaf_size: int) -> tp.Tuple[np.ndarray, ...]:
+    '''
+    Builds a quadtree over the points (x, y) in breadth-first order so that the children of a node are contiguous.
+
+    Returns the permutation that sorts the points by node, and per node the box centre, the range of sorted points it
+    holds and the range of its children.
+    '''
+    order = np.arange(x.size)
+    centre_x, centre_y, half_size, start, end, child_start, child_count = [], [], [], [], [], [], []
+
+    if x.size:
+        half = 0.5 * max(x.max() - x.min(), y.max() - y.min(), 1e-12)
+        centre_x.append(0.5 * (x.max() + x.min()))
+        centre_y.append(0.5 * (y.max() + y.min()))
+        half_size.append(half)
+        start.append(0)
+        end.append(x.size)
+        smallest = half * 1e-12
+
+    node = 0
+    while node < len(start):
+        child_start.append(len(start))
+        child_count.append(0)
+        members = order[start[node]:end[node]]
+        if members.size <= leaf_size or half_size[node] < smallest:
+            node += 1
+            continue
+
+        quadrant = (x[members] >= centre_x[node]).astype(np.int64) + 2 * (y[members] >= centre_y[node])
+        sorting = np.argsort(quadrant, kind='stable')
+        order[start[node]:end[node]] = members[sorting]
+        bounds = np.searchsorted(quadrant[sorting], np.arange(5))
+        half = 0.5 * half_size[node]
+        for q in range(4):
+            if bounds[q + 1] > bounds[q]:
+                centre_x.append(centre_x[node] + (half if q & 1 else -half))
+                centre_y.append(centre_y[node] + (half if q & 2 else -half))
+                half_size.append(half)
+                start.append(start[node] + bounds[q])
+                end.append(start[node] + bounds[q + 1])
+                child_count[node] += 1
+        node += 1
+
+    return (order, np.array(centre_x, dtype=float), np.array(centre_y, dtype=float),
+            np.array(start, dtype=np.int64), np.array(end, dtype=np.int64),
+            np.array(child_start, dtype=np.int64), np.array(child_count, dtype=np.int64))
+
+
+@nb.njit(cache=True)
+def compute_multipole_coefficients(site_x, site_y, mask_tol, q, g, k, centre_x, centre_y, start, end, order):
+    '''
+    Computes the far-field expansion of the complex velocity u - iv of every node,
+
+        W(z) = sum_n beta_n / (z - z_c) ** (n + 1),
+
+    where a source or vortex of complex strength a = q + ig at offset d from the centre adds a * d ** n to beta_n
+    and a doublet of strength k adds -n * k * d ** (n - 1). Also returns the radius of each node about its centre and
+    the square root of the largest mask tolerance of its sites, the distance within which a singularity policy
+    applies.
+    '''
+    coefficients = np.zeros((centre_x.size, order), dtype=np.complex128)
+    radius = np.zeros(centre_x.size)
+    mask_radius = np.zeros(centre_x.size)
+    for node in range(centre_x.size):
+        for j in range(start[node], end[node]):
+            d = complex(site_x[j] - centre_x[node], site_y[j] - centre_y[node])
+            radius[node] = max(radius[node], abs(d))
+            mask_radius[node] = max(mask_radius[node], np.sqrt(mask_tol[j]))
+            a = complex(q[j], g[j])
+            power = 1. + 0.j
+            previous = 0. + 0.j
+            for n in range(order):
+                coefficients[node, n] += a * power - n * k[j] * previous
+                previous = power
+                power *= d
+    return coefficients, radius, mask_radius
+
+
+@nb.njit(cache=True, parallel=True)
+def evaluate_treecode(x, y, site_x, site_y, mask_tol, q, g, k, centre_x, centre_y, radius, mask_radius, start, end,
+                      child_start, child_count, coefficients, theta, horizontal_vel, vertical_vel, policy):
+    '''
+    Evaluates the velocity at the points (x, y) by walking the tree from the root. Nodes that are well separated from
+    a point (radius + mask_radius < theta * distance) are evaluated from their expansion, leaves that are not are
+    summed directly. Points within the mask tolerance of a site are never well separated from its nodes, so they
+    always reach the singularity policy, whose codes are those of flow_batch.superpose_sites.
+    '''
+    u = np.empty(x.size)
+    v = np.empty(x.size)
+    order = coefficients.shape[1]
+    for p in nb.prange(x.size):
+        w = 0. + 0.j
+        u_p = horizontal_vel
+        v_p = vertical_vel
+        stack = np.empty(4 * 64, dtype=np.int64)
+        top = 0
+        if centre_x.size:
+            stack[0] = 0
+            top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            dz = complex(x[p] - centre_x[node], y[p] - centre_y[node])
+            if radius[node] + mask_radius[node] < theta * abs(dz):
+                t = 1. / dz
+                acc = coefficients[node, order - 1]
+                for n in range(order - 2, -1, -1):
+                    acc = acc * t + coefficients[node, n]
+                w += acc * t
+            elif child_count[node] == 0:
+                for j in range(start[node], end[node]):
+                    dx = x[p] - site_x[j]
+                    dy = y[p] - site_y[j]
+                    r_squared = dx * dx + dy * dy
+                    if policy == 1:
+                        r_squared = max(r_squared, mask_tol[j])
+                    elif policy == 2:
+                        r_squared += mask_tol[j]
+                    elif r_squared < mask_tol[j]:
+                        u_p = np.nan
+                        v_p = np.nan
+                        continue
+                    inv_r_squared = 1. / r_squared
+                    doublet = k[j] * inv_r_squared * inv_r_squared
+                    u_p += (q[j] * dx + g[j] * dy) * inv_r_squared - doublet * (dx - dy) * (dx + dy)
+                    v_p += (q[j] * dy - g[j] * dx) * inv_r_squared - doublet * 2 * dx * dy
+            else:
+                for c in range(child_start[node], child_start[node] + child_count[node]):
+                    stack[top] = c
+                    top += 1
+        u[p] = u_p + w.real
+        v[p] = v_p - w.imag
+    return u, v
+
+
+class Treecode:
+    '''
+    A Barnes-Hut style treecode for the velocity induced by many sources, vortices and doublets.
+
+    The singularities of a FlowBatch are grouped by position and sorted into a quadtree. Every node carries a
+    complex-variable multipole expansion of the velocity it induces, truncated so that its relative error is below
+    the tolerance. A point is evaluated from the expansions of the nodes that are well separated from it and by direct
+    summation over the leaves that are not, which costs O(points * log(singularities)) instead of
+    O(points * singularities).
+
+    Attributes
+    ----------
+
+    batch : FlowBatch
+    The flows evaluated by the treecode.
+
+    tolerance : float
+    The relative truncation error allowed in each far-field expansion.
+
+    theta : float
+    The opening angle. A node is approximated at points further than radius / theta from its centre.
+
+    leaf_size : int
+    The largest number of sites held by a leaf.
+
+    Methods
+    -------
+
+    velocity(x, y, singularity_policy)
+    Returns the velocity at the points (x, y).
+
+    '''
+
+    def __init__(self, batch: fb.FlowBatch, tolerance: float = 1e-6, theta: float = 0.5, leaf_size: int = 32):
+        self.batch = batch
+        self.tolerance = tolerance
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.order = expansion_order(tolerance, theta)
+
+        sites = batch.sites()
+        order, centre_x, centre_y, start, end, child_start, child_count = build_quadtree(sites.x_pos, sites.y_pos,
+                                                                                         leaf_size)
+        self.site_x = sites.x_pos[order]
+        self.site_y = sites.y_pos[order]
+        self.mask_tol = sites.mask_tol[order]
+        self.q = sites.source_strength[order] / (2 * np.pi)
+        self.g = sites.circulation[order] / (2 * np.pi)
+        self.k = sites.kappa[order] / (2 * np.pi)
+        self.tree = (centre_x, centre_y, start, end, child_start, child_count)
+        self.coefficients, self.radius, self.mask_radius = compute_multipole_coefficients(
+            self.site_x, self.site_y, self.mask_tol, self.q, self.g, self.k, centre_x, centre_y, start, end, self.order)
+
+    def velocity(self, x: np.ndarray, y: np.ndarray,
+                 singularity_policy: str = 'nan') -> tp.Tuple[np.ndarray, np.ndarray]:
+        if singularity_policy not in fb.POLICY_CODES:
+            raise ValueError(f"Unknown singularity policy '{singularity_policy}'. "
+                             f"Expected one of {ef.SINGULARITY_POLICIES}")
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        centre_x, centre_y, start, end, child_start, child_count = self.tree
+        # The 'core' policy offsets every squared distance by the mask tolerance, so an expansion is only used where
+        # that offset is below the tolerance relative to the squared distance.
+        mask_radius = self.mask_radius / np.sqrt(self.tolerance) if singularity_policy == 'core' else self.mask_radius
+        u, v = evaluate_treecode(np.ascontiguousarray(x).ravel(), np.ascontiguousarray(y).ravel(), self.site_x,
+                                 self.site_y, self.mask_tol, self.q, self.g, self.k, centre_x, centre_y, self.radius,
+                                 mask_radius, start, end, child_start, child_count, self.coefficients, self.theta,
+                                 self.batch.horizontal_vel, self.batch.vertical_vel,
+                                 fb.POLICY_CODES[singularity_policy])
+        return u.reshape(x.shape), v.reshape(x.shape)
@@ -0,0 +1,226 @@
+import typing as tp
+
+import numba as nb
+import numpy as np
+
+from . import data_collections as dc
+from . import geometric_integrals as gi
+from .multipole import expansion_order
+
+
+def build_panel_tree(number_of_panels: int, leaf_size: int) -> tp.Tuple[np.ndarray, ...]:
+    '''
+    Builds a binary tree over the panels in breadth-first order. Panels are ordered along the body, so every node
+    holds a contiguous run of panels, split in half until a run has at most leaf_size panels.
+
+    Returns per node the range of panels it holds and the range of its children.
+    '''
+    start, end, child_start, child_count = [0], [number_of_panels], [], []
+    node = 0
+    while node < len(start):
+        child_start.append(len(start))
+        child_count.append(0)
+        if end[node] - start[node] > leaf_size:
+            middle = (start[node] + end[node]) // 2
+            start.extend((start[node], middle))
+            end.extend((middle, end[node]))
+            child_count[node] = 2
+        node += 1
+    return (np.array(start, dtype=np.int64), np.array(end, dtype=np.int64), np.array(child_start, dtype=np.int64),
+            np.array(child_count, dtype=np.int64))
+
+
+@nb.njit(cache=True)
+def compute_panel_multipole_coefficients(X, Y, S, cos_phi, sin_phi, strength, start, end, order):
+    '''
+    Computes the far-field expansion of the complex velocity u - iv induced by the panels of every node,
+
+        W(z) = sum_n beta_n / (z - z_c) ** (n + 1),
+
+    about the centre z_c of the box bounding its panels. A panel from z_a to z_b = z_a + S e with e = exp(i phi) and
+    complex strength a = (lambda + i gamma) / (2 pi) per unit length adds the exact moment
+    a * integral_0^S (z_a + t e - z_c) ** n dt = a * ((z_b - z_c) ** (n + 1) - (z_a - z_c) ** (n + 1)) / ((n + 1) e)
+    to beta_n. Also returns the centres and the radius of each node about its centre.
+    '''
+    number_of_nodes = start.size
+    coefficients = np.zeros((number_of_nodes, order), dtype=np.complex128)
+    centre_x = np.zeros(number_of_nodes)
+    centre_y = np.zeros(number_of_nodes)
+    radius = np.zeros(number_of_nodes)
+    for node in range(number_of_nodes):
+        x_min, x_max, y_min, y_max = np.inf, -np.inf, np.inf, -np.inf
+        for j in range(start[node], end[node]):
+            for x_end, y_end in ((X[j], Y[j]), (X[j] + S[j] * cos_phi[j], Y[j] + S[j] * sin_phi[j])):
+                x_min, x_max = min(x_min, x_end), max(x_max, x_end)
+                y_min, y_max = min(y_min, y_end), max(y_max, y_end)
+        centre_x[node] = 0.5 * (x_min + x_max)
+        centre_y[node] = 0.5 * (y_min + y_max)
+        for j in range(start[node], end[node]):
+            e = complex(cos_phi[j], sin_phi[j])
+            d_a = complex(X[j] - centre_x[node], Y[j] - centre_y[node])
+            d_b = d_a + S[j] * e
+            radius[node] = max(radius[node], abs(d_a), abs(d_b))
+            power_a = d_a
+            power_b = d_b
+            for n in range(order):
+                coefficients[node, n] += strength[j] * (power_b - power_a) / ((n + 1) * e)
+                power_a *= d_a
+                power_b *= d_b
+    return coefficients, centre_x, centre_y, radius
+
+
+@nb.njit(cache=True)
+def grid_inside_polygon(grid_x: np.ndarray, grid_y: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    '''
+    Returns which points of the grid spanned by grid_x and grid_y are inside the polygon, with the crossing rule of
+    point_in_polygon but one scanline per row: the crossings of each row with the edges are found once and a point is
+    inside when an odd number of them lie at or to the right of it. This costs O(rows * edges + points) instead of
+    O(points * edges).
+    '''
+    inside = np.zeros((grid_y.size, grid_x.size), dtype=np.bool_)
+    n = len(polygon)
+    crossings = np.empty(n)
+    for j in range(grid_y.size):
+        y = grid_y[j]
+        count = 0
+        x1, y1 = polygon[0]
+        for k in range(n + 1):
+            x2, y2 = polygon[k % n]
+            if min(y1, y2) < y <= max(y1, y2) and y1 != y2:
+                crossings[count] = (y - y1) * (x2 - x1) / (y2 - y1) + x1
+                count += 1
+            x1, y1 = x2, y2
+        if count == 0:
+            continue
+        row = np.sort(crossings[:count])
+        for i in range(grid_x.size):
+            inside[j, i] = (count - np.searchsorted(row, grid_x[i])) % 2 == 1
+    return inside
+
+
+@nb.njit(cache=True, parallel=True)
+def evaluate_panel_treecode(grid_x, grid_y, inside, X, Y, S, cos_phi, sin_phi, lam, gamma, centre_x, centre_y, radius,
+                            start, end, child_start, child_count, coefficients, theta, u_inf, v_inf):
+    '''
+    Evaluates the velocity on the grid by walking the panel tree from the root. Nodes that are well separated from a
+    point (radius < theta * distance) are evaluated from their expansion, leaves that are not are summed with the
+    exact panel integrals of compute_point_geometric_integrals_source. Points inside the body are zero.
+    '''
+    u = np.zeros((grid_y.size, grid_x.size))
+    v = np.zeros((grid_y.size, grid_x.size))
+    source = lam.size > 0
+    vortex = gamma.size > 0
+    order = coefficients.shape[1]
+    for j in nb.prange(grid_y.size):
+        stack = np.empty(2 * 64, dtype=np.int64)
+        for i in range(grid_x.size):
+            if inside[j, i]:
+                continue
+            x_p = grid_x[i]
+            y_p = grid_y[j]
+            w = 0. + 0.j
+            source_u, source_v, vortex_u, vortex_v = 0., 0., 0., 0.
+            stack[0] = 0
+            top = 1
+            while top > 0:
+                top -= 1
+                node = stack[top]
+                dz = complex(x_p - centre_x[node], y_p - centre_y[node])
+                if radius[node] < theta * abs(dz):
+                    t = 1. / dz
+                    acc = coefficients[node, order - 1]
+                    for n in range(order - 2, -1, -1):
+                        acc = acc * t + coefficients[node, n]
+                    w += acc * t
+                elif child_count[node] == 0:
+                    for k in range(start[node], end[node]):
+                        M_xpj, M_ypj = gi.compute_point_geometric_integrals_source(x_p, y_p, X[k], Y[k], cos_phi[k],
+                                                                                   sin_phi[k], S[k])
+                        if source:
+                            source_u += lam[k] * M_xpj
+                            source_v += lam[k] * M_ypj
+                        if vortex:
+                            vortex_u -= gamma[k] * M_ypj
+                            vortex_v += gamma[k] * M_xpj
+                else:
+                    for c in range(child_start[node], child_start[node] + child_count[node]):
+                        stack[top] = c
+                        top += 1
+            u[j, i] = (source_u - vortex_u) / (2 * np.pi) + w.real + u_inf
+            v[j, i] = (source_v - vortex_v) / (2 * np.pi) - w.imag + v_inf
+    return u, v
+
+
+class PanelTreecode:
+    '''
+    A treecode for the velocity induced on a grid by constant-strength source and vortex panels.
+
+    The panels are grouped in a binary tree of contiguous runs along the body. Every node carries a complex-variable
+    multipole expansion of the velocity induced by its panels, from their exact moments, truncated so that its
+    relative error is below the tolerance. A grid point is evaluated from the expansions of the nodes that are well
+    separated from it and with the exact closed-form panel integrals over the leaves that are not, which costs
+    O(points * log(panels)) instead of O(points * panels).
+
+    Attributes
+    ----------
+
+    panel_geometry : PanelizedGeometry
+    The panels.
+
+    lam : np.ndarray
+    The source strength of each panel (empty if there are no source panels).
+
+    gamma : np.ndarray
+    The vortex strength of each panel (empty if there are no vortex panels).
+
+    tolerance : float
+    The relative truncation error allowed in each far-field expansion.
+
+    theta : float
+    The opening angle. A node is approximated at points further than radius / theta from its centre.
+
+    leaf_size : int
+    The largest number of panels held by a leaf.
+
+    Methods
+    -------
+
+    velocity(x, y, free_stream_velocity, AoA)
+    Returns the velocity on the grid spanned by x and y, of shape (y.size, x.size).
+
+    '''
+
+    def __init__(self, panel_geometry: dc.PanelizedGeometry, lam: np.ndarray, gamma: np.ndarray,
+                 tolerance: float = 1e-6, theta: float = 0.5, leaf_size: int = 8):
+        self.panel_geometry = panel_geometry
+        self.lam = np.asarray(lam, dtype=np.float64)
+        self.gamma = np.asarray(gamma, dtype=np.float64)
+        self.tolerance = tolerance
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.order = expansion_order(tolerance, theta)
+
+        n = panel_geometry.S.size
+        self.cos_phi = np.cos(panel_geometry.phi)
+        self.sin_phi = np.sin(panel_geometry.phi)
+        self.X = panel_geometry.xC - panel_geometry.S / 2 * self.cos_phi
+        self.Y = panel_geometry.yC - panel_geometry.S / 2 * self.sin_phi
+        self.polygon = np.column_stack((np.append(self.X, self.X[0]), np.append(self.Y, self.Y[0])))
+        strength = ((self.lam if self.lam.size else np.zeros(n))
+                    + 1j * (self.gamma if self.gamma.size else np.zeros(n))) / (2 * np.pi)
+
+        start, end, child_start, child_count = build_panel_tree(n, leaf_size)
+        self.coefficients, centre_x, centre_y, self.radius = compute_panel_multipole_coefficients(
+            self.X, self.Y, panel_geometry.S, self.cos_phi, self.sin_phi, strength, start, end, self.order)
+        self.tree = (centre_x, centre_y, start, end, child_start, child_count)
+
+    def velocity(self, x: np.ndarray, y: np.ndarray, free_stream_velocity: float = 1.,
+                 AoA: float = 0.) -> tp.Tuple[np.ndarray, np.ndarray]:
+        x = np.ascontiguousarray(x, dtype=np.float64).ravel()
+        y = np.ascontiguousarray(y, dtype=np.float64).ravel()
+        centre_x, centre_y, start, end, child_start, child_count = self.tree
+        return evaluate_panel_treecode(x, y, grid_inside_polygon(x, y, self.polygon), self.X, self.Y,
+                                       self.panel_geometry.S, self.cos_phi, self.sin_phi, self.lam, self.gamma,
+                                       centre_x, centre_y, self.radius, start, end, child_start, child_count,
+                                       self.coefficients, self.theta, free_stream_velocity * np.cos(AoA * np.pi / 180),
+                                       free_stream_velocity * np.sin(AoA * np.pi / 180))
@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
 from src.data_collections import Geometry, PanelizedGeometry
 import typing as tp
@@ -52,3 +53,17 @@ def plot_flow_from_velocities(X: np.ndarray, Y: np.ndarray, U: np.ndarray, V: np
     plt.xlim(kwargs.get("X_NEG_LIMIT"), kwargs.get("X_POS_LIMIT"))
     plt.ylim(kwargs.get("Y_NEG_LIMIT"), kwargs.get("Y_POS_LIMIT"))
     return fig
+
+
+def plot_streamlines(streamlines: tp.Sequence[np.ndarray], **kwargs) -> plt.Figure:
+    fig = plt.figure(figsize=kwargs.get("FIGURE_SIZE", (12, 12)), dpi=kwargs.get("DPI", 200))
+    ax = fig.gca()
+    ax.add_collection(LineCollection(streamlines, colors=kwargs.get("STREAMLINE_COLOR", 'b')))
+    for line in streamlines:
+        if len(line) > 2:  # Arrow at the middle of each streamline
+            middle = len(line) // 2
+            ax.annotate('', xy=line[middle], xytext=line[middle - 1],
+                        arrowprops=dict(arrowstyle='-|>', color=kwargs.get("STREAMLINE_COLOR", 'b')))
+    plt.xlim(kwargs.get("X_NEG_LIMIT"), kwargs.get("X_POS_LIMIT"))
+    plt.ylim(kwargs.get("Y_NEG_LIMIT"), kwargs.get("Y_POS_LIMIT"))
+    return fig
@@ -1,5 +1,8 @@
-from . import geometric_integrals as gi
 from . import data_collections as dc
+from . import panel_treecode as pt
+from . import grid_operator as go
+from . import dispatch
+import typing as tp
 import numpy as np
 from functools import partial
 from itertools import product
@@ -28,29 +31,59 @@ def point_in_polygon(x: float, y: float, polygon: np.ndarray) -> bool:
     return inside
 
 
-@nb.njit(cache=True)
-def compute_grid_velocity_source(panelized_geometry: dc.PanelizedGeometry, x: np.ndarray, y: np.ndarray,
-                                 lam: np.ndarray,
-                                 free_stream_velocity: float = 1., AoA: float = 0.) -> (np.ndarray, np.ndarray):
-    Mxpj, Mypj = gi.compute_grid_geometric_integrals_source(panel_geometry=panelized_geometry, grid_x=x, grid_y=y)
-    X = panelized_geometry.xC - panelized_geometry.S / 2 * np.cos(panelized_geometry.phi)
-    Y = panelized_geometry.yC - panelized_geometry.S / 2 * np.sin(panelized_geometry.phi)
-    X = np.append(X, X[0])
-    X = np.append(Y, Y[0])
-    shape = np.vstack((X, Y)).T
-    u = np.zeros((len(x), len(y)))
-    v = np.zeros((len(x), len(y)))
-    for i in range(len(x)):
-        for j in range(len(y)):
-            if point_in_polygon(x=float(x[i]), y=float(y[j]), polygon=shape):
-                u[j, i] = 0
-                v[j, i] = 0
-            else:
-                u[j, i] = np.sum(lam * Mxpj[j, i] / (2 * np.pi)) + free_stream_velocity * np.cos(AoA * np.pi / 180)
-                v[j, i] = np.sum(lam * Mypj[j, i] / (2 * np.pi)) + free_stream_velocity * np.sin(AoA * np.pi / 180)
+GRID_VELOCITY_METHODS = ('direct', 'treecode')
+
+
+def evaluate_grid_velocity(panelized_geometry: dc.PanelizedGeometry, x: np.ndarray, y: np.ndarray, lam: np.ndarray,
+                           gamma: np.ndarray, free_stream_velocity: float = 1., AoA: float = 0.,
+                           method: str = 'direct', tolerance: float = 1e-6) -> (np.ndarray, np.ndarray):
+    '''
+    Computes the velocity on the grid spanned by x and y induced by source panels of strengths lam and vortex panels of
+    strengths gamma (either may be empty) in a free stream, either exactly ("direct", with the implementation chosen by
+    dispatch.dispatch_grid_velocity) or with a PanelTreecode whose far-field expansions are truncated at the relative
+    tolerance ("treecode").
+    '''
+    if method not in GRID_VELOCITY_METHODS:
+        raise ValueError(f"Unknown grid velocity method '{method}'. Expected one of {GRID_VELOCITY_METHODS}")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if method == 'treecode':
+        return pt.PanelTreecode(panelized_geometry, lam, gamma, tolerance).velocity(x, y, free_stream_velocity, AoA)
+    (u, v), _ = dispatch.dispatch_grid_velocity(panelized_geometry, x, y, lam, gamma,
+                                                free_stream_velocity * np.cos(AoA * np.pi / 180),
+                                                free_stream_velocity * np.sin(AoA * np.pi / 180))
     return u, v
 
 
+def compute_grid_velocity_error(panelized_geometry: dc.PanelizedGeometry, x: np.ndarray, y: np.ndarray,
+                                lam: np.ndarray, gamma: np.ndarray, free_stream_velocity: float = 1., AoA: float = 0.,
+                                tolerance: float = 1e-6) -> dc.GridVelocityErrorReport:
+    '''
+    Evaluates the grid velocity with both methods of evaluate_grid_velocity and reports the error of the treecode
+    against the direct method and the time each took.
+    '''
+    times = []
+    results = []
+    for method in ('direct', 'treecode'):
+        start = time.perf_counter()
+        results.append(evaluate_grid_velocity(panelized_geometry, x, y, lam, gamma, free_stream_velocity, AoA, method,
+                                              tolerance))
+        times.append(time.perf_counter() - start)
+    (u_direct, v_direct), (u_treecode, v_treecode) = results
+    error = np.hypot(u_treecode - u_direct, v_treecode - v_direct)
+    speed = np.hypot(u_direct, v_direct)
+    return dc.GridVelocityErrorReport(max_error=float(np.max(error)), rms_error=float(np.sqrt(np.mean(error ** 2))),
+                                      relative_error=float(np.max(error) / np.max(speed)), direct_time=times[0],
+                                      treecode_time=times[1])
+
+
+def compute_grid_velocity_source(panelized_geometry: dc.PanelizedGeometry, x: np.ndarray, y: np.ndarray,
+                                 lam: np.ndarray, free_stream_velocity: float = 1., AoA: float = 0.,
+                                 method: str = 'direct', tolerance: float = 1e-6) -> (np.ndarray, np.ndarray):
+    return evaluate_grid_velocity(panelized_geometry, x, y, lam, np.empty(0), free_stream_velocity, AoA, method,
+                                  tolerance)
+
+
 @nb.njit(cache=True)
 def compute_source_strengths(panelized_geometry: dc.PanelizedGeometry, V: float, I: np.ndarray) -> np.ndarray:
     A = I
@@ -59,6 +92,35 @@ def compute_source_strengths(panelized_geometry: dc.PanelizedGeometry, V: float,
     return lam
 
 
+def compute_free_stream_basis(panelized_geometry: dc.PanelizedGeometry, V: float) -> np.ndarray:
+    '''
+    Returns the no-penetration right-hand sides -2 pi V cos(beta) at angles of attack of 0 and 90 degrees as the two
+    columns of an array. Since beta = delta - AoA, the right-hand side at any angle of attack is
+    cos(AoA) * basis[:, 0] + sin(AoA) * basis[:, 1].
+    '''
+    return -V * 2 * np.pi * np.column_stack((np.cos(panelized_geometry.delta), np.sin(panelized_geometry.delta)))
+
+
+def solve_polar(A: np.ndarray, basis: np.ndarray, AoAs: np.ndarray) -> np.ndarray:
+    '''
+    Solves A x = cos(AoA) * basis[:, 0] + sin(AoA) * basis[:, 1] for every angle of attack in AoAs [deg]. A is
+    factorized once to solve for both columns of the basis, and the solutions are combined with the same weights, so
+    the cost barely grows with the number of angles. Returns one solution per row.
+    '''
+    solutions = np.linalg.solve(A, basis)
+    AoAs = np.atleast_1d(np.asarray(AoAs, dtype=np.float64)) * (np.pi / 180)
+    return np.outer(np.cos(AoAs), solutions[:, 0]) + np.outer(np.sin(AoAs), solutions[:, 1])
+
+
+def compute_source_strengths_polar(panelized_geometry: dc.PanelizedGeometry, V: float, AoAs: np.ndarray,
+                                   I: np.ndarray) -> np.ndarray:
+    '''
+    Returns the source strengths at every angle of attack in AoAs [deg], of shape (AoAs.size, panels), with a single
+    factorization of I. The angle of attack the geometry was panelized at is not used.
+    '''
+    return solve_polar(I, compute_free_stream_basis(panelized_geometry, V), AoAs)
+
+
 @nb.njit(cache=True)
 def compute_panel_velocities_source(panelized_geometry: dc.PanelizedGeometry, lam: np.ndarray, V: float, I: np.ndarray,
                                     J: np.ndarray) -> (np.ndarray, np.ndarray):
@@ -71,16 +133,26 @@ def compute_panel_velocities_source(panelized_geometry: dc.PanelizedGeometry, la
 
 
 def run_source_panel_method(panelized_geometry: dc.PanelizedGeometry, V: float, AoA: float, x,
-                            y) -> dc.SourcePanelMethodResults:
-    I, J = gi.compute_panel_geometric_integrals_source(panel_geometry=panelized_geometry)
+                            y, grid_operator: tp.Optional[go.GridOperator] = None,
+                            threads: tp.Optional[int] = None) -> dc.SourcePanelMethodResults:
+    n = panelized_geometry.S.size
+    (I, J, _, _), panel_choice = dispatch.dispatch_panel_integrals(
+        panelized_geometry, source=True, vortex=False,
+        choice=None if threads is None else dispatch.forced_choice('panel_integrals', n ** 2, threads))
     lam = compute_source_strengths(panelized_geometry=panelized_geometry, V=V, I=I)
     V_normal, V_tangential = compute_panel_velocities_source(panelized_geometry=panelized_geometry, lam=lam, V=V, I=I,
                                                              J=J)
-    u, v = compute_grid_velocity_source(panelized_geometry=panelized_geometry, x=x, y=y, lam=lam,
-                                        free_stream_velocity=V,
-                                        AoA=AoA)
+    if grid_operator is not None:
+        u, v = grid_operator.velocity(lam=lam, free_stream_velocity=V, AoA=AoA)
+        grid_choice = None
+    else:
+        (u, v), grid_choice = dispatch.dispatch_grid_velocity(
+            panelized_geometry, x, y, lam, np.empty(0), V * np.cos(AoA * np.pi / 180), V * np.sin(AoA * np.pi / 180),
+            choice=None if threads is None else dispatch.forced_choice('grid_velocity', np.size(x) * np.size(y) * n,
+                                                                       threads))
 
     panel_results = dc.SourcePanelMethodResults(V_normal=V_normal, V_tangential=V_tangential,
                                                 Source_Strengths=lam, V_horizontal=u, V_vertical=v)
+    panel_results.metadata = dc.PanelMethodMetadata(panel_integrals=panel_choice, grid_velocity=grid_choice)
 
     return panel_results
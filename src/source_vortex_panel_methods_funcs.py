@@ -1,11 +1,13 @@
-from . import geometric_integrals as gi
-from .source_panel_methods_funcs import point_in_polygon
+import typing as tp
+from . import dispatch
+from . import grid_operator as go
+from .source_panel_methods_funcs import compute_free_stream_basis, evaluate_grid_velocity, solve_polar
 import src.data_collections as dc
 import numpy as np
 import numba as nb
 
 
-def compute_source_vortex_strengths(panelized_geometry, V, I, J, K, L):
+def assemble_source_vortex_system(I, J, K, L):
     np.fill_diagonal(I, np.pi)
     np.fill_diagonal(J, 0)
     np.fill_diagonal(K, 0)
@@ -18,6 +20,11 @@ def compute_source_vortex_strengths(panelized_geometry, V, I, J, K, L):
     kutta_condition[:-1] = J[0] + J[-1]
     kutta_condition[-1] = -np.sum(L[0] + L[-1]) + 2 * np.pi
     A[-1, :] = kutta_condition
+    return A
+
+
+def compute_source_vortex_strengths(panelized_geometry, V, I, J, K, L):
+    A = assemble_source_vortex_system(I, J, K, L)
     print('Shape of A:   ', A.shape)
     b = -np.cos(panelized_geometry.beta) * V * 2 * np.pi
     b = np.append(b, -V * 2 * np.pi * (np.sin(panelized_geometry.beta[0]) + np.sin(panelized_geometry.beta[-1])))
@@ -28,6 +35,24 @@ def compute_source_vortex_strengths(panelized_geometry, V, I, J, K, L):
     return lam, gamma
 
 
+def compute_source_vortex_strengths_polar(panelized_geometry: dc.PanelizedGeometry, V: float, AoAs: np.ndarray,
+                                          I: np.ndarray, J: np.ndarray, K: np.ndarray,
+                                          L: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns the source strengths, of shape (AoAs.size, panels), and the circulation, of shape (AoAs.size,), at every
+    angle of attack in AoAs [deg] with a single factorization of the system of compute_source_vortex_strengths. The
+    Kutta condition is linear in sin(beta) = sin(delta) cos(AoA) - cos(delta) sin(AoA), so its right-hand side is
+    combined like the others. Fills the diagonals of I, J, K and L like compute_source_vortex_strengths. The angle of
+    attack the geometry was panelized at is not used.
+    '''
+    delta = panelized_geometry.delta
+    kutta_basis = -V * 2 * np.pi * np.array([[np.sin(delta[0]) + np.sin(delta[-1]),
+                                              -np.cos(delta[0]) - np.cos(delta[-1])]])
+    basis = np.vstack((compute_free_stream_basis(panelized_geometry, V), kutta_basis))
+    solutions = solve_polar(assemble_source_vortex_system(I, J, K, L), basis, AoAs)
+    return solutions[:, :-1], solutions[:, -1]
+
+
 def compute_panel_velocities_source_vortex(panelized_geometry, lam, gamma, V, I, J, K, L):
     V_normal = np.empty(len(panelized_geometry.xC))
     V_tangential = np.empty(len(panelized_geometry.xC))
@@ -42,40 +67,35 @@ def compute_panel_velocities_source_vortex(panelized_geometry, lam, gamma, V, I,
 
 
 
-def compute_grid_velocity_source_vortex(panelized_geometry, x, y, lam, gamma, free_stream_velocity=1, AoA=0):
-    Mxpj, Mypj = gi.compute_grid_geometric_integrals_source(panel_geometry=panelized_geometry, grid_x=x, grid_y=y)
-    Nxpj, Nypj = gi.compute_grid_geometric_integrals_vortex(panelized_geometry, x, y)
-    X = panelized_geometry.xC - panelized_geometry.S / 2 * np.cos(panelized_geometry.phi)
-    Y = panelized_geometry.yC - panelized_geometry.S / 2 * np.sin(panelized_geometry.phi)
-    X = np.append(X, X[0])
-    Y = np.append(Y, Y[0])
-    shape = np.vstack((X, Y)).T
-    u = np.zeros((len(x), len(y)))
-    v = np.zeros((len(x), len(y)))
-    for i in range(len(x)):
-        for j in range(len(y)):
-            if point_in_polygon(float(x[i]), float(y[j]), shape):
-                u[j, i] = 0
-                v[j, i] = 0
-            else:
-                u[j, i] = -np.sum(gamma * Nxpj[j, i] / (2 * np.pi)) + np.sum(
-                    lam * Mxpj[j, i] / (2 * np.pi)) + free_stream_velocity * np.cos(AoA * np.pi / 180)
-                v[j, i] = -np.sum(gamma * Nypj[j, i] / (2 * np.pi)) + np.sum(
-                    lam * Mypj[j, i] / (2 * np.pi)) + free_stream_velocity * np.sin(AoA * np.pi / 180)
-    return u, v
+def compute_grid_velocity_source_vortex(panelized_geometry, x, y, lam, gamma, free_stream_velocity=1, AoA=0,
+                                        method='direct', tolerance=1e-6):
+    return evaluate_grid_velocity(panelized_geometry, x, y, lam, np.full(panelized_geometry.S.size, float(gamma)),
+                                  free_stream_velocity, AoA, method, tolerance)
 
 
 def run_source_vortex_panel_method(panelized_geometry: dc.PanelizedGeometry, V: float, AoA: float, x,
-                            y) -> dc.SourceVortexPanelMethodResults:
-    I, J = gi.compute_panel_geometric_integrals_source(panelized_geometry)
-    K, L = gi.compute_panel_geometric_integrals_vortex(panelized_geometry)
+                                   y, grid_operator: tp.Optional[go.GridOperator] = None,
+                                   threads: tp.Optional[int] = None) -> dc.SourceVortexPanelMethodResults:
+    n = panelized_geometry.S.size
+    (I, J, K, L), panel_choice = dispatch.dispatch_panel_integrals(
+        panelized_geometry, choice=None if threads is None else dispatch.forced_choice('panel_integrals', n ** 2,
+                                                                                         threads))
     lam, gamma = compute_source_vortex_strengths(panelized_geometry, V, I, J, K, L)
     V_normal, V_tangential = compute_panel_velocities_source_vortex(panelized_geometry, lam, gamma, V, I, J, K, L)
 
-    u, v = compute_grid_velocity_source_vortex(panelized_geometry, x, y, lam, gamma, V, AoA)
+    if grid_operator is not None:
+        u, v = grid_operator.velocity(lam, gamma, V, AoA)
+        grid_choice = None
+    else:
+        (u, v), grid_choice = dispatch.dispatch_grid_velocity(
+            panelized_geometry, x, y, lam, np.full(n, float(gamma)), V * np.cos(AoA * np.pi / 180),
+            V * np.sin(AoA * np.pi / 180),
+            choice=None if threads is None else dispatch.forced_choice('grid_velocity', np.size(x) * np.size(y) * n,
+                                                                       threads))
 
     panel_results = dc.SourceVortexPanelMethodResults(V_normal=V_normal, V_tangential=V_tangential,
                                                       Source_Strengths=lam, Circulation=gamma, V_horizontal=u,
                                                       V_vertical=v)
+    panel_results.metadata = dc.PanelMethodMetadata(panel_integrals=panel_choice, grid_velocity=grid_choice)
 
     return panel_results
@@ -0,0 +1,93 @@
+import typing as tp
+
+import numpy as np
+
+from . import streamlines as sl
+
+
+def newton_stagnation_points(velocity_and_derivative: tp.Callable, seeds: np.ndarray,
+                             bounds: tp.Tuple[float, float, float, float], tolerance: float = 1e-10,
+                             max_iterations: int = 50) -> np.ndarray:
+    '''
+    Runs Newton's iteration z <- z - W(z) / W'(z) on the complex velocity W = u - iv from every seed at once and
+    returns the points it converged to, one per converged seed. W is analytic away from the singularities, so its
+    zeros are the stagnation points and W' = d2w/dz2 is the exact Jacobian. velocity_and_derivative(z) returns both
+    W and W' from one evaluation. Each step is limited to a tenth of the bounds, and seeds that leave the bounds or
+    run into a singularity are dropped.
+    '''
+    x_min, x_max, y_min, y_max = bounds
+    size = max(x_max - x_min, y_max - y_min)
+    z = np.array(seeds, dtype=complex).ravel()
+    active = np.ones(z.size, dtype=bool)
+    converged = np.zeros(z.size, dtype=bool)
+
+    for _ in range(max_iterations):
+        index = np.flatnonzero(active)
+        if index.size == 0:
+            break
+        complex_velocity, derivative = velocity_and_derivative(z[index])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = complex_velocity / derivative
+        step = np.where(np.abs(step) > size / 10, step / np.abs(step) * size / 10, step)
+        z[index] -= step
+
+        finite = np.isfinite(z[index])
+        inside = ((z[index].real >= x_min) & (z[index].real <= x_max) & (z[index].imag >= y_min)
+                  & (z[index].imag <= y_max))
+        done = np.abs(step) <= tolerance * size
+        converged[index[done & finite & inside]] = True
+        active[index[done | ~finite | ~inside]] = False
+
+    return z[converged]
+
+
+def unique_points(z: np.ndarray, tolerance: float) -> np.ndarray:
+    '''
+    Merges the points closer than the tolerance, keeping the first of each cluster.
+    '''
+    kept = []
+    for point in z:
+        if all(abs(point - other) > tolerance for other in kept):
+            kept.append(point)
+    return np.array(kept, dtype=complex)
+
+
+def separatrix_directions(derivative: complex) -> tp.Tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns the unit directions (as complex numbers) in which the dividing streamlines leave and enter a stagnation
+    point. Near the point W = c (z - z0) with c = W'(z0), so the velocity u + iv = conj(c (z - z0)) is parallel to
+    the offset at the angles -arg(c) / 2 (outgoing) and -(arg(c) + pi) / 2 (incoming), each in both senses.
+    '''
+    angle = np.angle(derivative)
+    outgoing = np.exp(1j * (-angle / 2 + np.array([0., np.pi])))
+    incoming = np.exp(1j * (-(angle + np.pi) / 2 + np.array([0., np.pi])))
+    return outgoing, incoming
+
+
+def trace_dividing_streamlines(velocity: tp.Callable, stagnation_points: np.ndarray, derivatives: np.ndarray,
+                               bounds: tp.Tuple[float, float, float, float], offset: float = 1e-4,
+                               **kwargs) -> tp.List[np.ndarray]:
+    '''
+    Traces the dividing streamlines of the stagnation points z0 (a complex array) with velocity derivatives
+    W'(z0). Each streamline starts at offset times the size of the bounds from its stagnation point along a
+    separatrix direction, and is traced forwards when it leaves the point and backwards when it enters it, so every
+    returned polyline starts at the stagnation point. The keyword arguments are passed to streamlines.trace().
+    '''
+    x_min, x_max, y_min, y_max = bounds
+    offset = offset * max(x_max - x_min, y_max - y_min)
+    points, seeds, signs = [], [], []
+    for point, derivative in zip(stagnation_points, derivatives):
+        outgoing, incoming = separatrix_directions(derivative)
+        for direction, sign in zip(np.concatenate((outgoing, incoming)), (1., 1., -1., -1.)):
+            points.append(point)
+            seeds.append(point + offset * direction)
+            signs.append(sign)
+    points, seeds, signs = np.array(points, dtype=complex), np.array(seeds, dtype=complex), np.array(signs)
+
+    lines = [None] * len(seeds)
+    for sign in (1., -1.):
+        index = np.flatnonzero(signs == sign)
+        traced = sl.trace(velocity, seeds[index].real, seeds[index].imag, bounds, sign, **kwargs) if index.size else []
+        for i, line in zip(index, traced):
+            lines[i] = np.vstack(([[points[i].real, points[i].imag]], line))
+    return lines
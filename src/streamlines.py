@@ -0,0 +1,160 @@
+import typing as tp
+
+import numpy as np
+
+# Bogacki-Shampine 3(2) coefficients used to trace the streamlines with an adaptive step.
+BOGACKI_SHAMPINE_WEIGHTS = np.array([2 / 9, 1 / 3, 4 / 9, 0.])
+BOGACKI_SHAMPINE_ERROR = BOGACKI_SHAMPINE_WEIGHTS - np.array([7 / 24, 1 / 4, 1 / 3, 1 / 8])
+
+# Streamlines are stopped where the speed falls below this (stagnation points).
+MIN_SPEED = 1e-10
+
+
+def seed_grid(bounds: tp.Tuple[float, float, float, float], density: float = 1.) -> tp.Tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns seed points on a uniform grid over bounds = (x_min, x_max, y_min, y_max), 10 * density per side.
+    '''
+    number = max(2, int(10 * density))
+    x_min, x_max, y_min, y_max = bounds
+    x = x_min + (np.arange(number) + 0.5) * (x_max - x_min) / number
+    y = y_min + (np.arange(number) + 0.5) * (y_max - y_min) / number
+    X, Y = np.meshgrid(x, y)
+    return X.ravel(), Y.ravel()
+
+
+def sample_velocity(velocity: tp.Callable, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    u, v = velocity(x, y)
+    return (np.ma.filled(np.broadcast_to(u, x.shape), np.nan).astype(float),
+            np.ma.filled(np.broadcast_to(v, x.shape), np.nan).astype(float))
+
+
+def direction_field(velocity: tp.Callable, x: np.ndarray, y: np.ndarray, sign: np.ndarray,
+                    parametrization: str) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Returns the right-hand side of the streamline equations at the points (x, y) and a mask of the points where the
+    streamline has to stop. With the 'arc_length' parametrization the velocity is normalized, so the step is a length
+    and the tracer does not stall near stagnation points. With 'time' the lines are pathlines parametrized by time.
+    '''
+    u, v = sample_velocity(velocity, x, y)
+    speed = np.hypot(u, v)
+    stop = ~np.isfinite(speed) | (speed < MIN_SPEED)
+    scale = sign / np.where(stop, 1., speed) if parametrization == 'arc_length' else sign
+    return np.where(stop, 0., u * scale), np.where(stop, 0., v * scale), stop
+
+
+def trace(velocity: tp.Callable, seed_x: np.ndarray, seed_y: np.ndarray, bounds: tp.Tuple[float, float, float, float],
+          sign: float = 1., parametrization: str = 'arc_length', tolerance: float = 1e-4,
+          initial_step: tp.Optional[float] = None, max_step: tp.Optional[float] = None, max_steps: int = 2000,
+          max_length: float = np.inf) -> tp.List[np.ndarray]:
+    '''
+    Traces one streamline from every seed in one direction and returns them as (number of points, 2) arrays.
+
+    All the active seeds advance together, so each stage of a step is a single call of velocity(x, y) on a 1-D array
+    of points. Every seed has its own step, adapted with an embedded Bogacki-Shampine 3(2) pair to keep the local
+    error below the tolerance times the size of the bounds. A streamline stops when it leaves the bounds, reaches a
+    stagnation point or singularity, closes on itself, or exceeds max_steps or max_length.
+    '''
+    if parametrization not in ('arc_length', 'time'):
+        raise ValueError(f"Unknown parametrization '{parametrization}'. Expected 'arc_length' or 'time'")
+    x_min, x_max, y_min, y_max = bounds
+    size = max(x_max - x_min, y_max - y_min)
+    max_step = size / 50 if max_step is None else max_step
+    min_step = size * 1e-9
+    seed_x = np.asarray(seed_x, dtype=float).ravel()
+    seed_y = np.asarray(seed_y, dtype=float).ravel()
+    number_of_seeds = seed_x.size
+
+    points = np.full((max_steps + 1, number_of_seeds, 2), np.nan)
+    points[0, :, 0] = seed_x
+    points[0, :, 1] = seed_y
+    count = np.ones(number_of_seeds, dtype=np.int64)
+    x, y = seed_x.copy(), seed_y.copy()
+    step = np.full(number_of_seeds, size / 200 if initial_step is None else initial_step)
+    length = np.zeros(number_of_seeds)
+    active = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+
+    while np.any(active):
+        index = np.flatnonzero(active)
+        x0, y0, h = x[index], y[index], step[index]
+        signs = np.full(index.size, sign)
+
+        k1 = direction_field(velocity, x0, y0, signs, parametrization)
+        k2 = direction_field(velocity, x0 + 0.5 * h * k1[0], y0 + 0.5 * h * k1[1], signs, parametrization)
+        k3 = direction_field(velocity, x0 + 0.75 * h * k2[0], y0 + 0.75 * h * k2[1], signs, parametrization)
+        x1 = x0 + h * (BOGACKI_SHAMPINE_WEIGHTS[0] * k1[0] + BOGACKI_SHAMPINE_WEIGHTS[1] * k2[0]
+                       + BOGACKI_SHAMPINE_WEIGHTS[2] * k3[0])
+        y1 = y0 + h * (BOGACKI_SHAMPINE_WEIGHTS[0] * k1[1] + BOGACKI_SHAMPINE_WEIGHTS[1] * k2[1]
+                       + BOGACKI_SHAMPINE_WEIGHTS[2] * k3[1])
+        k4 = direction_field(velocity, x1, y1, signs, parametrization)
+        stages = (k1, k2, k3, k4)
+        error_x = h * sum(e * k[0] for e, k in zip(BOGACKI_SHAMPINE_ERROR, stages))
+        error_y = h * sum(e * k[1] for e, k in zip(BOGACKI_SHAMPINE_ERROR, stages))
+        error = np.hypot(error_x, error_y)
+
+        stopped = k1[2] | k2[2] | k3[2]
+        accepted = (error <= tolerance * size) | (h <= min_step)
+        factor = np.clip(0.9 * np.cbrt(tolerance * size / np.maximum(error, 1e-300)), 0.2, 5.)
+        step[index] = np.clip(h * factor, min_step, max_step)
+
+        done = index[stopped]
+        moved = accepted & ~stopped
+        index, x1, y1 = index[moved], x1[moved], y1[moved]
+        points[count[index], index, 0] = x1
+        points[count[index], index, 1] = y1
+        count[index] += 1
+        length[index] += np.hypot(x1 - x[index], y1 - y[index])
+        x[index], y[index] = x1, y1
+
+        active[done] = False
+        outside = (x1 < x_min) | (x1 > x_max) | (y1 < y_min) | (y1 > y_max)
+        # Closed streamlines stop once they are back within one step of their seed
+        closed = (length[index] > 4 * h[moved]) & (np.hypot(x1 - seed_x[index], y1 - seed_y[index]) < h[moved])
+        active[index[outside | closed | (count[index] > max_steps) | (length[index] >= max_length)]] = False
+
+    return [points[:n, i] for i, n in enumerate(count)]
+
+
+def trace_streamlines(velocity: tp.Callable, seed_x: np.ndarray, seed_y: np.ndarray,
+                      bounds: tp.Tuple[float, float, float, float], direction: str = 'both',
+                      **kwargs) -> tp.List[np.ndarray]:
+    '''
+    Traces the streamlines through the seeds forwards, backwards or in both directions, in which case the two halves
+    are joined at the seed. See trace() for the keyword arguments.
+    '''
+    if direction == 'forward':
+        return trace(velocity, seed_x, seed_y, bounds, 1., **kwargs)
+    if direction == 'backward':
+        return trace(velocity, seed_x, seed_y, bounds, -1., **kwargs)
+    if direction != 'both':
+        raise ValueError(f"Unknown direction '{direction}'. Expected 'forward', 'backward' or 'both'")
+    forward = trace(velocity, seed_x, seed_y, bounds, 1., **kwargs)
+    backward = trace(velocity, seed_x, seed_y, bounds, -1., **kwargs)
+    return [np.concatenate((b[::-1], f[1:])) for f, b in zip(forward, backward)]
+
+
+def thin_streamlines(streamlines: tp.Sequence[np.ndarray], bounds: tp.Tuple[float, float, float, float],
+                     density: float = 1., max_overlap: float = 0.5) -> tp.List[np.ndarray]:
+    '''
+    Drops the streamlines that mostly run through cells already covered by earlier ones, on a grid of 30 * density
+    cells per side, so that the kept streamlines are roughly evenly spaced as in plt.streamplot.
+    '''
+    number = max(2, int(30 * density))
+    x_min, x_max, y_min, y_max = bounds
+    occupied = np.zeros((number, number), dtype=bool)
+    cell = min(x_max - x_min, y_max - y_min) / number
+    kept = []
+    for line in streamlines:
+        if len(line) < 2:
+            continue
+        # Resample the line at half a cell so that no cell it crosses is skipped
+        distance = np.concatenate(([0.], np.cumsum(np.hypot(*np.diff(line, axis=0).T))))
+        samples = np.linspace(0, distance[-1], max(2, int(distance[-1] / cell * 2) + 1))
+        i = np.clip(((np.interp(samples, distance, line[:, 1]) - y_min) / (y_max - y_min) * number).astype(np.int64),
+                    0, number - 1)
+        j = np.clip(((np.interp(samples, distance, line[:, 0]) - x_min) / (x_max - x_min) * number).astype(np.int64),
+                    0, number - 1)
+        cells = np.unique(i * number + j)
+        if occupied.ravel()[cells].mean() <= max_overlap:
+            occupied.ravel()[cells] = True
+            kept.append(line)
+    return kept
@@ -0,0 +1,191 @@
+import dataclasses
+import typing as tp
+
+import numpy as np
+
+from . import data_collections as dc
+from . import elementary_flows as ef
+from . import flow_batch as fb
+from . import multipole as mpl
+
+# Dormand-Prince 5(4) coefficients used by the adaptive integrator. The induced velocity does not depend on time, so
+# the nodes are not needed.
+DORMAND_PRINCE_MATRIX = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0., 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+DORMAND_PRINCE_WEIGHTS = np.array([35 / 384, 0., 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0.])
+DORMAND_PRINCE_ERROR = DORMAND_PRINCE_WEIGHTS - np.array([5179 / 57600, 0., 7571 / 16695, 393 / 640,
+                                                          -92097 / 339200, 187 / 2100, 1 / 40])
+
+
+def direct_velocity(batch: fb.FlowBatch, x: np.ndarray, y: np.ndarray,
+                    singularity_policy: str) -> tp.Tuple[np.ndarray, np.ndarray]:
+    return batch.velocity(x, y, singularity_policy=singularity_policy)
+
+
+def treecode_velocity(batch: fb.FlowBatch, x: np.ndarray, y: np.ndarray, singularity_policy: str,
+                      tolerance: float = 1e-6, theta: float = 0.5,
+                      leaf_size: int = 32) -> tp.Tuple[np.ndarray, np.ndarray]:
+    return mpl.Treecode(batch, tolerance, theta, leaf_size).velocity(x, y, singularity_policy=singularity_policy)
+
+
+# Induced-velocity kernels. A kernel is called as kernel(batch, x, y, singularity_policy) and returns (u, v).
+KERNELS = {
+    'direct': direct_velocity,
+    'treecode': treecode_velocity,
+}
+
+
+class VortexDynamics:
+    '''
+    Advances the sources, vortices and doublets of a list of flows in the velocity they induce on each other plus the
+    free stream of any uniform flows.
+
+    The singularities are compiled into a FlowBatch whose positions are the state of the system. The velocity of every
+    singularity is evaluated in one call of the induced-velocity kernel, either by direct summation (O(N ** 2)) or by
+    the multipole treecode (O(N log N)). The kernel is evaluated with a regularizing singularity policy ('core' by
+    default), under which a singularity induces no velocity on itself or on singularities placed at the same point.
+
+    Attributes
+    ----------
+
+    flows : list
+    The flows of the system. Uniform flows stay fixed; the positions of the other flows are updated by update_flows().
+
+    kernel : str or callable
+    The induced-velocity kernel, 'direct', 'treecode' or a callable kernel(batch, x, y, singularity_policy).
+
+    singularity_policy : str
+    The singularity policy used by the kernel, 'core' or 'clamp'.
+
+    kernel_kwargs : dict
+    Extra keyword arguments of the kernel, such as the tolerance of the treecode.
+
+    Methods
+    -------
+
+    induced_velocity(x, y)
+    Returns the velocity of each singularity when the singularities are at the positions (x, y).
+
+    step_rk4(x, y, dt)
+    Advances the positions by one classical Runge-Kutta step.
+
+    step_rk45(x, y, dt, rtol, atol)
+    Attempts one adaptive Dormand-Prince step and returns the new positions and the error estimate.
+
+    integrate(times, dt, method, rtol, atol, filename)
+    Integrates the system and returns the positions of the singularities at each output time.
+
+    update_flows(x, y)
+    Moves the flows to the positions (x, y).
+
+    '''
+
+    def __init__(self, flows: tp.Sequence[ef.ElementaryFlow], kernel: tp.Union[str, tp.Callable] = 'direct',
+                 singularity_policy: str = 'core', **kernel_kwargs):
+        if singularity_policy not in ('core', 'clamp'):
+            raise ValueError("The singularity policy of the dynamics must be 'core' or 'clamp' so that the "
+                             "singularities induce no velocity on themselves")
+        if isinstance(kernel, str) and kernel not in KERNELS:
+            raise ValueError(f"Unknown kernel '{kernel}'. Expected one of {sorted(KERNELS)} or a callable")
+        self.flows = list(flows)
+        self.kernel = kernel
+        self.singularity_policy = singularity_policy
+        self.kernel_kwargs = kernel_kwargs
+        self.batch = fb.FlowBatch.from_flows(self.flows)
+        self.singularities = [flow for flow in self.flows if type(flow) in fb.TYPE_CODES]
+
+    @property
+    def positions(self) -> tp.Tuple[np.ndarray, np.ndarray]:
+        return self.batch.x_pos.copy(), self.batch.y_pos.copy()
+
+    def induced_velocity(self, x: np.ndarray, y: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+        kernel = KERNELS[self.kernel] if isinstance(self.kernel, str) else self.kernel
+        batch = dataclasses.replace(self.batch, x_pos=x, y_pos=y)
+        return kernel(batch, x, y, self.singularity_policy, **self.kernel_kwargs)
+
+    def step_rk4(self, x: np.ndarray, y: np.ndarray, dt: float) -> tp.Tuple[np.ndarray, np.ndarray]:
+        u1, v1 = self.induced_velocity(x, y)
+        u2, v2 = self.induced_velocity(x + 0.5 * dt * u1, y + 0.5 * dt * v1)
+        u3, v3 = self.induced_velocity(x + 0.5 * dt * u2, y + 0.5 * dt * v2)
+        u4, v4 = self.induced_velocity(x + dt * u3, y + dt * v3)
+        return x + dt / 6 * (u1 + 2 * u2 + 2 * u3 + u4), y + dt / 6 * (v1 + 2 * v2 + 2 * v3 + v4)
+
+    def step_rk45(self, x: np.ndarray, y: np.ndarray, dt: float, rtol: float = 1e-6,
+                  atol: float = 1e-9) -> tp.Tuple[np.ndarray, np.ndarray, float]:
+        '''
+        Takes one Dormand-Prince step and returns the fifth order positions and the error norm of the step relative to
+        the tolerances. The step should be rejected if the error norm is larger than one.
+        '''
+        stages = []
+        for row in DORMAND_PRINCE_MATRIX:
+            stage_x = x + dt * sum((a * k[0] for a, k in zip(row, stages)), np.zeros_like(x))
+            stage_y = y + dt * sum((a * k[1] for a, k in zip(row, stages)), np.zeros_like(y))
+            stages.append(self.induced_velocity(stage_x, stage_y))
+        # The last row of the matrix holds the fifth order weights, so the last stage is at the new positions
+        x_new, y_new = stage_x, stage_y
+        error_x = dt * sum(e * k[0] for e, k in zip(DORMAND_PRINCE_ERROR, stages))
+        error_y = dt * sum(e * k[1] for e, k in zip(DORMAND_PRINCE_ERROR, stages))
+        scale_x = atol + rtol * np.maximum(np.abs(x), np.abs(x_new))
+        scale_y = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        error = np.sqrt(np.mean(np.concatenate(((error_x / scale_x) ** 2, (error_y / scale_y) ** 2)))) \
+            if x.size else 0.
+        return x_new, y_new, float(error)
+
+    def integrate(self, times: np.ndarray, dt: float, method: str = 'rk4', rtol: float = 1e-6, atol: float = 1e-9,
+                  filename: tp.Optional[str] = None) -> dc.Trajectory:
+        '''
+        Integrates the system from times[0] through every output time and returns the positions of the singularities
+        at each of them. With 'rk4' the step is dt, shortened to land on the output times. With 'rk45' dt is the
+        initial step, adapted to keep the error within rtol and atol. If a filename is given the positions are
+        streamed to a .npy memory-mapped file of shape (number of times, 2, number of singularities) as each output
+        time is reached. The flows are moved to the final positions.
+        '''
+        if method not in ('rk4', 'rk45'):
+            raise ValueError(f"Unknown method '{method}'. Expected 'rk4' or 'rk45'")
+        times = np.asarray(times, dtype=float)
+        if np.any(np.diff(times) <= 0):
+            raise ValueError("The output times must be increasing")
+        shape = (times.size, 2, len(self.batch))
+        if filename is not None:
+            positions = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=shape)
+        else:
+            positions = np.empty(shape)
+
+        x, y = self.positions
+        t = times[0]
+        positions[0] = x, y
+        for i, t_out in enumerate(times[1:], start=1):
+            while t < t_out:
+                step = min(dt, t_out - t)
+                if method == 'rk4':
+                    x, y = self.step_rk4(x, y, step)
+                    t = t_out if step == t_out - t else t + step
+                    continue
+                x_new, y_new, error = self.step_rk45(x, y, step, rtol, atol)
+                factor = 5. if error == 0 else min(5., max(0.2, 0.9 * error ** -0.2))
+                if error <= 1:
+                    x, y = x_new, y_new
+                    t = t_out if step == t_out - t else t + step
+                    # A step shortened to land on an output time does not shrink the next one
+                    dt = step * factor if step == dt else max(dt, step * factor)
+                else:
+                    dt = step * factor
+            positions[i] = x, y
+            if isinstance(positions, np.memmap):
+                positions.flush()
+
+        self.update_flows(x, y)
+        return dc.Trajectory(times, positions[:, 0], positions[:, 1])
+
+    def update_flows(self, x: np.ndarray, y: np.ndarray) -> None:
+        self.batch = dataclasses.replace(self.batch, x_pos=np.array(x, dtype=float), y_pos=np.array(y, dtype=float))
+        for flow, x_pos, y_pos in zip(self.singularities, x, y):
+            flow.x_pos = float(x_pos)
+            flow.y_pos = float(y_pos)
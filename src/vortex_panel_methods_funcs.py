@@ -1,17 +1,25 @@
-from . import geometric_integrals as gi
-from .source_panel_methods_funcs import point_in_polygon
+import typing as tp
+from . import dispatch
+from . import grid_operator as go
+from .source_panel_methods_funcs import compute_free_stream_basis, evaluate_grid_velocity, solve_polar
 import src.data_collections as dc
 import numpy as np
 import numba as nb
 
 
 @nb.njit(cache=True)
-def compute_vortex_strengths(panelized_geometry, V, K):
+def assemble_vortex_system(K):
     A = -K
     kutta_condition = np.zeros(len(K[0]))
     kutta_condition[0] = 1
     kutta_condition[-1] = 1
     A[-1, :] = kutta_condition
+    return A
+
+
+@nb.njit(cache=True)
+def compute_vortex_strengths(panelized_geometry, V, K):
+    A = assemble_vortex_system(K)
     print('A:   ', A)
     b = -np.cos(panelized_geometry.beta) * V * 2 * np.pi
     b[-1] = 0
@@ -19,25 +27,22 @@ def compute_vortex_strengths(panelized_geometry, V, K):
     return gamma
 
 
-@nb.njit(cache=True)
-def compute_grid_velocity_vortex(panelized_geometry, x, y, gamma, free_stream_velocity=1, AoA=0):
-    Nxpj, Nypj = gi.compute_grid_geometric_integrals_vortex(panelized_geometry, x, y)
-    X = panelized_geometry.xC - panelized_geometry.S / 2 * np.cos(panelized_geometry.phi)
-    Y = panelized_geometry.yC - panelized_geometry.S / 2 * np.sin(panelized_geometry.phi)
-    X = np.append(X, X[0])
-    Y = np.append(Y, Y[0])
-    shape = np.vstack((X, Y)).T
-    u = np.zeros((len(x), len(y)))
-    v = np.zeros((len(x), len(y)))
-    for i in range(len(x)):
-        for j in range(len(y)):
-            if point_in_polygon(float(x[i]), float(y[j]), shape):
-                u[j, i] = 0
-                v[j, i] = 0
-            else:
-                u[j, i] = -np.sum(gamma * Nxpj[j, i] / (2 * np.pi)) + free_stream_velocity * np.cos(AoA * np.pi / 180)
-                v[j, i] = -np.sum(gamma * Nypj[j, i] / (2 * np.pi)) + free_stream_velocity * np.sin(AoA * np.pi / 180)
-    return u, v
+def compute_vortex_strengths_polar(panelized_geometry: dc.PanelizedGeometry, V: float, AoAs: np.ndarray,
+                                   K: np.ndarray) -> np.ndarray:
+    '''
+    Returns the vortex strengths at every angle of attack in AoAs [deg], of shape (AoAs.size, panels), with a single
+    factorization of the system of compute_vortex_strengths. The angle of attack the geometry was panelized at is not
+    used.
+    '''
+    basis = compute_free_stream_basis(panelized_geometry, V)
+    basis[-1] = 0
+    return solve_polar(assemble_vortex_system(K), basis, AoAs)
+
+
+def compute_grid_velocity_vortex(panelized_geometry, x, y, gamma, free_stream_velocity=1, AoA=0, method='direct',
+                                 tolerance=1e-6):
+    return evaluate_grid_velocity(panelized_geometry, x, y, np.empty(0), gamma, free_stream_velocity, AoA, method,
+                                  tolerance)
 
 
 @nb.njit(cache=True)
@@ -52,14 +57,26 @@ def compute_panel_velocities_vortex(panelized_geometry, gamma, V, K, L):
 
 
 def run_vortex_panel_method(panelized_geometry: dc.PanelizedGeometry, V: float, AoA: float, x,
-                            y) -> dc.VortexPanelMethodResults:
-    K, L = gi.compute_panel_geometric_integrals_vortex(panelized_geometry)
+                            y, grid_operator: tp.Optional[go.GridOperator] = None,
+                            threads: tp.Optional[int] = None) -> dc.VortexPanelMethodResults:
+    n = panelized_geometry.S.size
+    (_, _, K, L), panel_choice = dispatch.dispatch_panel_integrals(
+        panelized_geometry, source=False, vortex=True,
+        choice=None if threads is None else dispatch.forced_choice('panel_integrals', n ** 2, threads))
     gamma = compute_vortex_strengths(panelized_geometry, V, K)
     V_normal, V_tangential = compute_panel_velocities_vortex(panelized_geometry, gamma, V, K, L)
 
-    u, v = compute_grid_velocity_vortex(panelized_geometry, x, y, gamma, V, AoA)
+    if grid_operator is not None:
+        u, v = grid_operator.velocity(gamma=gamma, free_stream_velocity=V, AoA=AoA)
+        grid_choice = None
+    else:
+        (u, v), grid_choice = dispatch.dispatch_grid_velocity(
+            panelized_geometry, x, y, np.empty(0), gamma, V * np.cos(AoA * np.pi / 180), V * np.sin(AoA * np.pi / 180),
+            choice=None if threads is None else dispatch.forced_choice('grid_velocity', np.size(x) * np.size(y) * n,
+                                                                       threads))
 
     panel_results = dc.VortexPanelMethodResults(V_normal=V_normal, V_tangential=V_tangential,
                                                 Vortex_Strengths=gamma, V_horizontal=u, V_vertical=v)
+    panel_results.metadata = dc.PanelMethodMetadata(panel_integrals=panel_choice, grid_velocity=grid_choice)
 
     return panel_results
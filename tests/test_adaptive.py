@@ -0,0 +1,44 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import adaptive as ad
+
+
+@pytest.fixture
+def flow():
+    yield ff.FlowField([ef.UniformFlow(horizontal_vel=1, vertical_vel=0), ef.Source(x_pos=-1.5, y_pos=0, strength=7),
+                        ef.Source(x_pos=1.5, y_pos=0, strength=-7), ef.Vortex(x_pos=0, y_pos=1, circulation=3)],
+                       backend='serial', singularity_policy='nan')
+
+
+def test_quadtree_resample(flow):
+    x = np.linspace(-3, 3, num=201)
+    X, Y = np.meshgrid(x, x)
+    tree = ad.QuadtreeField(flow, x, x, 'velocity', tolerance=1e-4)
+    U, V = tree.resample(x, x)
+    U_ref, V_ref = flow.velocity(X, Y)
+
+    far = np.ones(X.shape, dtype=bool)
+    for sx, sy in [(-1.5, 0), (1.5, 0), (0, 1)]:
+        far &= np.hypot(X - sx, Y - sy) > 0.3
+    scale = np.max(np.hypot(U_ref, V_ref)[far])
+    assert np.max(np.abs(U - U_ref)[far]) < 1e-3 * scale
+    assert np.max(np.abs(V - V_ref)[far]) < 1e-3 * scale
+
+    # Far fewer points than a uniform grid at the finest resolution
+    assert len(tree.points) < 0.25 * (tree.lattice_size // 2 + 1) ** 2
+    assert np.allclose(tree.values[:, 0], flow.evaluate_points(tree.points[:1])[:, 0])
+
+
+def test_quadtree_refines_near_singularities(flow):
+    x = np.linspace(-3, 3, num=11)
+    tree = ad.QuadtreeField(flow, x, x, 'stream_function', tolerance=1e-2, max_level=4)
+    cells = tree.cells()
+    centres = cells[:, :2] + cells[:, 2:] / 2
+    finest = tree.levels == tree.max_level
+    assert np.min(np.hypot(centres[~finest, 0] - 1.5, centres[~finest, 1])) > np.min(cells[:, 2])
+    assert np.any(finest & (np.hypot(centres[:, 0] - 1.5, centres[:, 1]) < 2 * cells[:, 2]))
+    assert np.isclose(np.sum(cells[:, 2] * cells[:, 3]), 36)
+    assert tree.resample(x, x).shape == (1, 11, 11)
+    assert np.all(np.isnan(tree.resample([4.], [0.])))
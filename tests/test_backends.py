@@ -0,0 +1,107 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import backends as bk
+
+
+@pytest.fixture
+def default_data(request):
+    num_points = 100
+    x = np.linspace(-3, 3, num=num_points)
+    y = np.linspace(-3, 3, num=num_points)
+    X, Y = np.meshgrid(x, y)
+
+    yield x, y, X, Y, num_points
+
+
+@pytest.fixture
+def rankine_oval():
+    v1 = ef.Source(x_pos=-1.5, y_pos=0, strength=7)
+    v2 = ef.Source(x_pos=1.5, y_pos=0, strength=-7)
+    u1 = ef.UniformFlow(horizontal_vel=1, vertical_vel=0)
+    yield [v1, v2, u1]
+
+
+def test_choose_backend():
+    assert bk.choose_backend(1, 10 ** 9) == 'serial'
+    assert bk.choose_backend(3, 100) == 'serial'
+    assert bk.choose_backend(3, 10 ** 6) == 'thread'
+    assert bk.choose_backend(100, 10 ** 6) == 'shared_memory'
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        bk.make_backend('gpu')
+
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process', 'shared_memory'])
+def test_backends_agree(default_data, rankine_oval, backend):
+    x, y, X, Y, num_points = default_data
+    reference = ff.FlowField(rankine_oval, backend='serial')
+    with ff.FlowField(rankine_oval, backend=backend) as flow:
+        U, V = flow.velocity(X, Y)
+        psi = flow.stream_function(X, Y)
+
+    U_ref, V_ref = reference.velocity(X, Y)
+    assert np.allclose(U, U_ref)
+    assert np.allclose(V, V_ref)
+    assert np.allclose(psi, reference.stream_function(X, Y))
+
+
+def test_process_pool_is_reused(default_data, rankine_oval):
+    x, y, X, Y, num_points = default_data
+    flow = ff.FlowField(rankine_oval, backend='process')
+    flow.velocity(X, Y)
+    pool = flow.get_backend(X).pool
+    flow.velocity(X, Y)
+    flow.stream_function(X, Y)
+    assert flow.get_backend(X).pool is pool
+
+    flow.close()
+    assert flow.get_backend(X)._pool is None
+
+
+def test_shared_backend_is_not_closed(default_data, rankine_oval):
+    x, y, X, Y, num_points = default_data
+    with bk.ThreadBackend(workers=2) as backend:
+        with ff.FlowField(rankine_oval, backend=backend) as flow:
+            flow.velocity(X, Y)
+        assert backend._executor is not None
+    assert backend._executor is None
+
+
+def test_shared_memory_backend_masks_singularities(default_data):
+    x, y, X, Y, num_points = default_data
+    flows = [ef.Vortex(x_pos=x[10], y_pos=y[20], circulation=5), ef.UniformFlow(horizontal_vel=1, vertical_vel=0)]
+    with bk.SharedMemoryBackend(workers=2) as backend:
+        U, V = ff.FlowField(flows, backend=backend).velocity(X, Y)
+        psi = ff.FlowField(flows, backend=backend).stream_function(X, Y)
+
+    U_ref, V_ref = ff.FlowField(flows, backend='serial').velocity(X, Y)
+    assert U[20, 10] is np.ma.masked
+    assert psi[20, 10] is np.ma.masked
+    assert np.ma.allclose(U, U_ref)
+    assert np.ma.allclose(V, V_ref)
+
+
+@pytest.mark.parametrize('backend', ['serial', 'fused', 'multipole', 'shared_memory'])
+def test_single_precision(default_data, rankine_oval, backend):
+    x, y, X, Y, num_points = default_data
+    reference = ff.FlowField(rankine_oval, backend='serial', singularity_policy='nan')
+    with ff.FlowField(rankine_oval, backend=backend, singularity_policy='nan', dtype=np.float32) as flow:
+        U, V = flow.velocity(X, Y)
+        psi = flow.stream_function(X, Y)
+        tiled = flow.evaluate_tiled(x, y, 'velocity', memory_budget=2 ** 16)
+
+    U_ref, V_ref = reference.velocity(X, Y)
+    assert U.dtype == V.dtype == psi.dtype == tiled.dtype == np.float32
+    scale = np.nanmax(np.hypot(U_ref, V_ref))
+    assert np.nanmax(np.abs(U - U_ref)) < 1e-5 * scale
+    assert np.nanmax(np.abs(tiled[1] - V_ref)) < 1e-5 * scale
+    assert np.nanmax(np.abs(psi - reference.stream_function(X, Y))) < 1e-5 * np.nanmax(np.abs(psi))
+
+
+def test_unsupported_dtype(rankine_oval):
+    with pytest.raises(ValueError):
+        ff.FlowField(rankine_oval, dtype=np.float16)
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import basis as bs
+
+
+@pytest.fixture
+def default_data(request):
+    num_points = 100
+    x = np.linspace(-3, 3, num=num_points)
+    y = np.linspace(-3, 3, num=num_points)
+    X, Y = np.meshgrid(x, y)
+
+    yield x, y, X, Y, num_points
+
+
+@pytest.fixture
+def flows():
+    yield [ef.UniformFlow(horizontal_vel=1, vertical_vel=0.5),
+           ef.Vortex(x_pos=0, y_pos=0, circulation=4),
+           ef.Source(x_pos=1, y_pos=1, strength=2),
+           ef.Doublet(x_pos=-1, y_pos=0.5, kappa=3)]
+
+
+@pytest.mark.parametrize('quantity', ['velocity', 'stream_function', 'velocity_potential'])
+def test_basis_sweep(default_data, flows, quantity):
+    x, y, X, Y, num_points = default_data
+    flow = ff.FlowField(flows, backend='serial', singularity_policy='nan')
+    basis = bs.BasisField.from_flow_field(flow, X, Y, quantity)
+    assert basis.parameters == [(0, 'horizontal_vel'), (0, 'vertical_vel'), (1, 'circulation'), (2, 'strength'),
+                                (3, 'kappa')]
+    assert np.allclose(basis.strengths(), [1, 0.5, 4, 2, 3])
+
+    rng = np.random.default_rng(0)
+    strengths = rng.uniform(-5, 5, size=(7, len(basis.parameters)))
+    values = basis.evaluate(strengths)
+    assert values.shape == (7,) + ((2,) if quantity == 'velocity' else ()) + X.shape
+
+    for case, case_strengths in zip(values, strengths):
+        for (index, name), strength in zip(basis.parameters, case_strengths):
+            setattr(flows[index], name, strength)
+        expected = getattr(flow, quantity)(X, Y)
+        assert np.allclose(case, np.array(expected), atol=1e-9, equal_nan=True)
+
+    assert np.allclose(basis.evaluate(strengths[0]), values[0], equal_nan=True)
+    with pytest.raises(ValueError):
+        basis.evaluate(strengths[:, :3])
+
+
+def test_basis_unsupported_flow(default_data):
+    x, y, X, Y, num_points = default_data
+    with pytest.raises(TypeError):
+        bs.BasisField([ef.NonUniformFlow(x_pos=0, y_pos=0)], X, Y)
+
+
+def test_basis_float32(default_data, flows):
+    x, y, X, Y, num_points = default_data
+    flow = ff.FlowField(flows, backend='serial', singularity_policy='nan', dtype=np.float32)
+    basis = bs.BasisField.from_flow_field(flow, X, Y)
+    assert basis.dtype == basis.basis.dtype == np.float32
+    values = basis.evaluate()
+    assert values.dtype == np.float32
+    assert np.allclose(values, flow.velocity(X, Y), rtol=1e-5, atol=1e-5, equal_nan=True)
@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import blasius as bl
+
+
+@pytest.fixture
+def circle():
+    t = np.linspace(0, 2 * np.pi, num=2000, endpoint=False)
+    yield np.column_stack((1.5 * np.cos(t), 1.5 * np.sin(t)))
+
+
+def test_lifting_cylinder(circle):
+    # Kutta-Joukowski: L = rho U Gamma with no drag, upwards for a clockwise (positive) circulation
+    velocity, radius, circulation, density = 10, 1, 20, 1.2
+    flow = ff.FlowField([ef.UniformFlow(horizontal_vel=velocity, vertical_vel=0),
+                         ef.Doublet(x_pos=0, y_pos=0, kappa=2 * np.pi * velocity * radius ** 2),
+                         ef.Vortex(x_pos=0, y_pos=0, circulation=circulation)])
+    forces = flow.forces(density=density)
+    assert forces.fx == pytest.approx(0, abs=1e-12)
+    assert forces.fy == pytest.approx(density * velocity * circulation)
+    assert forces.moment == pytest.approx(0, abs=1e-12)
+    assert flow.forces(circle, density, method='contour').fy == pytest.approx(forces.fy, rel=1e-5)
+    assert flow.forces(circle[::-1], density, method='contour').fy == pytest.approx(forces.fy, rel=1e-5)
+    assert flow.forces(circle[::-1], density).fy == pytest.approx(forces.fy)
+
+
+def test_rankine_oval_has_no_drag():
+    flow = ff.FlowField([ef.Source(x_pos=-1.5, y_pos=0, strength=7), ef.Source(x_pos=1.5, y_pos=0, strength=-7),
+                         ef.UniformFlow(horizontal_vel=1, vertical_vel=0)])
+    assert np.allclose(flow.forces(), 0, atol=1e-12)
+
+
+def test_residues_match_contour_integral(circle):
+    rng = np.random.default_rng(1)
+    flows = [ef.UniformFlow(horizontal_vel=1, vertical_vel=0.3)]
+    for flow_type, parameter in [(ef.Source, 'strength'), (ef.Vortex, 'circulation'), (ef.Doublet, 'kappa'),
+                                 (ef.Vortex, 'circulation'), (ef.Source, 'strength')]:
+        x_pos, y_pos, strength = rng.uniform(-0.8, 0.8, size=3)
+        flows.append(flow_type(x_pos=x_pos, y_pos=y_pos, **{parameter: 3 * strength}))
+    flows.append(ef.Vortex(x_pos=3, y_pos=0, circulation=2))  # Outside the contour
+    flow = ff.FlowField(flows)
+
+    residues = flow.forces(circle)
+    contour = flow.forces(circle, method='contour')
+    assert np.allclose(residues, contour, rtol=1e-4, atol=1e-4)
+    assert np.allclose(flow.forces(circle[::-1], method='contour'), contour)
+    assert list(bl.enclosed(flows, circle)) == [False] + [True] * 5 + [False]
+
+
+def test_invalid_arguments(circle):
+    flow = ff.FlowField([ef.Vortex(x_pos=0, y_pos=0, circulation=1)])
+    with pytest.raises(ValueError):
+        flow.forces(circle, method='grid')
+    with pytest.raises(ValueError):
+        flow.forces(method='contour')
+
+
+def test_signed_area(circle):
+    assert bl.signed_area(circle) == pytest.approx(np.pi * 1.5 ** 2, rel=1e-5)
+    assert bl.signed_area(circle[::-1]) == pytest.approx(-np.pi * 1.5 ** 2, rel=1e-5)
+
+
+def test_residues_of_many_vortices():
+    # Direct sum of the residues over every pair of flows, with each flow evaluated at one site at a time
+    rng = np.random.default_rng(2)
+    flows = [ef.UniformFlow(horizontal_vel=1, vertical_vel=-0.5)]
+    for flow_type, parameter in [(ef.Vortex, 'circulation'), (ef.Source, 'strength'), (ef.Doublet, 'kappa')] * 20:
+        x_pos, y_pos, strength = rng.uniform(-1, 1, size=3)
+        flows.append(flow_type(x_pos=x_pos, y_pos=y_pos, **{parameter: strength}))
+    flows.append(ef.Vortex(x_pos=flows[1].x_pos, y_pos=flows[1].y_pos, circulation=0.7))  # Shares a site
+    residue, moment_residue = 0j, 0j
+    for site in {(flow.x_pos, flow.y_pos) for flow in flows[1:]}:
+        c1 = sum(bl.laurent_coefficients(flow)[0] for flow in flows[1:] if (flow.x_pos, flow.y_pos) == site)
+        c2 = sum(bl.laurent_coefficients(flow)[1] for flow in flows[1:] if (flow.x_pos, flow.y_pos) == site)
+        regular, derivative = 0j, 0j
+        for flow in flows:
+            if isinstance(flow, ef.NonUniformFlow) and (flow.x_pos, flow.y_pos) == site:
+                continue
+            u, v, du_dx, du_dy, dv_dx, dv_dy = flow.velocity_and_gradient(np.array([site[0]]), np.array([site[1]]))
+            regular += complex(u[0] - 1j * v[0])
+            derivative += complex(du_dx[0] - 1j * dv_dx[0])
+        residue += 2 * c1 * regular + 2 * c2 * derivative
+        moment_residue += complex(*site) * (2 * c1 * regular + 2 * c2 * derivative) + c1 ** 2 + 2 * c2 * regular
+    force = 1j / 2 * 2j * np.pi * residue
+    moment = (-1 / 2 * 2j * np.pi * moment_residue).real
+    assert np.allclose(bl.residue_forces(flows), [force.real, -force.imag, moment], rtol=1e-12, atol=1e-12)
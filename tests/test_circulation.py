@@ -99,3 +99,20 @@ def test_circulation_lifting_flow(default_data):
     ellipse_properties = c.compute_ellipse_and_circulation(flow_properties, ellipse, divsions=1000)
 
     assert ellipse_properties.circulation == pytest.approx(0, abs=1e-6)
+
+
+def test_circulation_from_flow_field():
+    """
+    Tests the circulation computed by evaluating the flow field directly on the ellipse.
+    """
+    vortex_strength = 40 * np.pi
+    flow = ff.FlowField([ef.Doublet(x_pos=0, y_pos=0, kappa=20 * np.pi),
+                         ef.UniformFlow(horizontal_vel=10, vertical_vel=0),
+                         ef.Vortex(x_pos=0, y_pos=0, circulation=vortex_strength)])
+
+    ellipse_properties = c.compute_circulation(flow, dc.Ellipse(x0=0, y0=0, a=1.5, b=1), divisions=1000)
+    assert ellipse_properties.circulation == pytest.approx(vortex_strength, rel=1e-5)
+    assert ellipse_properties.u.shape == ellipse_properties.x_cor.shape
+
+    ellipse_properties = c.compute_circulation(flow, dc.Ellipse(x0=-2, y0=-2, a=1, b=1), divisions=1000)
+    assert ellipse_properties.circulation == pytest.approx(0, abs=1e-6)
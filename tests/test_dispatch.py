@@ -0,0 +1,84 @@
+import json
+import pathlib
+import numpy as np
+import pytest
+from src import dispatch
+from src import geometric_integrals as gi
+from src import grid_velocity as gv
+from src.data_collections import Geometry, KernelChoice
+from src.panel_generator import PanelGenerator
+from src.panel_treecode import grid_inside_polygon
+from src.source_vortex_panel_methods_funcs import run_source_vortex_panel_method
+
+
+@pytest.fixture
+def airfoil():
+    coordinates = np.loadtxt(pathlib.Path(__file__).parents[1] / 'naca2412.txt', skiprows=1)
+    yield PanelGenerator.compute_geometric_quantities(Geometry(coordinates[:, 0].copy(), coordinates[:, 1].copy(),
+                                                               AoA=6))
+
+
+@pytest.mark.parametrize('source, vortex', [(True, True), (True, False), (False, True)])
+def test_numpy_panel_integrals(airfoil, source, vortex):
+    fused = gi.compute_panel_geometric_integrals(airfoil, source, vortex)
+    for integral, reference in zip(gi.compute_panel_geometric_integrals_numpy(airfoil, source, vortex), fused):
+        assert integral.shape == reference.shape
+        np.testing.assert_allclose(integral, reference, rtol=1e-12, atol=1e-12)
+
+
+def test_numpy_grid_velocity(airfoil):
+    n = airfoil.S.size
+    x, y = np.linspace(-0.5, 1.5, 43), np.linspace(-0.3, 0.3, 31)
+    lam, gamma = np.sin(np.arange(n)), np.full(n, 0.3)
+    X = airfoil.xC - airfoil.S / 2 * np.cos(airfoil.phi)
+    Y = airfoil.yC - airfoil.S / 2 * np.sin(airfoil.phi)
+    polygon = np.column_stack((np.append(X, X[0]), np.append(Y, Y[0])))
+    assert np.array_equal(gv.grid_inside_polygon_numpy(x, y, polygon), grid_inside_polygon(x, y, polygon))
+
+    numpy_velocity = gv.compute_grid_velocity_panels_numpy(airfoil, x, y, lam, gamma, 1., 0.1, memory_budget=2 ** 20)
+    numba_velocity = gv.compute_grid_velocity_panels(airfoil, x, y, lam, gamma, 1., 0.1)
+    np.testing.assert_allclose(numpy_velocity, numba_velocity, rtol=0, atol=1e-12)
+
+
+def test_choose():
+    calibration = {'panel_integrals': [{'size': 0, 'implementation': 'numpy', 'threads': 1},
+                                       {'size': 100, 'implementation': 'serial', 'threads': 1},
+                                       {'size': 1000, 'implementation': 'parallel', 'threads': 10 ** 6}],
+                   'grid_velocity': [{'size': 0, 'implementation': 'parallel', 'threads': None}]}
+    assert dispatch.choose('panel_integrals', 99, calibration).implementation == 'numpy'
+    assert dispatch.choose('panel_integrals', 100, calibration) == KernelChoice('panel_integrals', 'serial', 1, 100)
+    large = dispatch.choose('panel_integrals', 10 ** 5, calibration)
+    assert large.implementation == 'parallel' and large.threads == dispatch.nb.config.NUMBA_NUM_THREADS
+    assert dispatch.choose('grid_velocity', 5, calibration).threads == dispatch.nb.config.NUMBA_NUM_THREADS
+    with pytest.raises(ValueError):
+        dispatch.choose('solve', 5, calibration)
+
+
+def test_autotune(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'calibration.json')
+    monkeypatch.setenv('POTENTIALFLOW_CALIBRATION', filename)
+    contents = dispatch.autotune(panel_counts=(9, 40), grid_sizes=(5, 20), grid_panels=16, repeats=1)
+    try:
+        with open(filename) as file:
+            assert json.load(file) == contents
+        assert dispatch.load_calibration() == contents['kernels']
+        for kernel in dispatch.DISPATCH_KERNELS:
+            rows = contents['kernels'][kernel]
+            assert rows[0]['size'] == 0
+            assert all(row['implementation'] in dispatch.IMPLEMENTATIONS for row in rows)
+            assert len(contents['measurements'][kernel]) == 2
+    finally:
+        dispatch.read_calibration.cache_clear()
+
+
+def test_run_metadata(airfoil):
+    x, y = np.linspace(-0.5, 1.5, 20), np.linspace(-0.3, 0.3, 10)
+    automatic = run_source_vortex_panel_method(airfoil, 1., 6., x, y)
+    assert automatic.metadata.panel_integrals.size == airfoil.S.size ** 2
+    assert automatic.metadata.grid_velocity.size == x.size * y.size * airfoil.S.size
+    forced = run_source_vortex_panel_method(airfoil, 1., 6., x, y, threads=1)
+    assert forced.metadata.panel_integrals == KernelChoice('panel_integrals', 'serial', 1, airfoil.S.size ** 2)
+    assert forced.metadata.grid_velocity.implementation == 'serial'
+    np.testing.assert_allclose(automatic.V_horizontal, forced.V_horizontal, rtol=0, atol=1e-12)
+    V_normal, V_tangential, lam, gamma, u, v = forced
+    np.testing.assert_allclose(gamma, automatic.Circulation, rtol=1e-10)
@@ -181,3 +181,121 @@ def test_source_velocity(default_data):
 
     assert strength / (2 * np.pi * np.sqrt(x[x1] ** 2 + y[y1] ** 2)) == pytest.approx(np.sqrt(u ** 2 + v ** 2)
                                                                                       , abs=1e-6)
+
+
+@pytest.mark.parametrize('flow', [ef.Source(x_pos=0, y_pos=0, strength=10),
+                                  ef.Vortex(x_pos=0, y_pos=0, circulation=10),
+                                  ef.Doublet(x_pos=0, y_pos=0, kappa=10)])
+def test_singularity_policies(flow):
+    x = np.linspace(-3, 3, num=101)  # Contains the singularity at the origin
+    X, Y = np.meshgrid(x, x)
+
+    u_mask, v_mask = flow.velocity(X, Y)
+    u_nan, v_nan = flow.velocity(X, Y, singularity_policy='nan')
+    assert type(u_nan) is np.ndarray
+    assert np.allclose(np.ma.filled(u_mask, np.nan), u_nan, rtol=1e-12, atol=0, equal_nan=True)
+    assert np.allclose(np.ma.filled(v_mask, np.nan), v_nan, rtol=1e-12, atol=0, equal_nan=True)
+    assert np.isnan(u_nan[50, 50])
+
+    for policy in ['clamp', 'core']:
+        u, v = flow.velocity(X, Y, singularity_policy=policy)
+        psi = flow.stream_function(X, Y, singularity_policy=policy)
+        assert type(u) is np.ndarray
+        assert np.all(np.isfinite(u)) and np.all(np.isfinite(v)) and np.all(np.isfinite(psi))
+        # Away from the singularity the regularisation makes no measurable difference
+        assert u[0, 0] == pytest.approx(u_mask[0, 0], rel=1e-6)
+        assert v[0, 0] == pytest.approx(v_mask[0, 0], rel=1e-6)
+
+    with pytest.raises(ValueError):
+        flow.velocity(X, Y, singularity_policy='ignore')
+
+
+def test_flow_field_singularity_policy():
+    v1 = ef.Vortex(x_pos=0, y_pos=0, circulation=10)
+    x = np.linspace(-3, 3, num=101)
+    X, Y = np.meshgrid(x, x)
+
+    U, V = ff.FlowField([v1], backend='serial').velocity(X, Y)
+    assert np.ma.isMaskedArray(U)
+
+    U, V = ff.FlowField([v1], backend='serial', singularity_policy='nan').velocity(X, Y)
+    assert not np.ma.isMaskedArray(U)
+    assert np.isnan(U[50, 50])
+
+    x = np.linspace(-3, 3, num=ff.MASKED_POINT_LIMIT)
+    U, V = ff.FlowField([v1], backend='serial').velocity(x, np.ones_like(x))
+    assert not np.ma.isMaskedArray(U)
+
+
+@pytest.mark.parametrize('flow', [ef.UniformFlow(horizontal_vel=2, vertical_vel=-1),
+                                  ef.Source(x_pos=0.5, y_pos=-0.2, strength=3),
+                                  ef.Vortex(x_pos=0.5, y_pos=-0.2, circulation=3),
+                                  ef.Doublet(x_pos=0.5, y_pos=-0.2, kappa=3)])
+@pytest.mark.parametrize('policy', ef.SINGULARITY_POLICIES)
+def test_flow_state(default_data, flow, policy):
+    x, y, X, Y, num_points = default_data
+    phi, psi, u, v = flow.flow_state(X, Y, singularity_policy=policy)
+
+    # The complex potential agrees with the separate stream function and velocity evaluations
+    u_ref, v_ref = flow.velocity(X, Y, singularity_policy=policy)
+    assert np.allclose(u, u_ref, rtol=1e-10, atol=1e-12)
+    assert np.allclose(v, v_ref, rtol=1e-10, atol=1e-12)
+    assert np.allclose(psi, flow.stream_function(X, Y, singularity_policy=policy), rtol=1e-10, atol=1e-12)
+
+    # The velocity is the gradient of the potential
+    dphi_dy, dphi_dx = np.gradient(np.asarray(phi), y, x)
+    interior = (slice(20, 40), slice(20, 40))
+    assert np.allclose(dphi_dx[interior], u[interior], rtol=1e-2, atol=1e-2)
+    assert np.allclose(dphi_dy[interior], v[interior], rtol=1e-2, atol=1e-2)
+    assert np.allclose(flow.velocity_potential(X, Y, singularity_policy=policy), phi)
+
+
+def test_flow_field_complex_potential(default_data):
+    x, y, X, Y, num_points = default_data
+    flows = [ef.UniformFlow(horizontal_vel=1, vertical_vel=0), ef.Vortex(x_pos=0, y_pos=0, circulation=4),
+             ef.Doublet(x_pos=0, y_pos=0, kappa=2 * np.pi)]
+    with ff.FlowField(flows, backend='serial') as flow:
+        state = flow.flow_state(X, Y)
+        U, V = flow.velocity(X, Y)
+        assert np.allclose(state.u, U) and np.allclose(state.v, V)
+        assert np.allclose(state.psi, flow.stream_function(X, Y))
+        assert np.allclose(state.phi, flow.velocity_potential(X, Y))
+
+        w, dw_dz = flow.complex_potential(X + 1j * Y)
+        assert np.allclose(w.real, state.phi) and np.allclose(w.imag, state.psi)
+        assert np.allclose(dw_dz, state.u - 1j * state.v)
+
+        phi, psi, u, v = flow.evaluate_tiled(x, y, 'flow_state', memory_budget=2 ** 18)
+        assert np.allclose(u, np.ma.filled(U, np.nan), equal_nan=True)
+
+
+@pytest.mark.parametrize('flow', [ef.UniformFlow(horizontal_vel=2, vertical_vel=-1),
+                                  ef.Source(x_pos=0.5, y_pos=-0.2, strength=3),
+                                  ef.Vortex(x_pos=0.5, y_pos=-0.2, circulation=3),
+                                  ef.Doublet(x_pos=0.5, y_pos=-0.2, kappa=3)])
+def test_complex_velocity_derivative(default_data, flow):
+    x, y, X, Y, num_points = default_data
+    Z = X + 1j * Y
+    h = 1e-6
+    expected = (flow.complex_potential(Z + h, 'nan')[1] - flow.complex_potential(Z - h, 'nan')[1]) / (2 * h)
+    derivative = flow.complex_velocity_derivative(Z, 'nan')
+    far = np.abs(Z - (0.5 - 0.2j)) > 0.1
+    assert np.allclose(derivative[far], expected[far], rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('flow', [ef.UniformFlow(horizontal_vel=2, vertical_vel=-1),
+                                  ef.Source(x_pos=0.5, y_pos=-0.2, strength=3),
+                                  ef.Vortex(x_pos=0.5, y_pos=-0.2, circulation=3),
+                                  ef.Doublet(x_pos=0.5, y_pos=-0.2, kappa=3)])
+def test_velocity_gradient(default_data, flow):
+    x, y, X, Y, num_points = default_data
+    h = 1e-6
+    u, v, du_dx, du_dy, dv_dx, dv_dy = flow.velocity_and_gradient(X, Y, 'nan')
+    u_ref, v_ref = flow.velocity(X, Y, 'nan')
+    far = np.hypot(X - 0.5, Y + 0.2) > 0.1
+    assert np.allclose(u, u_ref, equal_nan=True) and np.allclose(v, v_ref, equal_nan=True)
+
+    u_x = [(a - b) / (2 * h) for a, b in zip(flow.velocity(X + h, Y, 'nan'), flow.velocity(X - h, Y, 'nan'))]
+    u_y = [(a - b) / (2 * h) for a, b in zip(flow.velocity(X, Y + h, 'nan'), flow.velocity(X, Y - h, 'nan'))]
+    for gradient, expected in zip((du_dx, du_dy, dv_dx, dv_dy), (u_x[0], u_y[0], u_x[1], u_y[1])):
+        assert np.allclose(np.broadcast_to(gradient, X.shape)[far], expected[far], rtol=1e-5, atol=1e-6)
@@ -0,0 +1,102 @@
+import pytest
+import numpy as np
+import random
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import flow_batch as fb
+
+
+@pytest.fixture
+def default_data(request):
+    num_points = 100
+    x = np.linspace(-3, 3, num=num_points)
+    y = np.linspace(-3, 3, num=num_points)
+    X, Y = np.meshgrid(x, y)
+
+    yield x, y, X, Y, num_points
+
+
+@pytest.fixture
+def random_flows():
+    random.seed(0)
+    flows = [ef.UniformFlow(horizontal_vel=1, vertical_vel=0.5)]
+    for i in range(30):
+        x_pos, y_pos = random.uniform(-3, 3), random.uniform(-3, 3)
+        flow_type = random.choice([ef.Source, ef.Vortex, ef.Doublet])
+        strength = random.uniform(-10, 10)
+        if flow_type == ef.Source:
+            flows.append(flow_type(x_pos=x_pos, y_pos=y_pos, strength=strength))
+        elif flow_type == ef.Vortex:
+            flows.append(flow_type(x_pos=x_pos, y_pos=y_pos, circulation=strength))
+        else:
+            flows.append(flow_type(x_pos=x_pos, y_pos=y_pos, kappa=strength))
+    yield flows
+
+
+def test_from_flows(random_flows):
+    batch = fb.FlowBatch.from_flows(random_flows)
+    assert len(batch) == len(random_flows) - 1
+    assert batch.horizontal_vel == 1
+    assert batch.vertical_vel == 0.5
+    assert np.all(batch.type_code[[isinstance(flow, ef.Vortex) for flow in random_flows[1:]]] == fb.VORTEX)
+
+
+def test_unsupported_flow():
+    class Custom(ef.ElementaryFlow):
+        pass
+
+    with pytest.raises(TypeError):
+        fb.FlowBatch.from_flows([Custom()])
+
+
+def test_colocated_singularities_share_a_site():
+    velocity, radius = 10, 1
+    flows = [ef.UniformFlow(horizontal_vel=velocity, vertical_vel=0),
+             ef.Vortex(x_pos=0, y_pos=0, circulation=4 * np.pi * velocity * radius),
+             ef.Doublet(x_pos=0, y_pos=0, kappa=2 * np.pi * velocity * radius ** 2)]
+    sites = ff.FlowField(flows).to_batch().sites()
+    assert len(sites.x_pos) == 1
+    assert sites.kinds[0] == fb.VORTEX_BIT | fb.DOUBLET_BIT
+    assert sites.circulation[0] == pytest.approx(4 * np.pi * velocity * radius)
+    assert sites.kappa[0] == pytest.approx(2 * np.pi * velocity * radius ** 2)
+
+
+def test_fused_matches_direct_summation(default_data, random_flows):
+    x, y, X, Y, num_points = default_data
+    U_ref, V_ref = ff.FlowField(random_flows, backend='serial').velocity(X, Y)
+    psi_ref = ff.FlowField(random_flows, backend='serial').stream_function(X, Y)
+
+    flow = ff.FlowField(random_flows, backend='fused')
+    U, V = flow.velocity(X, Y)
+    psi = flow.stream_function(X, Y)
+
+    assert np.allclose(U, U_ref, rtol=1e-10, atol=1e-10)
+    assert np.allclose(V, V_ref, rtol=1e-10, atol=1e-10)
+    assert np.allclose(psi, psi_ref, rtol=1e-10, atol=1e-10)
+
+
+def test_fused_singularities_are_nan(default_data):
+    x, y, X, Y, num_points = default_data
+    flows = [ef.Source(x_pos=x[10], y_pos=y[20], strength=1), ef.Vortex(x_pos=x[30], y_pos=y[40], circulation=1)]
+    U, V, psi = fb.FlowBatch.from_flows(flows).evaluate(X, Y)
+
+    assert np.isnan(U[20, 10]) and np.isnan(V[40, 30])
+    assert np.isnan(psi[40, 30])
+    assert np.isfinite(psi[20, 10])
+    assert np.count_nonzero(np.isnan(U)) == 2
+
+
+@pytest.mark.parametrize('policy', ['nan', 'clamp', 'core'])
+def test_fused_singularity_policies(default_data, random_flows, policy):
+    x, y, X, Y, num_points = default_data
+    flows = random_flows + [ef.Vortex(x_pos=x[30], y_pos=y[40], circulation=1)]
+    U_ref, V_ref = ff.FlowField(flows, backend='serial', singularity_policy=policy).velocity(X, Y)
+    psi_ref = ff.FlowField(flows, backend='serial', singularity_policy=policy).stream_function(X, Y)
+
+    flow = ff.FlowField(flows, backend='fused', singularity_policy=policy)
+    U, V = flow.velocity(X, Y)
+    psi = flow.stream_function(X, Y)
+
+    assert np.allclose(U, U_ref, rtol=1e-10, atol=1e-10, equal_nan=True)
+    assert np.allclose(V, V_ref, rtol=1e-10, atol=1e-10, equal_nan=True)
+    assert np.allclose(psi, psi_ref, rtol=1e-10, atol=1e-10, equal_nan=True)
@@ -0,0 +1,124 @@
+import pathlib
+import numpy as np
+import pytest
+from src import geometric_integrals as gi
+from src.data_collections import Geometry
+from src.panel_generator import PanelGenerator
+
+
+@pytest.fixture
+def circle():
+    theta = np.linspace(0, 2 * np.pi, num=41)
+    yield PanelGenerator.compute_geometric_quantities(Geometry(np.cos(theta), np.sin(theta), AoA=0))
+
+
+@pytest.fixture
+def airfoil():
+    coordinates = np.loadtxt(pathlib.Path(__file__).parents[1] / 'naca2412.txt', skiprows=1)
+    yield PanelGenerator.compute_geometric_quantities(Geometry(coordinates[:, 0].copy(), coordinates[:, 1].copy(),
+                                                               AoA=6))
+
+
+def reference_integrals(panel_geometry):
+    # The separate vectorized integrals with the masking sweeps of the original kernels
+    X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
+    Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
+    integrals = [np.empty((X.size, X.size)) for _ in range(4)]
+    kernels = [gi.normal_geometric_integral_source, gi.tangential_geometric_integral_source,
+               gi.normal_geometric_integral_vortex, gi.tangential_geometric_integral_vortex]
+    with np.errstate(all='ignore'):
+        for i in range(X.size):
+            A, B, E = gi.compute_repeating_terms(panel_geometry.xC[i], panel_geometry.yC[i], X, Y, panel_geometry.phi)
+            for integral, kernel in zip(integrals, kernels):
+                integral[i] = kernel(panel_geometry.xC[i], panel_geometry.yC[i], X, Y, panel_geometry.phi[i],
+                                     panel_geometry.phi, panel_geometry.S, A, B, E)
+    integrals = [np.where(np.isfinite(integral), integral, 0.) for integral in integrals]
+    for integral, diagonal in zip(integrals, [np.pi, 0., 0., 0.]):
+        np.fill_diagonal(integral, diagonal)
+    return integrals
+
+
+@pytest.mark.parametrize('geometry', ['circle', 'airfoil'])
+def test_fused_panel_integrals(geometry, request):
+    panel_geometry = request.getfixturevalue(geometry)
+    I, J, K, L = gi.compute_panel_geometric_integrals(panel_geometry)
+    for integral, reference in zip((I, J, K, L), reference_integrals(panel_geometry)):
+        assert np.array_equal(integral, reference)
+
+    assert np.array_equal(gi.compute_panel_geometric_integrals_source(panel_geometry)[0], I)
+    assert np.array_equal(gi.compute_panel_geometric_integrals_vortex(panel_geometry)[1], L)
+    subset = gi.compute_panel_geometric_integrals(panel_geometry, True, False)
+    assert subset[1].shape == I.shape and subset[2].shape == (0, 0) and subset[3].shape == (0, 0)
+
+
+@pytest.mark.parametrize('geometry', ['circle', 'airfoil'])
+@pytest.mark.parametrize('threads', [1, None])
+def test_parallel_panel_integrals(geometry, threads, request):
+    panel_geometry = request.getfixturevalue(geometry)
+    serial = gi.compute_panel_geometric_integrals(panel_geometry)
+    parallel = gi.assemble_panel_geometric_integrals(panel_geometry, threads=threads)
+    assert all(np.array_equal(a, b) for a, b in zip(serial, parallel))
+    assert all(np.array_equal(a, b) for a, b in zip(serial, gi.compute_panel_geometric_integrals_parallel(
+        panel_geometry)))
+
+
+def test_invalid_thread_count(circle):
+    with pytest.raises(ValueError):
+        gi.assemble_panel_geometric_integrals(circle, threads=0)
+
+
+def reference_grid_velocity(panel_geometry, x, y, lam, gamma, u_inf, v_inf):
+    # The (ny, nx, N) influence tensors contracted with the strengths, as the grid velocity functions used to do
+    from src.source_panel_methods_funcs import point_in_polygon
+    Mxpj, Mypj = gi.compute_grid_geometric_integrals_source(panel_geometry, x, y)
+    Nxpj, Nypj = gi.compute_grid_geometric_integrals_vortex(panel_geometry, x, y)
+    u = (Mxpj @ lam - Nxpj @ gamma) / (2 * np.pi) + u_inf
+    v = (Mypj @ lam - Nypj @ gamma) / (2 * np.pi) + v_inf
+    X = panel_geometry.xC - panel_geometry.S / 2 * np.cos(panel_geometry.phi)
+    Y = panel_geometry.yC - panel_geometry.S / 2 * np.sin(panel_geometry.phi)
+    polygon = np.column_stack((np.append(X, X[0]), np.append(Y, Y[0])))
+    inside = np.array([[point_in_polygon(x_p, y_p, polygon) for x_p in x] for y_p in y])
+    u[inside], v[inside] = 0., 0.
+    return u, v
+
+
+@pytest.mark.parametrize('geometry', ['circle', 'airfoil'])
+def test_matrix_free_grid_velocity(geometry, request):
+    from src.source_panel_methods_funcs import compute_grid_velocity_source
+    from src.vortex_panel_methods_funcs import compute_grid_velocity_vortex
+    from src.source_vortex_panel_methods_funcs import compute_grid_velocity_source_vortex
+    panel_geometry = request.getfixturevalue(geometry)
+    x, y = np.linspace(-1.5, 2, 37), np.linspace(-1.25, 1.25, 29)
+    n = panel_geometry.S.size
+    lam, gamma = np.sin(np.arange(n)), np.cos(np.arange(n))
+    u_inf, v_inf = np.cos(6 * np.pi / 180), np.sin(6 * np.pi / 180)
+
+    cases = [(compute_grid_velocity_source(panel_geometry, x, y, lam, 1., 6.), (lam, np.zeros(n))),
+             (compute_grid_velocity_vortex(panel_geometry, x, y, gamma, 1., 6.), (np.zeros(n), gamma)),
+             (compute_grid_velocity_source_vortex(panel_geometry, x, y, lam, 0.3, 1., 6.), (lam, np.full(n, 0.3)))]
+    for (u, v), strengths in cases:
+        u_reference, v_reference = reference_grid_velocity(panel_geometry, x, y, *strengths, u_inf, v_inf)
+        assert u.shape == (y.size, x.size)
+        np.testing.assert_allclose(u, u_reference, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(v, v_reference, rtol=1e-12, atol=1e-12)
+
+
+def test_vortex_integrals_from_source_integrals(airfoil):
+    # The vortex integrals of the original kernels are the source integrals with their signs changed
+    I, J, K, L = reference_integrals(airfoil)
+    off_diagonal = ~np.eye(I.shape[0], dtype=bool)
+    assert np.array_equal(K, J)
+    assert np.array_equal(L[off_diagonal], -I[off_diagonal])
+
+    x, y = np.linspace(-0.5, 1.5, 23), np.linspace(-0.5, 0.5, 17)
+    X = airfoil.xC - airfoil.S / 2 * np.cos(airfoil.phi)
+    Y = airfoil.yC - airfoil.S / 2 * np.sin(airfoil.phi)
+    with np.errstate(all='ignore'):
+        for x_p, y_p in zip(*(grid.ravel() for grid in np.meshgrid(x, y))):
+            A, B, E = gi.compute_repeating_terms(x_p, y_p, X, Y, airfoil.phi)
+            M_xpj = gi.horizontal_geometric_integral_source(x_p, X, airfoil.phi, airfoil.S, A, B, E)
+            M_ypj = gi.vertical_geometric_integral_source(y_p, Y, airfoil.phi, airfoil.S, A, B, E)
+            N_xpj = gi.horizontal_geometric_integral_vortex(y_p, Y, airfoil.phi, airfoil.S, A, B, E)
+            N_ypj = gi.vertical_geometric_integral_vortex(x_p, X, airfoil.phi, airfoil.S, A, B, E)
+            assert np.array_equal(N_xpj, -M_ypj, equal_nan=True)
+            assert np.array_equal(N_ypj, M_xpj, equal_nan=True)
@@ -0,0 +1,78 @@
+import pathlib
+import numpy as np
+import pytest
+from src.data_collections import Geometry
+from src import grid_operator as go
+from src.grid_operator import GridOperator
+from src.panel_generator import PanelGenerator
+from src.source_panel_methods_funcs import evaluate_grid_velocity
+from src.source_vortex_panel_methods_funcs import run_source_vortex_panel_method
+
+COORDINATES = np.loadtxt(pathlib.Path(__file__).parents[1] / 'naca2412.txt', skiprows=1)
+
+
+def airfoil(AoA):
+    return PanelGenerator.compute_geometric_quantities(Geometry(COORDINATES[:, 0].copy(), COORDINATES[:, 1].copy(),
+                                                                AoA=AoA))
+
+
+@pytest.fixture
+def grid():
+    yield np.linspace(-0.5, 1.5, 41), np.linspace(-0.4, 0.4, 23)
+
+
+def test_grid_operator(grid):
+    panel_geometry = airfoil(6)
+    x, y = grid
+    n = panel_geometry.S.size
+    lam, gamma = np.sin(np.arange(n)), np.cos(np.arange(n))
+    operator = GridOperator(panel_geometry, x, y)
+    for strengths, operator_strengths in [((lam, np.empty(0)), (lam, None)), ((np.empty(0), gamma), (None, gamma)),
+                                          ((lam, np.full(n, 0.3)), (lam, 0.3))]:
+        u, v = operator.velocity(*operator_strengths, 1.5, 6.)
+        u_direct, v_direct = evaluate_grid_velocity(panel_geometry, x, y, *strengths, 1.5, 6.)
+        assert u.shape == (y.size, x.size)
+        np.testing.assert_allclose(u, u_direct, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(v, v_direct, rtol=0, atol=1e-12)
+
+    single = GridOperator(panel_geometry, x, y, dtype=np.float32)
+    assert single.matrix.dtype == np.complex64
+    np.testing.assert_allclose(single.velocity(lam, 0.3)[0], operator.velocity(lam, 0.3)[0], rtol=0, atol=1e-4)
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_grid_operator_save_load(grid, tmp_path, compressed):
+    operator = GridOperator(airfoil(0), *grid, dtype=np.float32)
+    operator.save(tmp_path / 'operator.npz', compressed)
+    loaded = GridOperator.load(tmp_path / 'operator.npz')
+    assert loaded.dtype == np.float32
+    assert np.array_equal(loaded.matrix, operator.matrix) and np.array_equal(loaded.inside, operator.inside)
+    lam = np.linspace(-1, 1, operator.number_of_panels)
+    assert all(np.array_equal(a, b) for a, b in zip(loaded.velocity(lam, 0.2, 1., 3.),
+                                                    operator.velocity(lam, 0.2, 1., 3.)))
+
+
+def test_grid_operator_angles_of_attack(grid):
+    x, y = grid
+    operator = GridOperator(airfoil(0), x, y)
+    for AoA in (-4., 2., 10.):
+        panel_geometry = airfoil(AoA)
+        direct = run_source_vortex_panel_method(panel_geometry, 1., AoA, x, y)
+        reused = run_source_vortex_panel_method(panel_geometry, 1., AoA, x, y, grid_operator=operator)
+        np.testing.assert_allclose(reused.V_horizontal, direct.V_horizontal, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(reused.V_vertical, direct.V_vertical, rtol=0, atol=1e-12)
+
+
+def test_grid_operator_blocks_and_budget(grid, monkeypatch):
+    x, y = grid
+    panel_geometry = airfoil(0)
+    operator = GridOperator(panel_geometry, x, y)
+    monkeypatch.setattr(go, 'OPERATOR_BLOCK_SIZE', 1)
+    blocked = GridOperator(panel_geometry, x, y, dtype=np.float32)
+    assert blocked.matrix.dtype == np.complex64
+    np.testing.assert_array_equal(blocked.matrix, operator.matrix.astype(np.complex64))
+
+    size = x.size * y.size * panel_geometry.S.size * 8
+    assert GridOperator(panel_geometry, x, y, dtype=np.float32, memory_budget=size).matrix.nbytes == size
+    with pytest.raises(ValueError, match='memory budget'):
+        GridOperator(panel_geometry, x, y, memory_budget=size)
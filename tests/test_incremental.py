@@ -0,0 +1,87 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import incremental as inc
+
+
+@pytest.fixture
+def default_data(request):
+    num_points = 101
+    x = np.linspace(-3, 3, num=num_points)
+    y = np.linspace(-3, 3, num=num_points)
+    X, Y = np.meshgrid(x, y)
+
+    yield x, y, X, Y, num_points
+
+
+@pytest.fixture
+def flows():
+    yield [ef.UniformFlow(horizontal_vel=1, vertical_vel=0.5),
+           ef.Vortex(x_pos=0, y_pos=0, circulation=4),
+           ef.Source(x_pos=1, y_pos=1, strength=2),
+           ef.Doublet(x_pos=-1, y_pos=0.5, kappa=3)]
+
+
+@pytest.mark.parametrize('policy', ['mask', 'nan', 'core'])
+def test_incremental_updates(default_data, flows, policy):
+    x, y, X, Y, num_points = default_data
+    flow = ff.FlowField(flows, backend='serial', singularity_policy=policy)
+    field = inc.IncrementalField(flow, X, Y, 'velocity')
+
+    def check():
+        U, V = field.evaluate()
+        U_ref, V_ref = flow.velocity(X, Y)
+        assert np.ma.isMaskedArray(U) == (policy == 'mask')
+        assert np.allclose(np.ma.filled(U, np.nan), np.ma.filled(U_ref, np.nan), atol=1e-9, equal_nan=True)
+        assert np.allclose(np.ma.filled(V, np.nan), np.ma.filled(V_ref, np.nan), atol=1e-9, equal_nan=True)
+
+    check()
+    assert field.update() == 0
+
+    # Moving the vortex off the grid point at the origin unmasks it
+    flows[1].x_pos = 0.03
+    assert field.update() == 1
+    check()
+    if policy != 'core':
+        assert np.isnan(np.ma.filled(field.evaluate()[0], np.nan)).sum() == 0
+
+    flows.append(ef.Vortex(x_pos=-2, y_pos=-2, circulation=-1))
+    del flows[2]
+    assert field.update() == 2
+    check()
+
+    # The same flow twice contributes twice
+    flows.append(flows[0])
+    check()
+
+
+def test_incremental_cache_budget(default_data, flows):
+    x, y, X, Y, num_points = default_data
+    flow = ff.FlowField(flows, backend='serial', singularity_policy='nan')
+    budget = 2 * (8 * 1 + 1) * X.size
+    field = inc.IncrementalField(flow, X, Y, 'stream_function', cache_budget=budget, refresh_interval=3)
+
+    psi = field.evaluate()
+    assert len(field._cache) == 2
+    assert np.allclose(psi, flow.stream_function(X, Y), equal_nan=True)
+
+    # Every third update rebuilds the total
+    for step, index in enumerate([1, 2, 3, 1, 2]):
+        flows[index].y_pos += 0.1 * (step + 1)
+        assert np.allclose(field.evaluate(), flow.stream_function(X, Y), atol=1e-9, equal_nan=True)
+        assert len(field._cache) <= 2
+
+
+@pytest.mark.parametrize('policy', ['mask', 'nan'])
+def test_incremental_float32(default_data, flows, policy):
+    x, y, X, Y, num_points = default_data
+    flow = ff.FlowField(flows, backend='serial', singularity_policy=policy, dtype=np.float32)
+    field = inc.IncrementalField(flow, X, Y, 'velocity')
+    U, V = field.evaluate()
+    assert U.dtype == V.dtype == field._total.dtype == np.float32
+    flows[1].x_pos = 0.03
+    U, V = field.evaluate()
+    assert U.dtype == np.float32
+    U_ref, V_ref = flow.velocity(X, Y)
+    assert np.allclose(np.ma.filled(U, np.nan), np.ma.filled(U_ref, np.nan), rtol=1e-5, atol=1e-5, equal_nan=True)
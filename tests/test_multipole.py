@@ -0,0 +1,107 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import backends as bk
+from src import flow_batch as fb
+from src import multipole as mpl
+
+
+@pytest.fixture
+def default_data(request):
+    num_points = 100
+    x = np.linspace(-30, 30, num=num_points)
+    y = np.linspace(-30, 30, num=num_points)
+    X, Y = np.meshgrid(x, y)
+
+    yield x, y, X, Y, num_points
+
+
+@pytest.fixture
+def vortex_cloud():
+    rng = np.random.default_rng(0)
+    flows = [ef.UniformFlow(horizontal_vel=1, vertical_vel=0)]
+    flow_types = [ef.Source, ef.Vortex, ef.Doublet]
+    strength_fields = ['strength', 'circulation', 'kappa']
+    for i in range(3000):
+        t = rng.integers(3)
+        flows.append(flow_types[t](x_pos=rng.uniform(-20, 20), y_pos=rng.uniform(-20, 20),
+                                   **{strength_fields[t]: rng.uniform(-10, 10)}))
+    yield flows
+
+
+def test_expansion_order():
+    assert mpl.expansion_order(1e-6, 0.5) < mpl.expansion_order(1e-10, 0.5)
+    assert mpl.expansion_order(1e-6, 0.3) < mpl.expansion_order(1e-6, 0.5)
+    with pytest.raises(ValueError):
+        mpl.expansion_order(1e-6, 1.5)
+
+
+def test_quadtree_partitions_points():
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(-1, 1, 1000), rng.uniform(-1, 1, 1000)
+    order, centre_x, centre_y, start, end, child_start, child_count = mpl.build_quadtree(x, y, leaf_size=16)
+
+    assert np.array_equal(np.sort(order), np.arange(1000))
+    leaves = child_count == 0
+    assert np.sum(end[leaves] - start[leaves]) == 1000
+    assert np.all(end[leaves] - start[leaves] <= 16)
+
+
+@pytest.mark.parametrize('tolerance', [1e-4, 1e-8, 1e-12])
+def test_treecode_matches_direct_summation(default_data, vortex_cloud, tolerance):
+    x, y, X, Y, num_points = default_data
+    batch = fb.FlowBatch.from_flows(vortex_cloud)
+    U_ref, V_ref = batch.velocity(X, Y)
+    U, V = mpl.Treecode(batch, tolerance=tolerance).velocity(X, Y)
+
+    error = np.hypot(U - U_ref, V - V_ref)
+    magnitude = np.hypot(U_ref, V_ref)
+    assert np.sqrt(np.sum(error ** 2) / np.sum(magnitude ** 2)) < tolerance
+
+
+def test_multipole_backend(default_data, vortex_cloud):
+    x, y, X, Y, num_points = default_data
+    flows = vortex_cloud + [ef.Vortex(x_pos=x[10], y_pos=y[20], circulation=1)]
+    U_ref, V_ref = ff.FlowField(flows, backend='fused').velocity(X, Y)
+    with ff.FlowField(flows, backend='multipole') as flow:
+        U, V = flow.velocity(X, Y)
+        psi = flow.stream_function(X, Y)
+
+    assert np.isnan(U[20, 10])
+    assert np.allclose(U, U_ref, rtol=1e-4, atol=1e-4, equal_nan=True)
+    assert np.allclose(V, V_ref, rtol=1e-4, atol=1e-4, equal_nan=True)
+    assert psi.shape == X.shape
+
+
+def test_multipole_backend_reuses_treecode(default_data, vortex_cloud):
+    x, y, X, Y, num_points = default_data
+    backend = bk.MultipoleBackend()
+    flows = list(vortex_cloud)
+    with ff.FlowField(flows, backend=backend) as flow:
+        U, V = flow.velocity(X, Y)
+        treecode = backend._treecode
+        U_tiled, V_tiled = flow.evaluate_tiled(x, y, 'velocity', memory_budget=X.size)
+        assert backend._treecode is treecode
+        assert np.allclose(U_tiled, U, equal_nan=True)
+
+        flows[-1].x_pos += 0.5
+        U_changed, V_changed = flow.velocity(X, Y)
+        assert backend._treecode is not treecode
+        U_ref, V_ref = ff.FlowField(flows, backend='fused').velocity(X, Y)
+        assert np.allclose(U_changed, U_ref, rtol=1e-4, atol=1e-4, equal_nan=True)
+
+
+@pytest.mark.parametrize('policy', ['mask', 'nan', 'clamp', 'core'])
+def test_multipole_singularity_policies(policy):
+    # Points inside the mask tolerance of a lone vortex, whose node has no radius
+    x = np.array([1e-4, 0, -5e-4, 2e-3, 1.])
+    y = np.array([0, -2e-4, 5e-4, 0, 1.])
+    flows = [ef.Vortex(x_pos=0, y_pos=0, circulation=5, mask_tol=1e-6)]
+    U_ref, V_ref = ff.FlowField(flows, backend='serial', singularity_policy=policy).velocity(x, y)
+    with ff.FlowField(flows, backend='multipole', singularity_policy=policy) as flow:
+        U, V = flow.velocity(x, y)
+    # Far from the vortex the 'core' offset is left out of the expansion, within the tolerance of the treecode
+    rtol = 1e-6 if policy == 'core' else 1e-12
+    assert np.allclose(U, np.ma.filled(U_ref, np.nan), rtol=rtol, atol=0, equal_nan=True)
+    assert np.allclose(V, np.ma.filled(V_ref, np.nan), rtol=rtol, atol=0, equal_nan=True)
@@ -0,0 +1,59 @@
+import pathlib
+import numpy as np
+import pytest
+from src import panel_treecode as pt
+from src.data_collections import Geometry
+from src.panel_generator import PanelGenerator
+from src.source_panel_methods_funcs import (compute_grid_velocity_error, compute_grid_velocity_source,
+                                            evaluate_grid_velocity, point_in_polygon)
+from src.source_vortex_panel_methods_funcs import compute_grid_velocity_source_vortex
+
+
+@pytest.fixture
+def airfoil():
+    coordinates = np.loadtxt(pathlib.Path(__file__).parents[1] / 'naca2412.txt', skiprows=1)
+    yield PanelGenerator.compute_geometric_quantities(Geometry(coordinates[:, 0].copy(), coordinates[:, 1].copy(),
+                                                               AoA=6))
+
+
+def test_panel_tree():
+    start, end, child_start, child_count = pt.build_panel_tree(37, 8)
+    leaves = child_count == 0
+    assert np.all(end[leaves] - start[leaves] <= 8)
+    assert np.array_equal(np.sort(np.concatenate([np.arange(s, e) for s, e in zip(start[leaves], end[leaves])])),
+                          np.arange(37))
+    for node in np.flatnonzero(~leaves):
+        children = np.arange(child_start[node], child_start[node] + child_count[node])
+        assert start[children[0]] == start[node] and end[children[-1]] == end[node]
+
+
+def test_grid_inside_polygon(airfoil):
+    treecode = pt.PanelTreecode(airfoil, np.ones(airfoil.S.size), np.empty(0))
+    x, y = np.linspace(-0.1, 1.1, 61), np.linspace(-0.1, 0.1, 41)
+    inside = pt.grid_inside_polygon(x, y, treecode.polygon)
+    assert np.array_equal(inside, [[point_in_polygon(x_p, y_p, treecode.polygon) for x_p in x] for y_p in y])
+    assert inside.any()
+
+
+@pytest.mark.parametrize('tolerance', [1e-3, 1e-6, 1e-9])
+def test_treecode_error(airfoil, tolerance):
+    n = airfoil.S.size
+    x, y = np.linspace(-0.5, 1.5, 81), np.linspace(-0.6, 0.6, 49)
+    report = compute_grid_velocity_error(airfoil, x, y, np.sin(np.arange(n)), np.full(n, 0.3), 1., 6., tolerance)
+    assert report.relative_error < tolerance
+    assert report.rms_error <= report.max_error
+
+
+def test_treecode_grid_velocity(airfoil):
+    n = airfoil.S.size
+    lam = np.cos(np.arange(n))
+    x, y = np.linspace(-1, 2, 40), np.linspace(-1, 1, 30)
+    for direct, treecode in [(compute_grid_velocity_source(airfoil, x, y, lam, 1., 6.),
+                              compute_grid_velocity_source(airfoil, x, y, lam, 1., 6., 'treecode', 1e-8)),
+                             (compute_grid_velocity_source_vortex(airfoil, x, y, lam, 0.4, 1., 6.),
+                              compute_grid_velocity_source_vortex(airfoil, x, y, lam, 0.4, 1., 6., 'treecode', 1e-8))]:
+        assert treecode[0].shape == (y.size, x.size)
+        np.testing.assert_allclose(treecode, direct, rtol=0, atol=1e-8)
+
+    with pytest.raises(ValueError):
+        evaluate_grid_velocity(airfoil, x, y, lam, np.empty(0), method='fmm')
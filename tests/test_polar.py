@@ -0,0 +1,58 @@
+import pathlib
+import numpy as np
+from src.data_collections import Geometry
+from src.geometric_integrals import compute_panel_geometric_integrals
+from src.panel_generator import PanelGenerator
+from src.source_panel_methods_funcs import compute_source_strengths, compute_source_strengths_polar
+from src.source_vortex_panel_methods_funcs import compute_source_vortex_strengths, \
+    compute_source_vortex_strengths_polar
+from src.vortex_panel_methods_funcs import compute_vortex_strengths, compute_vortex_strengths_polar
+
+COORDINATES = np.loadtxt(pathlib.Path(__file__).parents[1] / 'naca2412.txt', skiprows=1)
+AOAS = np.array([-10., -2.5, 0., 4., 12.])
+
+
+def airfoil(AoA):
+    return PanelGenerator.compute_geometric_quantities(Geometry(COORDINATES[:, 0].copy(), COORDINATES[:, 1].copy(),
+                                                                AoA=AoA))
+
+
+def circle(AoA, num_panels=24):
+    theta = np.linspace(0, 2 * np.pi, num=num_panels + 1)
+    return PanelGenerator.compute_geometric_quantities(Geometry(np.cos(theta), np.sin(theta), AoA=AoA))
+
+
+def test_source_strengths_polar():
+    I, _, _, _ = compute_panel_geometric_integrals(circle(0), vortex=False)
+    np.fill_diagonal(I, np.pi)
+    lam = compute_source_strengths_polar(circle(3), 1.5, AOAS, I)
+    assert lam.shape == (AOAS.size, I.shape[0])
+    for AoA, polar_lam in zip(AOAS, lam):
+        np.testing.assert_allclose(polar_lam, compute_source_strengths(circle(AoA), 1.5, I), rtol=0, atol=1e-12)
+
+
+def test_vortex_strengths_polar():
+    _, _, K, _ = compute_panel_geometric_integrals(airfoil(0), source=False)
+    gamma = compute_vortex_strengths_polar(airfoil(0), 1.5, AOAS, K)
+    assert gamma.shape == (AOAS.size, K.shape[0])
+    for AoA, polar_gamma in zip(AOAS, gamma):
+        np.testing.assert_allclose(polar_gamma, compute_vortex_strengths(airfoil(AoA), 1.5, K), rtol=1e-9, atol=1e-9)
+
+
+def test_source_vortex_strengths_polar():
+    I, J, K, L = compute_panel_geometric_integrals(airfoil(0))
+    lam, gamma = compute_source_vortex_strengths_polar(airfoil(0), 1.5, AOAS, I.copy(), J.copy(), K.copy(), L.copy())
+    assert lam.shape == (AOAS.size, I.shape[0]) and gamma.shape == (AOAS.size,)
+    for AoA, polar_lam, polar_gamma in zip(AOAS, lam, gamma):
+        single_lam, single_gamma = compute_source_vortex_strengths(airfoil(AoA), 1.5, I.copy(), J.copy(), K.copy(),
+                                                                   L.copy())
+        np.testing.assert_allclose(polar_lam, single_lam, rtol=0, atol=1e-10)
+        np.testing.assert_allclose(polar_gamma, single_gamma, rtol=1e-10)
+
+
+def test_polar_scalar_angle():
+    I, J, K, L = compute_panel_geometric_integrals(airfoil(5))
+    lam, gamma = compute_source_vortex_strengths_polar(airfoil(5), 1., 5., I.copy(), J.copy(), K.copy(), L.copy())
+    single_lam, single_gamma = compute_source_vortex_strengths(airfoil(5), 1., I, J, K, L)
+    assert lam.shape == (1, single_lam.size)
+    np.testing.assert_allclose(gamma[0], single_gamma, rtol=1e-10)
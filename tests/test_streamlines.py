@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import flow_field as ff
+from src import streamlines as sl
+
+BOUNDS = (-3, 3, -3, 3)
+
+
+def test_uniform_flow_streamlines():
+    u1 = ef.UniformFlow(horizontal_vel=2, vertical_vel=0)
+    lines = sl.trace_streamlines(u1.velocity, [0., 1.], [0., -1.], BOUNDS)
+    for line, y0 in zip(lines, [0., -1.]):
+        assert np.allclose(line[:, 1], y0)
+        assert np.all(np.diff(line[:, 0]) > 0)
+        assert line[0, 0] <= BOUNDS[0] + 0.2 and line[-1, 0] >= BOUNDS[1]
+
+
+def test_vortex_streamlines_close():
+    v1 = ef.Vortex(x_pos=0, y_pos=0, circulation=5)
+    radii = np.array([0.5, 1., 2.])
+    lines = sl.trace_streamlines(v1.velocity, radii, np.zeros(3), BOUNDS, direction='forward', tolerance=1e-6)
+    for line, radius in zip(lines, radii):
+        assert np.allclose(np.hypot(line[:, 0], line[:, 1]), radius, rtol=1e-4)
+        # Clockwise for a positive circulation, stopped after one turn
+        assert line[1, 1] < 0
+        assert np.hypot(*(line[-1] - line[0])) < 2 * np.pi * radius / 10
+
+
+def test_streamlines_follow_stream_function():
+    flow = ff.FlowField([ef.Source(x_pos=-1, y_pos=0, strength=10), ef.Source(x_pos=1, y_pos=0, strength=-10),
+                         ef.UniformFlow(horizontal_vel=1, vertical_vel=0)], backend='serial')
+    seed_y = np.linspace(0.3, 2.5, 8)
+    lines = flow.streamlines(np.linspace(*BOUNDS[:2]), np.linspace(*BOUNDS[2:]), seeds=(np.full(8, -2.9), seed_y))
+    for line in lines:
+        psi = np.asarray(flow.stream_function(line[:, 0], line[:, 1]))
+        assert np.ptp(psi) < 1e-3
+
+
+def test_pathlines_are_parametrized_by_time():
+    u1 = ef.UniformFlow(horizontal_vel=2, vertical_vel=1)
+    line = sl.trace(u1.velocity, [-2.], [-2.], BOUNDS, parametrization='time', max_step=0.1, max_length=1.)[0]
+    assert np.allclose(line[:, 1] - line[0, 1], 0.5 * (line[:, 0] - line[0, 0]))
+    with pytest.raises(ValueError):
+        sl.trace(u1.velocity, [0.], [0.], BOUNDS, parametrization='distance')
+    with pytest.raises(ValueError):
+        sl.trace_streamlines(u1.velocity, [0.], [0.], BOUNDS, direction='sideways')
+
+
+def test_flow_field_streamlines():
+    flow = ff.FlowField([ef.UniformFlow(horizontal_vel=10, vertical_vel=0), ef.Vortex(x_pos=0, y_pos=0, circulation=40),
+                         ef.Doublet(x_pos=0, y_pos=0, kappa=2 * np.pi * 10)], backend='serial')
+    x = np.linspace(*BOUNDS[:2], num=100)
+    lines = flow.streamlines(x, x, density=1)
+    assert 5 < len(lines) < 100
+    assert all(line.ndim == 2 and line.shape[1] == 2 and np.all(np.isfinite(line)) for line in lines)
+    assert flow.plot_streamlines(x, x) is not None
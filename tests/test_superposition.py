@@ -112,3 +112,118 @@ def test_rankine_oval(default_data):
 
     # Check that the vertical velocity at the top of the body is zero
     assert velocity_field[1][loc_half_body_width, zero_x] == pytest.approx(0, abs=1e-2)
+
+
+def test_tiled_evaluation(tmp_path):
+    x = np.linspace(-3, 3, num=200)
+    y = np.linspace(-2, 2, num=150)
+    X, Y = np.meshgrid(x, y)
+    v1 = ef.Source(x_pos=-1.5, y_pos=0, strength=7)
+    v2 = ef.Source(x_pos=1.5, y_pos=0, strength=-7)
+    u1 = ef.UniformFlow(horizontal_vel=1, vertical_vel=0)
+    flow = ff.FlowField([v1, v2, u1], backend='serial', singularity_policy='nan')
+    U_ref, V_ref = flow.velocity(X, Y)
+
+    memory_budget = 2 ** 20
+    tiles = list(flow.iter_tiles(x, y, 'velocity', memory_budget=memory_budget))
+    assert len(tiles) > 1
+    assert tiles[0].rows == slice(0, tiles[0].values[0].shape[0])
+    assert np.allclose(np.vstack([tile.values[0] for tile in tiles]), U_ref)
+
+    out = np.empty((2, y.size, x.size))
+    result = flow.evaluate_tiled(x, y, 'velocity', memory_budget=memory_budget, out=out)
+    assert result is out
+    assert np.allclose(out[1], V_ref)
+
+    result = flow.evaluate_tiled(x, y, 'stream_function', memory_budget=memory_budget,
+                                 filename=tmp_path / 'psi.npy')
+    assert isinstance(result, np.memmap)
+    assert np.allclose(np.load(tmp_path / 'psi.npy')[0], flow.stream_function(X, Y))
+
+    with pytest.raises(ValueError):
+        flow.evaluate_tiled(x, y, 'vorticity')
+
+
+def test_rows_per_tile():
+    assert ff.rows_per_tile(1000, 2, 3, 2 ** 30) > ff.rows_per_tile(1000, 2, 30, 2 ** 30)
+    assert ff.rows_per_tile(20000, 2, 3, 2 ** 30) * 20000 * 8 * 18 <= 2 ** 30
+    assert ff.rows_per_tile(20000, 2, 3, 1) == 1
+
+
+@pytest.mark.parametrize('backend', ['serial', 'fused', 'multipole'])
+def test_evaluate_points(backend):
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-3, 3, size=(5000, 2))
+    flows = [ef.Source(x_pos=-1.5, y_pos=0, strength=7), ef.Vortex(x_pos=0.5, y_pos=1, circulation=3),
+             ef.UniformFlow(horizontal_vel=1, vertical_vel=0)]
+    flow = ff.FlowField(flows, backend=backend, singularity_policy='nan')
+    reference = ff.FlowField(flows, backend='serial', singularity_policy='nan')
+
+    velocity = flow.evaluate_points(points, 'velocity', memory_budget=2 ** 14)
+    assert velocity.shape == (2, len(points))
+    assert np.allclose(velocity, reference.velocity(points[:, 0], points[:, 1]), rtol=1e-5, atol=1e-5)
+    state = flow.evaluate_points(points, 'flow_state')
+    assert np.allclose(state[1], reference.stream_function(points[:, 0], points[:, 1]), rtol=1e-5, atol=1e-5)
+
+    out = np.empty((1, len(points)))
+    assert flow.evaluate_points(points, 'velocity_potential', out=out) is out
+    with pytest.raises(ValueError):
+        flow.evaluate_points(points.T, 'velocity')
+
+
+def test_stagnation_points():
+    x = np.linspace(-3, 3, num=100)
+    velocity, radius = 10, 1
+    kappa = 2 * np.pi * velocity * radius ** 2
+
+    # A lifting cylinder has its stagnation points at sin(theta) = -circulation / (4 pi U R), clockwise circulation
+    circulation = 2 * np.pi * velocity * radius
+    flow = ff.FlowField([ef.UniformFlow(horizontal_vel=velocity, vertical_vel=0),
+                         ef.Doublet(x_pos=0, y_pos=0, kappa=kappa),
+                         ef.Vortex(x_pos=0, y_pos=0, circulation=circulation)])
+    points = flow.stagnation_points(x, x)
+    assert np.allclose(points, [[-np.sqrt(3) / 2, -0.5], [np.sqrt(3) / 2, -0.5]], atol=1e-8)
+
+    # Rankine oval
+    strength, location = 7, 1.5
+    oval = ff.FlowField([ef.Source(x_pos=-location, y_pos=0, strength=strength),
+                         ef.Source(x_pos=location, y_pos=0, strength=-strength),
+                         ef.UniformFlow(horizontal_vel=1, vertical_vel=0)])
+    half_body_length = np.sqrt(location ** 2 + strength * location / np.pi)
+    assert np.allclose(oval.stagnation_points(x, x), [[-half_body_length, 0], [half_body_length, 0]], atol=1e-8)
+
+
+def test_dividing_streamlines():
+    x = np.linspace(-3, 3, num=100)
+    flow = ff.FlowField([ef.Source(x_pos=-1.5, y_pos=0, strength=7), ef.Source(x_pos=1.5, y_pos=0, strength=-7),
+                         ef.UniformFlow(horizontal_vel=1, vertical_vel=0)])
+    points = flow.stagnation_points(x, x)
+    lines = flow.dividing_streamlines(x, x, points, tolerance=1e-6)
+    assert len(lines) == 4 * len(points)
+    for i, line in enumerate(lines):
+        assert np.array_equal(line[0], points[i // 4])
+        # The separatrices on the axis run into the sources, where the stream function jumps
+        far = np.hypot(np.abs(line[:, 0]) - 1.5, line[:, 1]) > 0.2
+        psi = np.asarray(flow.stream_function(line[far, 0], line[far, 1]))
+        assert np.allclose(psi, 0, atol=1e-3)
+
+
+@pytest.mark.parametrize('backend', ['serial', 'fused', 'shared_memory'])
+def test_flow_field_velocity_gradient(backend):
+    x = np.linspace(-3, 3, num=50)
+    X, Y = np.meshgrid(x, x)
+    flows = [ef.Source(x_pos=-1.5, y_pos=0, strength=7), ef.Vortex(x_pos=0.5, y_pos=1, circulation=3),
+             ef.Doublet(x_pos=0, y_pos=-1, kappa=2), ef.UniformFlow(horizontal_vel=1, vertical_vel=0)]
+    with ff.FlowField(flows, backend=backend, singularity_policy='nan') as flow:
+        gradient = flow.velocity_gradient(X, Y)
+        u, v = flow.velocity_and_gradient(X, Y)[:2]
+        points = flow.evaluate_points(np.column_stack((X.ravel(), Y.ravel())), 'velocity_gradient')
+
+    reference = ff.FlowField(flows, backend='serial', singularity_policy='nan')
+    U, V = reference.velocity(X, Y)
+    assert np.allclose(u, U) and np.allclose(v, V)
+    assert np.allclose(gradient.du_dy, gradient.dv_dx) and np.allclose(gradient.dv_dy, -gradient.du_dx)
+    assert np.allclose(points[0], gradient.du_dx.ravel())
+    h = 1e-6
+    U_x = (reference.velocity(X + h, Y)[0] - reference.velocity(X - h, Y)[0]) / (2 * h)
+    assert np.allclose(gradient.du_dx, U_x, rtol=1e-5, atol=1e-5)
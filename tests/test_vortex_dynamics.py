@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+from src import elementary_flows as ef
+from src import vortex_dynamics as vd
+
+
+@pytest.mark.parametrize('method', ['rk4', 'rk45'])
+def test_corotating_pair(method):
+    # Two equal vortices a distance d apart turn about their centre at Gamma / (pi d ** 2), clockwise for Gamma > 0
+    circulation, d = 2 * np.pi, 1.
+    flows = [ef.Vortex(x_pos=-d / 2, y_pos=0, circulation=circulation),
+             ef.Vortex(x_pos=d / 2, y_pos=0, circulation=circulation)]
+    dynamics = vd.VortexDynamics(flows)
+    times = np.linspace(0, 1, 5)
+    trajectory = dynamics.integrate(times, dt=0.01, method=method)
+
+    angle = -circulation / (np.pi * d ** 2) * times
+    assert np.allclose(trajectory.x[:, 1], d / 2 * np.cos(angle), atol=1e-6)
+    assert np.allclose(trajectory.y[:, 1], d / 2 * np.sin(angle), atol=1e-6)
+    assert np.allclose(trajectory.x[:, 0], -trajectory.x[:, 1])
+    assert flows[1].x_pos == trajectory.x[-1, 1]
+
+
+def test_translating_pair_in_uniform_flow():
+    # A counter-rotating pair moves at Gamma / (2 pi d) on top of the free stream
+    circulation, d, velocity = 4., 2., 0.5
+    flows = [ef.UniformFlow(horizontal_vel=velocity, vertical_vel=0),
+             ef.Vortex(x_pos=0, y_pos=d / 2, circulation=circulation),
+             ef.Vortex(x_pos=0, y_pos=-d / 2, circulation=-circulation)]
+    trajectory = vd.VortexDynamics(flows).integrate([0, 2], dt=0.1, method='rk45')
+    expected = (velocity - circulation / (2 * np.pi * d)) * 2
+    assert np.allclose(trajectory.x[-1], expected)
+    assert np.allclose(trajectory.y[-1], [d / 2, -d / 2])
+
+
+def test_treecode_kernel_and_memmap(tmp_path):
+    rng = np.random.default_rng(0)
+    flows = [ef.Vortex(x_pos=x, y_pos=y, circulation=g, mask_tol=1e-4)
+             for x, y, g in rng.uniform(-1, 1, size=(300, 3))]
+    filename = str(tmp_path / 'trajectory.npy')
+    times = np.linspace(0, 0.05, 6)
+
+    # With 'clamp' the regularisation only acts on the pairs the treecode sums directly
+    direct = vd.VortexDynamics([ef.Vortex(**vars(flow)) for flow in flows], singularity_policy='clamp')
+    direct = direct.integrate(times, dt=0.005)
+    tree = vd.VortexDynamics(flows, kernel='treecode', singularity_policy='clamp', tolerance=1e-10)
+    tree = tree.integrate(times, dt=0.005, filename=filename)
+    assert np.allclose(tree.x, direct.x, atol=1e-8)
+    assert np.allclose(tree.y, direct.y, atol=1e-8)
+
+    saved = np.load(filename, mmap_mode='r')
+    assert saved.shape == (times.size, 2, len(flows))
+    assert np.array_equal(saved[:, 0], tree.x)
+
+    # The centre of circulation is an invariant of the motion
+    circulation = np.array([flow.circulation for flow in flows])
+    centre = (circulation * tree.x).sum(axis=1) / circulation.sum()
+    assert np.allclose(centre, centre[0], atol=1e-8)
+
+
+def test_invalid_arguments():
+    flows = [ef.Vortex(x_pos=0, y_pos=0, circulation=1)]
+    with pytest.raises(ValueError):
+        vd.VortexDynamics(flows, singularity_policy='nan')
+    with pytest.raises(ValueError):
+        vd.VortexDynamics(flows, kernel='fmm')
+    with pytest.raises(ValueError):
+        vd.VortexDynamics(flows).integrate([0, 1], dt=0.1, method='euler')